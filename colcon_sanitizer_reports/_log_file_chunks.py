@@ -0,0 +1,315 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parallel parsing of a single log file in chunks, with results identical to a sequential parse.
+
+A log file is split into byte ranges on line boundaries, and each chunk is parsed by a worker
+process with a fresh parser that records what it would have added to the report, and at which line.
+The chunk results are then stitched together in order by the parser that owns the report, see
+SanitizerLogParser.parse_log_file().
+
+A chunk parser can not know about sections that were opened in an earlier chunk and are still open
+at its first line. If the owning parser has open sections at the start of a chunk, it parses the
+chunk itself until it reaches a line before which neither it nor the chunk parser had any open
+sections. From that line on, both parsers are in the same state, so the chunk parser's results are
+used for the rest of the chunk. Sanitizer sections are short, so this is usually within a few lines
+of the chunk boundary.
+
+So that the results of a chunk do not grow with its size, the chunk parser records what it added at
+each line only for the first lines of the chunk, where stitching may need to start. After those, it
+aggregates what it added per key. Only as many chunks as there are jobs are parsed ahead of the
+chunk being stitched.
+"""
+
+from bisect import bisect_right
+from collections import OrderedDict
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from colcon_sanitizer_reports._sanitizer_section_part_stack_trace import (
+    SanitizerSectionPartStackTrace
+)
+from colcon_sanitizer_reports.sanitizer_log_parser import (
+    _OpenSection, SanitizerLogParser, SanitizerLogParserOutputPrimaryKey,
+    SanitizerSuppressionHitKey
+)
+from colcon_sanitizer_reports.suppressions import SanitizerSuppressions
+
+# More chunks than jobs keeps workers busy when some chunks take longer than others.
+_CHUNKS_PER_JOB = 4
+
+# The number of lines at the beginning of a chunk for which the chunk parser records what it added
+# line by line. If stitching a chunk needs to start later than that, the owning parser parses the
+# whole chunk itself.
+_STITCH_LINE_COUNT = 4 * 1024
+
+AggregatedOutcome = NamedTuple(
+    'AggregatedOutcome',
+    [
+        ('method_name', str),
+        ('count', int),
+        ('first_args', Tuple[Any, ...]),
+        ('last_args', Tuple[Any, ...]),
+        ('first_line_index', int),
+    ]
+)
+
+AggregatedOutcome.__doc__ = (
+    """What the chunk parser added to the report for a single key, in aggregate.
+
+    After initialization, AggregatedOutcome includes the following data members.
+
+    method_name:
+        Name of the SanitizerLogParser method that adds to the report.
+
+    count:
+        Number of times the method was called for the key.
+
+    first_args:
+        Arguments of the first call.
+
+    last_args:
+        Arguments of the last call.
+
+    first_line_index:
+        Index of the line of the chunk at which the method was first called for the key.
+    """
+)
+
+ChunkResult = NamedTuple(
+    'ChunkResult',
+    [
+        # What the chunk parser added to the report before line aggregate_line_index, as (line
+        # index, method name, arguments).
+        ('outcomes', List[Tuple[int, str, Tuple[Any, ...]]]),
+        # What the chunk parser added to the report from line aggregate_line_index on, per key in
+        # the order of their first line index.
+        ('aggregated_outcomes', List[AggregatedOutcome]),
+        ('aggregate_line_index', int),
+        # Sorted, non-overlapping [begin, end) ranges of line indexes up to aggregate_line_index
+        # before which the chunk parser had no open sections.
+        ('sync_ranges', List[Tuple[int, int]]),
+        # Counts of the lines and characters of the chunk.
+        ('line_count', int),
+        ('character_count', int),
+        # Sections still open after the last line of the chunk.
+        ('open_sections_by_prefix', Dict[str, 'OrderedDict[str, _OpenSection]']),
+    ]
+)
+
+ChunkResult.__doc__ = (
+    """What a chunk parser found in a chunk, for SanitizerLogParser to stitch into its report."""
+)
+
+
+class _RecordingSanitizerLogParser(SanitizerLogParser):
+    """Records report additions with their line index instead of adding them to the report."""
+
+    def __init__(self, *, suppressions: Optional[SanitizerSuppressions]) -> None:
+        super().__init__(suppressions=suppressions)
+        self.line_index = 0
+        self.outcomes = []  # type: List[Tuple[int, str, Tuple[Any, ...]]]
+        self.aggregated_outcome_by_key = OrderedDict() \
+            # type: OrderedDict[Tuple[str, Any], AggregatedOutcome]
+
+    def parse_chunk(self, lines: Iterable[str]) -> ChunkResult:
+        sync_ranges = []  # type: List[Tuple[int, int]]
+        for line_index, line in enumerate(lines):
+            # Stitching starts at aggregate_line_index at the latest, so later lines need no range.
+            if line_index <= _STITCH_LINE_COUNT and not self._open_sections_by_prefix:
+                if sync_ranges and sync_ranges[-1][1] == line_index:
+                    sync_ranges[-1] = (sync_ranges[-1][0], line_index + 1)
+                else:
+                    sync_ranges.append((line_index, line_index + 1))
+
+            self.line_index = line_index
+            self.parse_line(line)
+
+        return ChunkResult(
+            outcomes=self.outcomes,
+            aggregated_outcomes=list(self.aggregated_outcome_by_key.values()),
+            aggregate_line_index=_STITCH_LINE_COUNT,
+            sync_ranges=sync_ranges,
+            line_count=self._parsed_line_count,
+            character_count=self._parsed_character_count,
+            open_sections_by_prefix=self._open_sections_by_prefix,
+        )
+
+    def _add_output(
+            self,
+            output_primary_key: SanitizerLogParserOutputPrimaryKey,
+            stack_trace: SanitizerSectionPartStackTrace,
+            count: int = 1
+    ) -> None:
+        self._add_outcome('_add_output', output_primary_key, (output_primary_key, stack_trace))
+
+    def _add_runtime_error(
+            self, output_primary_key: SanitizerLogParserOutputPrimaryKey, line: str, count: int = 1
+    ) -> None:
+        self._add_outcome('_add_runtime_error', output_primary_key, (output_primary_key, line))
+
+    def _add_suppression_hit(
+            self, suppression_hit_key: SanitizerSuppressionHitKey, count: int = 1
+    ) -> None:
+        self._add_outcome('_add_suppression_hit', suppression_hit_key, (suppression_hit_key,))
+
+    def _add_outcome(self, method_name: str, key: Any, args: Tuple[Any, ...]) -> None:
+        if self.line_index < _STITCH_LINE_COUNT:
+            self.outcomes.append((self.line_index, method_name, args))
+            return
+
+        aggregated_outcome = self.aggregated_outcome_by_key.get((method_name, key))
+        if aggregated_outcome is None:
+            self.aggregated_outcome_by_key[(method_name, key)] = AggregatedOutcome(
+                method_name=method_name,
+                count=1,
+                first_args=args,
+                last_args=args,
+                first_line_index=self.line_index,
+            )
+        else:
+            self.aggregated_outcome_by_key[(method_name, key)] = aggregated_outcome._replace(
+                count=aggregated_outcome.count + 1, last_args=args
+            )
+
+
+def read_lines(path: str, begin: int, end: int) -> Iterator[str]:
+    """Return the lines of a log file that begin in the byte range [begin, end)."""
+    with open(path, 'rb') as log_f_in:
+        log_f_in.seek(begin)
+        position = begin
+        while position < end:
+            line = log_f_in.readline()
+            if not line:
+                break
+
+            position += len(line)
+            yield line.decode('utf-8', errors='replace')
+
+
+def get_chunk_ranges(path: str, jobs: int, min_chunk_size: int) -> List[Tuple[int, int]]:
+    """Split a log file into byte ranges of at least min_chunk_size bytes on line boundaries."""
+    size = os.path.getsize(path)
+    chunk_count = max(1, min(jobs * _CHUNKS_PER_JOB, size // max(1, min_chunk_size)))
+
+    # Move each boundary forward to the beginning of the next line.
+    boundaries = [0]
+    with open(path, 'rb') as log_f_in:
+        for chunk_i in range(1, chunk_count):
+            log_f_in.seek(max(size * chunk_i // chunk_count - 1, boundaries[-1]))
+            log_f_in.readline()
+            boundary = log_f_in.tell()
+            if boundaries[-1] < boundary < size:
+                boundaries.append(boundary)
+    boundaries.append(size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def is_synchronized(result: ChunkResult, line_index: int) -> bool:
+    """Return True if the chunk parser had no open sections before line line_index of its chunk."""
+    # Find the last range that begins at or before line_index.
+    range_i = bisect_right(result.sync_ranges, (line_index, float('inf'))) - 1
+    return range_i >= 0 and line_index < result.sync_ranges[range_i][1]
+
+
+def _parse_chunk(
+        args: Tuple[str, int, int, str, Optional[SanitizerSuppressions]]
+) -> ChunkResult:
+    path, begin, end, package, suppressions = args
+
+    parser = _RecordingSanitizerLogParser(suppressions=suppressions)
+    parser.set_package(package)
+    return parser.parse_chunk(read_lines(path, begin, end))
+
+
+def _send_chunk_result(
+        connection: Connection, args: Tuple[str, int, int, str, Optional[SanitizerSuppressions]]
+) -> None:
+    connection.send(_parse_chunk(args))
+    connection.close()
+
+
+class ChunkParser:
+    """Parses the chunks of a log file in worker processes, in the background.
+
+    Results are expected to be gotten in chunk order. Each chunk is parsed by a process of its own,
+    and only as many chunks as there are jobs are parsed ahead of the last one whose result was
+    gotten, so that the results that wait to be gotten are bounded.
+
+    Call close() when done. It stops the workers, including any that are still parsing.
+    """
+
+    def __init__(
+            self, path: str, chunk_ranges: List[Tuple[int, int]], *,
+            jobs: int, package: str, suppressions: Optional[SanitizerSuppressions]
+    ) -> None:
+        """Start parsing the chunk_ranges of path with jobs processes."""
+        self._args = [
+            (path, begin, end, package, suppressions) for begin, end in chunk_ranges
+        ]  # type: List[Tuple[str, int, int, str, Optional[SanitizerSuppressions]]]
+        self._jobs = jobs
+        self._worker_by_chunk_i = {}  # type: Dict[int, Tuple[Connection, multiprocessing.Process]]
+        self._start(0)
+
+    def get_result(self, chunk_i: int, *, timeout: Optional[float] = None) -> Optional[ChunkResult]:
+        """Wait for the result of chunk chunk_i. Return None if timeout seconds pass first."""
+        self._start(chunk_i)
+        connection, process = self._worker_by_chunk_i[chunk_i]
+        if not connection.poll(timeout):
+            return None
+
+        # A worker that fails writes its traceback to stderr and exits without a result.
+        try:
+            result = connection.recv()  # type: ChunkResult
+        except EOFError:
+            raise RuntimeError(
+                'The worker process that parsed chunk {chunk_i} exited without a result'
+                .format(**locals())
+            )
+        finally:
+            connection.close()
+            process.join()
+            del self._worker_by_chunk_i[chunk_i]
+
+        # The next chunk is parsed in place of this one.
+        self._start(chunk_i + 1)
+        return result
+
+    def _start(self, chunk_i: int) -> None:
+        """Start parsing the chunks from chunk_i on that fit in jobs, if not yet started."""
+        for start_chunk_i in range(chunk_i, min(chunk_i + self._jobs, len(self._args))):
+            if start_chunk_i in self._worker_by_chunk_i:
+                continue
+
+            connection, child_connection = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_send_chunk_result,
+                args=(child_connection, self._args[start_chunk_i]),
+                daemon=True,
+            )
+            process.start()
+            # Only the worker writes to its end, so that reading fails once the worker is gone.
+            child_connection.close()
+            self._worker_by_chunk_i[start_chunk_i] = (connection, process)
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        for connection, process in self._worker_by_chunk_i.values():
+            process.terminate()
+            process.join()
+            connection.close()
+        self._worker_by_chunk_i = {}
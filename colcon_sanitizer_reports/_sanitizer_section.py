@@ -13,7 +13,7 @@
 # limitations under the License.
 
 import re
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from colcon_sanitizer_reports._sanitizer_section_part import SanitizerSectionPart
 
@@ -25,6 +25,15 @@ _FIND_ERROR_NAME_REGEX = re.compile(r'^.*Sanitizer: (?P<error_name>.+?)( \(| 0x[
 _FIND_SECTION_PART_BEGIN_REGEX = re.compile(r'^\S.*$')
 
 
+def get_error_name(header_line: str) -> Optional[str]:
+    """Return the error name from a sanitizer section header line, if it has one."""
+    match = _FIND_ERROR_NAME_REGEX.match(header_line)
+    if match is None:
+        return None
+
+    return match.groupdict()['error_name']
+
+
 class SanitizerSection:
     """Parses error name and sub section parts from log lines of a single sanitizer section.
 
@@ -70,11 +79,11 @@ class SanitizerSection:
     def __init__(self, *, lines: Tuple[str, ...]) -> None:
         """Construct the sanitizer section."""
         # Section error name comes after 'Sanitizer: ', and before any open paren or hex number.
-        match = _FIND_ERROR_NAME_REGEX.match(lines[0])
-        assert match is not None, (
+        error_name = get_error_name(lines[0])
+        assert error_name is not None, (
             'Could not find error name in section header: {lines[0]}'.format(**locals())
         )
-        self._error_name = match.groupdict()['error_name']
+        self._error_name = error_name
 
         # Divide into parts. Subsections begin with a line that is not indented.
         part_lines = []  # type: List[str]
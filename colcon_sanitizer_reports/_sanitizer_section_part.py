@@ -94,12 +94,20 @@ class SanitizerSectionPart:
     patterns that determine which stack traces are relevant. Different error/warning names have
     different relevant stack traces.
 
-    After initialization, SanitizerSectionPart includes the following data member.
+    After initialization, SanitizerSectionPart includes the following data members.
+
+    lines:
+        All lines of the section part.
 
     relevant_stack_traces:
         Stack traces from the section part that are relevant for generating the report.
     """
 
+    @property
+    def lines(self) -> Tuple[str, ...]:
+        """All lines of the section part."""
+        return self._lines
+
     @property
     def relevant_stack_traces(self) -> Tuple[SanitizerSectionPartStackTrace, ...]:
         """Stack traces from the section part that are relevant for generating the report."""
@@ -107,6 +115,7 @@ class SanitizerSectionPart:
 
     def __init__(self, *, error_name: str, lines: Tuple[str, ...]) -> None:
         """Gather relevant sanitizer stack traces."""
+        self._lines = lines
         relevant_stack_traces = []  # type: List[SanitizerSectionPartStackTrace]
         find_relevant_stack_trace_begin_regexes = (
             _FIND_RELEVANT_STACK_TRACE_BEGIN_REGEXES_BY_ERROR_NAME[error_name]
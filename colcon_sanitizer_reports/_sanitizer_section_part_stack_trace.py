@@ -12,8 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import re
-from typing import Tuple
+from typing import Iterable, Optional, Tuple
 
 
 # Key comes from a line of ros2 code and matches the following pattern.
@@ -24,6 +25,22 @@ _FIND_KEY_REGEX = re.compile(r'^\s+#\d+ (0x[\da-f]+ in|)\s*(?P<key>.*/ros2.*)\s*
 _FIND_KEY_SUB_REGEX = re.compile(r'0x[\da-f]+')
 
 
+def find_stack_trace_key(lines: Iterable[str]) -> Optional[str]:
+    """Return the key of a stack trace with the given lines, or None if no line is ros2 code."""
+    for line in lines:
+        match = _FIND_KEY_REGEX.match(line)
+        if match is not None:
+            return _FIND_KEY_SUB_REGEX.sub('0xX', match.groupdict()['key'])
+
+    return None
+
+
+def get_stack_trace_hash(lines: Tuple[str, ...]) -> str:
+    """Return a hash identifying stack traces with the given lines."""
+    # 64 bits are plenty to tell apart the distinct stack traces of a report.
+    return hashlib.sha1('\n'.join(lines).encode('utf-8', errors='replace')).hexdigest()[:16]
+
+
 class SanitizerSectionPartStackTrace:
     """Parses key from a single sanitizer section part stack trace and stores stack trace lines.
 
@@ -53,8 +70,19 @@ class SanitizerSectionPartStackTrace:
 
     lines:
         The lines that make up the stack trace.
+
+    content_hash:
+        A hash of the lines. Stack traces with identical lines have the same content hash, so it can
+        be used to store and reference each distinct stack trace only once.
+
+    A key may also be given explicitly, eg. when restoring a stack trace from a partial report, in
+    which case the lines are not searched for one.
     """
 
+    # The content hash is computed the first time it is needed, since only the relevant stack traces
+    # of a section are stored as samples.
+    _content_hash = None  # type: Optional[str]
+
     @property
     def key(self) -> str:
         """Key parsed from first line in the stack trace that comes from ros2 code."""
@@ -65,14 +93,17 @@ class SanitizerSectionPartStackTrace:
         """Lines that make up the stack trace."""
         return self._lines
 
-    def __init__(self, lines: Tuple[str, ...]) -> None:
+    @property
+    def content_hash(self) -> str:
+        """Hash of the lines that make up the stack trace."""
+        if self._content_hash is None:
+            self._content_hash = get_stack_trace_hash(self._lines)
+        return self._content_hash
+
+    def __init__(self, lines: Tuple[str, ...], key: Optional[str] = None) -> None:
         """Find and assign stack trace key."""
-        key = None
-        for line in lines:
-            match = _FIND_KEY_REGEX.match(line)
-            if match is not None:
-                key = _FIND_KEY_SUB_REGEX.sub('0xX', match.groupdict()['key'])
-                break
+        if key is None:
+            key = find_stack_trace_key(lines)
 
         assert key is not None, 'Could not find key in given stack trace lines.'
 
@@ -0,0 +1,114 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from typing import Dict, Generic, Hashable, Iterator, Optional, Tuple, TypeVar
+
+_KeyT = TypeVar('_KeyT', bound=Hashable)
+
+
+class SpaceSavingCounter(Generic[_KeyT]):
+    """Counts the most frequent keys of a stream in a fixed amount of memory.
+
+    This is the Space-Saving algorithm (Metwally, Agrawal, and El Abbadi, 2005). At most capacity
+    keys are monitored at a time. When a key that is not monitored is added and the counter is full,
+    the monitored key with the smallest count is evicted and the new key takes over its count plus
+    one. The count taken over is remembered as the error of the new key.
+
+    The counts are kept in buckets of keys with equal count, so adding a key and finding the key to
+    evict are both O(1).
+
+    After adding keys, SpaceSavingCounter guarantees the following for every monitored key.
+
+        count - error <= true count <= count
+
+    Any key whose true count is larger than total / capacity is monitored.
+    """
+
+    @property
+    def capacity(self) -> int:
+        """Maximum number of keys that are monitored at a time."""
+        return self._capacity
+
+    @property
+    def total(self) -> int:
+        """Number of times any key was added."""
+        return self._total
+
+    @property
+    def eviction_count(self) -> int:
+        """Number of times a monitored key was evicted to make room for another."""
+        return self._eviction_count
+
+    def __init__(self, capacity: int) -> None:
+        """Initialize an empty counter that monitors up to capacity keys."""
+        assert capacity > 0, 'SpaceSavingCounter capacity must be positive.'
+        self._capacity = capacity
+        self._total = 0
+        self._eviction_count = 0
+        self._count_by_key = {}  # type: Dict[_KeyT, int]
+        self._error_by_key = {}  # type: Dict[_KeyT, int]
+
+        # Keys with equal count, in the order they reached that count. The oldest key in the
+        # bucket of the minimum count is evicted first.
+        self._keys_by_count = {}  # type: Dict[int, OrderedDict[_KeyT, None]]
+        self._min_count = 0
+
+    def add(self, key: _KeyT) -> Optional[_KeyT]:
+        """Count one occurrence of key. Return the key evicted to make room for it, if any."""
+        self._total += 1
+
+        count = self._count_by_key.get(key)
+        if count is not None:
+            self._remove_from_bucket(key, count)
+            self._add_to_bucket(key, count + 1)
+            return None
+
+        if len(self._count_by_key) < self._capacity:
+            self._error_by_key[key] = 0
+            self._add_to_bucket(key, 1)
+            self._min_count = 1
+            return None
+
+        min_count = self._min_count
+        evicted_key = next(iter(self._keys_by_count[min_count]))
+        self._remove_from_bucket(evicted_key, min_count)
+        del self._error_by_key[evicted_key]
+        self._eviction_count += 1
+
+        self._error_by_key[key] = min_count
+        self._add_to_bucket(key, min_count + 1)
+
+        return evicted_key
+
+    def items(self) -> Iterator[Tuple[_KeyT, int, int]]:
+        """Return (key, count, error) for each monitored key."""
+        for key, count in self._count_by_key.items():
+            yield key, count, self._error_by_key[key]
+
+    def _add_to_bucket(self, key: _KeyT, count: int) -> None:
+        self._count_by_key[key] = count
+        self._keys_by_count.setdefault(count, OrderedDict())[key] = None
+
+    def _remove_from_bucket(self, key: _KeyT, count: int) -> None:
+        del self._count_by_key[key]
+        bucket = self._keys_by_count[count]
+        del bucket[key]
+        if not bucket:
+            del self._keys_by_count[count]
+
+            # Counts only ever grow by one, so if the minimum bucket empties, the key that left it
+            # is now in the next bucket, which is the new minimum.
+            if count == self._min_count:
+                self._min_count = count + 1
@@ -12,16 +12,239 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import shutil
+import time
+from typing import Callable, Optional, TextIO, TYPE_CHECKING
+
+from colcon_core.environment_variable import EnvironmentVariable
 from colcon_core.event.job import JobEnded
 from colcon_core.event_handler import EventHandlerExtensionPoint
+from colcon_core.event_reactor import EventReactorShutdown
 from colcon_core.location import get_log_path
 from colcon_core.logging import colcon_logger
 from colcon_core.plugin_system import satisfies_version
 from colcon_output.event_handler.log import STDOUT_STDERR_LOG_FILENAME
-from colcon_sanitizer_reports.sanitizer_log_parser import SanitizerLogParser
+
+if TYPE_CHECKING:
+    from colcon_sanitizer_reports.metrics import SanitizerMetrics  # noqa: F401
+    from colcon_sanitizer_reports.report_limits import ReportLimits  # noqa: F401
+    from colcon_sanitizer_reports.sanitizer_log_parser import SanitizerLogParser  # noqa: F401
+    from colcon_sanitizer_reports.suppressions import SanitizerSuppressions  # noqa: F401
+    from colcon_sanitizer_reports.symbolizer import SanitizerSymbolizer  # noqa: F401
 
 logger = colcon_logger.getChild(__name__)
 
+MAX_KEYS_PER_PACKAGE_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_MAX_KEYS_PER_PACKAGE',
+    'Report only the given number of most frequent sanitizer errors of each package, with '
+    'approximate counts and fixed memory use')
+
+MAX_MEMORY_MB_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_MAX_MEMORY_MB',
+    'Spill the counts and sample stack traces of sanitizer errors to temporary files once they use '
+    'more than about the given number of MiB of memory')
+
+SUPPRESSIONS_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_SUPPRESSIONS',
+    'Path of a sanitizer suppression file listing known sanitizer errors to leave out of the '
+    'report')
+
+SYMBOLIZER_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_SYMBOLIZER',
+    'Name or path of an llvm-symbolizer executable to symbolize the stack trace frames that '
+    'sanitizers left unsymbolized with')
+
+SYMBOLIZER_CACHE_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_SYMBOLIZER_CACHE',
+    'Path of a file to keep the addresses resolved by COLCON_SANITIZER_REPORTS_SYMBOLIZER in '
+    'across runs')
+
+PACKAGE_TIME_BUDGET_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_PACKAGE_TIME_BUDGET',
+    'Seconds after which the rest of the log of a package is parsed quickly by only counting '
+    'sanitizer errors by name, without stack traces')
+
+PARSE_JOBS_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_PARSE_JOBS',
+    'Number of processes used to parse each large stdout_stderr.log file')
+
+GLOBAL_CSV_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_GLOBAL_CSV',
+    'Set to 1 to also write sanitizer_report_global.csv, with one line per sanitizer error across '
+    'all packages that lists the packages')
+
+MAX_ERRORS_PER_PACKAGE_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_MAX_ERRORS_PER_PACKAGE',
+    'Report only the given number of sanitizer errors with the largest counts of each package in '
+    'the csv and xml reports')
+
+MAX_STACK_TRACE_LINES_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_MAX_STACK_TRACE_LINES',
+    'Report only the given number of lines of each sample stack trace in the csv and xml reports')
+
+MAX_REPORT_BYTES_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_MAX_REPORT_BYTES',
+    'Leave sanitizer errors out of the csv and xml reports once they would exceed about the given '
+    'number of bytes')
+
+COMPRESS_CSV_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_COMPRESS_CSV',
+    'Set to 1 to write gzip-compressed csv reports, eg. sanitizer_report.csv.gz')
+
+STACK_TRACES_BY_HASH_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_STACK_TRACES_BY_HASH',
+    'Set to 1 to write each distinct sample stack trace once to sanitizer_stack_traces.csv and '
+    'reference it by hash from the csv and xml reports')
+
+METRICS_PORT_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_METRICS_PORT',
+    'Serve live parser and sanitizer error metrics in the Prometheus format at '
+    'http://127.0.0.1:<port>/metrics')
+
+METRICS_TEXTFILE_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_METRICS_TEXTFILE',
+    'Path of a file to write parser and sanitizer error metrics to in the Prometheus format '
+    'whenever a package job ends, eg. for the node_exporter textfile collector')
+
+XML_SHARDS_DIRECTORY_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_SANITIZER_REPORTS_XML_SHARDS_DIRECTORY',
+    'Path of a directory to write a <package>.xml report and a <package>.jsonl partial report of '
+    'each package to as soon as its job ends, instead of rewriting the reports of all packages')
+
+
+def _get_positive_int_environment_variable(
+        environment_variable: EnvironmentVariable
+) -> Optional[int]:
+    value = os.environ.get(environment_variable.name)
+    if not value:
+        return None
+
+    try:
+        int_value = int(value)
+    except ValueError:
+        int_value = 0
+    if int_value <= 0:
+        logger.warning(
+            'Ignoring {environment_variable.name}={value}, a positive integer is expected'
+            .format(**locals())
+        )
+        return None
+
+    return int_value
+
+
+def _get_suppressions() -> Optional['SanitizerSuppressions']:
+    path = os.environ.get(SUPPRESSIONS_ENVIRONMENT_VARIABLE.name)
+    if not path:
+        return None
+
+    from colcon_sanitizer_reports.suppressions import SanitizerSuppressions
+
+    try:
+        return SanitizerSuppressions.from_file(path)
+    except (IOError, ValueError) as e:
+        logger.warning(
+            'Ignoring {}={}: {}'.format(SUPPRESSIONS_ENVIRONMENT_VARIABLE.name, path, e)
+        )
+        return None
+
+
+def _get_symbolizer() -> Optional['SanitizerSymbolizer']:
+    command = os.environ.get(SYMBOLIZER_ENVIRONMENT_VARIABLE.name)
+    if not command:
+        return None
+
+    if shutil.which(command) is None:
+        logger.warning(
+            'Ignoring {}={}: executable not found'.format(
+                SYMBOLIZER_ENVIRONMENT_VARIABLE.name, command
+            )
+        )
+        return None
+
+    from colcon_sanitizer_reports.symbolizer import SanitizerSymbolizer
+
+    return SanitizerSymbolizer(
+        (command,), cache_path=os.environ.get(SYMBOLIZER_CACHE_ENVIRONMENT_VARIABLE.name) or None
+    )
+
+
+def _get_report_limits() -> Optional['ReportLimits']:
+    limits = (
+        _get_positive_int_environment_variable(MAX_ERRORS_PER_PACKAGE_ENVIRONMENT_VARIABLE),
+        _get_positive_int_environment_variable(MAX_STACK_TRACE_LINES_ENVIRONMENT_VARIABLE),
+        _get_positive_int_environment_variable(MAX_REPORT_BYTES_ENVIRONMENT_VARIABLE),
+    )
+    if all(limit is None for limit in limits):
+        return None
+
+    from colcon_sanitizer_reports.report_limits import ReportLimits
+
+    return ReportLimits(*limits)
+
+
+def _get_metrics(log_parser: 'SanitizerLogParser') -> Optional['SanitizerMetrics']:
+    metrics_port = _get_positive_int_environment_variable(METRICS_PORT_ENVIRONMENT_VARIABLE)
+    if metrics_port is None and not os.environ.get(METRICS_TEXTFILE_ENVIRONMENT_VARIABLE.name):
+        return None
+
+    from colcon_sanitizer_reports.metrics import SanitizerMetrics, start_metrics_server
+
+    metrics = SanitizerMetrics(log_parser)
+    if metrics_port is not None:
+        try:
+            start_metrics_server(metrics, metrics_port)
+        except OSError as e:
+            logger.warning(
+                'Ignoring {}={}: {}'.format(METRICS_PORT_ENVIRONMENT_VARIABLE.name, metrics_port, e)
+            )
+
+    return metrics
+
+
+def _write_shard(directory: str, filename: str, writer: Callable[[TextIO], None]) -> None:
+    # Shards are replaced atomically, so that a reader that picks them up while packages are still
+    # being tested never sees a partially written file.
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, filename)
+    temporary_path = os.path.join(directory, '.tmp.' + filename)
+    with open(temporary_path, 'w', encoding='utf-8') as shard_f_out:
+        writer(shard_f_out)
+    os.replace(temporary_path, path)
+
+
+def _write_reports(
+        log_parser: 'SanitizerLogParser', *,
+        csv_suffix: str, inline_stack_traces: bool, limits: Optional['ReportLimits']
+) -> None:
+    from colcon_sanitizer_reports.sanitizer_log_parser import open_csv_report
+
+    # The csv reports are written row by row, so they are never held in memory as a whole.
+    with open_csv_report('sanitizer_report' + csv_suffix) as report_csv_f_out:
+        log_parser.write_csv(
+            report_csv_f_out, inline_stack_traces=inline_stack_traces, limits=limits
+        )
+
+    # Like the csv reports, the xml report is written one package at a time.
+    with open('test_results.xml', 'w', encoding='utf-8') as report_xml_f_out:
+        log_parser.write_xml(
+            report_xml_f_out, inline_stack_traces=inline_stack_traces, limits=limits
+        )
+
+    if os.environ.get(GLOBAL_CSV_ENVIRONMENT_VARIABLE.name, '') not in ('', '0'):
+        with open_csv_report('sanitizer_report_global' + csv_suffix) as global_csv_f_out:
+            log_parser.write_global_csv(global_csv_f_out)
+
+    if not inline_stack_traces:
+        with open_csv_report('sanitizer_stack_traces' + csv_suffix) as stack_traces_csv_f_out:
+            log_parser.write_stack_traces_csv(stack_traces_csv_f_out, limits=limits)
+
+    # The partial report can be merged with those of other machines by
+    # colcon-sanitizer-reports-merge.
+    with open('sanitizer_report_partial.jsonl', 'w') as report_partial_f_out:
+        log_parser.write_partial(report_partial_f_out)
+
 
 class SanitizerReportEventHandler(EventHandlerExtensionPoint):
     """Generate a report of all Sanitizer ERRORs and WARNINGs."""
@@ -33,7 +256,13 @@ class SanitizerReportEventHandler(EventHandlerExtensionPoint):
         super().__init__()
         satisfies_version(EventHandlerExtensionPoint.EXTENSION_POINT_VERSION, '^1.0')
         self.enabled = SanitizerReportEventHandler.ENABLED_BY_DEFAULT  # type: bool
-        self._log_parser = SanitizerLogParser()  # type: SanitizerLogParser
+
+        # colcon creates every event handler on every invocation, even when it is not enabled,
+        # so the log parser is created, and the parser and report modules are imported, only once
+        # the first event is handled.
+        self._log_parser = None  # type: Optional[SanitizerLogParser]
+        self._metrics = None  # type: Optional[SanitizerMetrics]
+        self._symbolizer = None  # type: Optional[SanitizerSymbolizer]
 
     def __call__(self, event) -> None:
         """Handle the colcon event appropriately."""
@@ -41,22 +270,103 @@ class SanitizerReportEventHandler(EventHandlerExtensionPoint):
 
         if isinstance(data, JobEnded):
             self._handle(event)
+        elif isinstance(data, EventReactorShutdown):
+            # The reports were written when the last job ended.
+            if self._symbolizer is not None:
+                self._symbolizer.close()
+
+    def _get_log_parser(self) -> 'SanitizerLogParser':
+        if self._log_parser is None:
+            from colcon_sanitizer_reports.sanitizer_log_parser import SanitizerLogParser
+
+            max_keys_per_package = \
+                _get_positive_int_environment_variable(MAX_KEYS_PER_PACKAGE_ENVIRONMENT_VARIABLE)
+            max_memory_mb = \
+                _get_positive_int_environment_variable(MAX_MEMORY_MB_ENVIRONMENT_VARIABLE)
+            if max_keys_per_package is not None and max_memory_mb is not None:
+                # Approximate mode already has fixed memory use.
+                logger.warning(
+                    'Ignoring {}, since {} is set'.format(
+                        MAX_MEMORY_MB_ENVIRONMENT_VARIABLE.name,
+                        MAX_KEYS_PER_PACKAGE_ENVIRONMENT_VARIABLE.name,
+                    )
+                )
+                max_memory_mb = None
+
+            self._symbolizer = _get_symbolizer()
+            self._log_parser = SanitizerLogParser(
+                max_keys_per_package=max_keys_per_package,
+                suppressions=_get_suppressions(),
+                max_memory_bytes=max_memory_mb * 1024 * 1024 if max_memory_mb else None,
+                symbolizer=self._symbolizer,
+            )
+            self._metrics = _get_metrics(self._log_parser)
+
+        return self._log_parser
 
     def _handle(self, event) -> None:
         """Handle JobEnded event and parse the test log file."""
         job = event[1]  # type: JobEnded
-        self._log_parser.set_package(job.identifier)
+        log_parser = self._get_log_parser()
+        log_parser.set_package(job.identifier)
 
+        time_budget = \
+            _get_positive_int_environment_variable(PACKAGE_TIME_BUDGET_ENVIRONMENT_VARIABLE)
+        parse_start_time = time.monotonic()
+        log_bytes = 0
         try:
             log_f = get_log_path() / job.identifier / STDOUT_STDERR_LOG_FILENAME
-            with open(log_f, 'r') as in_file:
-                for line in in_file:
-                    self._log_parser.parse_line(line)
+            log_bytes = os.path.getsize(str(log_f))
+            if log_parser.parse_log_file(
+                str(log_f),
+                jobs=_get_positive_int_environment_variable(PARSE_JOBS_ENVIRONMENT_VARIABLE) or 1,
+                time_budget=time_budget,
+            ):
+                logger.warning(
+                    'Parsing the log of {job.identifier} took more than {time_budget} seconds, the '
+                    'rest of it was parsed without stack traces'.format(**locals())
+                )
         except IOError:
             logger.info('Could not open stdout_stderr.log file')
 
-        with open('sanitizer_report.csv', 'w') as report_csv_f_out:
-            report_csv_f_out.write(self._log_parser.get_csv())
+        if self._metrics is not None:
+            self._metrics.set_package_metrics(
+                job.identifier, time.monotonic() - parse_start_time, log_bytes
+            )
+            metrics_textfile = os.environ.get(METRICS_TEXTFILE_ENVIRONMENT_VARIABLE.name)
+            if metrics_textfile:
+                from colcon_sanitizer_reports.metrics import write_metrics_textfile
+
+                write_metrics_textfile(self._metrics, metrics_textfile)
+
+        inline_stack_traces = \
+            os.environ.get(STACK_TRACES_BY_HASH_ENVIRONMENT_VARIABLE.name, '') in ('', '0')
+        limits = _get_report_limits()
+        csv_suffix = '.csv'
+        if os.environ.get(COMPRESS_CSV_ENVIRONMENT_VARIABLE.name, '') not in ('', '0'):
+            csv_suffix = '.csv.gz'
+
+        xml_shards_directory = os.environ.get(XML_SHARDS_DIRECTORY_ENVIRONMENT_VARIABLE.name)
+        if xml_shards_directory:
+            # Only the reports of the package whose job ended are written, and its records are
+            # released once they are, so that the parser only ever holds the records of the package
+            # it parses. colcon-sanitizer-reports-merge makes the reports of all packages from the
+            # partial report shards.
+            package = job.identifier
+            _write_shard(xml_shards_directory, package + '.xml', lambda f_out: log_parser.write_xml(
+                f_out, package=package, inline_stack_traces=inline_stack_traces, limits=limits,
+            ))
+            _write_shard(
+                xml_shards_directory, package + '.jsonl',
+                lambda f_out: log_parser.write_partial(f_out, package=package),
+            )
+            log_parser.release_package(package)
+        else:
+            _write_reports(
+                log_parser,
+                csv_suffix=csv_suffix, inline_stack_traces=inline_stack_traces, limits=limits,
+            )
 
-        with open('test_results.xml', 'w') as report_xml_f_out:
-            report_xml_f_out.write(self._log_parser.get_xml())
+        if os.environ.get(SUPPRESSIONS_ENVIRONMENT_VARIABLE.name):
+            with open('sanitizer_suppressions.csv', 'w') as suppressions_csv_f_out:
+                suppressions_csv_f_out.write(log_parser.get_suppressions_csv())
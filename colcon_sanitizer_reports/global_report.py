@@ -0,0 +1,155 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reports with one record per error across all packages.
+
+A single bug in a shared library is reported once for every package whose tests run into it, since
+the package is part of SanitizerLogParserOutputPrimaryKey. A global report combines the records of
+all packages that share an error_name and stack_trace_key into a single record that lists the
+packages, which is much smaller for triage.
+"""
+
+from collections import defaultdict
+import csv
+from typing import Dict, Iterable, List, NamedTuple, TextIO, Tuple
+
+from colcon_sanitizer_reports._sanitizer_section_part_stack_trace import (
+    SanitizerSectionPartStackTrace
+)
+from colcon_sanitizer_reports.sanitizer_log_parser import (
+    DEGRADED_OUTPUT_NAME, SanitizerReportRecord
+)
+
+SanitizerGlobalKey = NamedTuple(
+    'SanitizerGlobalKey',
+    [
+        ('error_name', str),
+        ('stack_trace_key', str),
+    ]
+)
+
+SanitizerGlobalKey.__doc__ = (
+    """Global report output is keyed on these fields.
+
+    These are the fields of SanitizerLogParserOutputPrimaryKey without the package.
+    """
+)
+
+SanitizerGlobalReportRecord = NamedTuple(
+    'SanitizerGlobalReportRecord',
+    [
+        ('global_key', SanitizerGlobalKey),
+        ('count', int),
+        ('count_by_package', Tuple[Tuple[str, int], ...]),
+        ('sample_stack_trace', SanitizerSectionPartStackTrace),
+        ('count_error', int),
+    ]
+)
+
+SanitizerGlobalReportRecord.__doc__ = (
+    """A single line of global report output.
+
+    global_key:
+        The SanitizerGlobalKey that this record reports.
+
+    count:
+        The count of times the global_key occurred in any package.
+
+    count_by_package:
+        (package, count) for each package in which the global_key occurred, in order of decreasing
+        count.
+
+    sample_stack_trace:
+        The sample stack trace of the package with the largest count.
+
+    count_error:
+        The sum of the count errors of the packages. See SanitizerReportRecord.
+    """
+)
+
+
+def get_global_records(
+        records: Iterable[SanitizerReportRecord]
+) -> List[SanitizerGlobalReportRecord]:
+    """Combine the records of all packages that share a global key, sorted by global key.
+
+    The records are indexed by global key as they are read. Only the per-package counts and a
+    single sample stack trace of each global key are held in memory. Records that mark degraded
+    packages, see DEGRADED_OUTPUT_NAME, are not errors, so they are left out.
+    """
+    count_by_package_by_global_key = defaultdict(dict) \
+        # type: Dict[SanitizerGlobalKey, Dict[str, int]]
+    sample_by_global_key = {} \
+        # type: Dict[SanitizerGlobalKey, Tuple[int, SanitizerSectionPartStackTrace]]
+    count_error_by_global_key = defaultdict(int)  # type: Dict[SanitizerGlobalKey, int]
+    for record in records:
+        if record.output_primary_key.error_name == DEGRADED_OUTPUT_NAME:
+            continue
+
+        global_key = SanitizerGlobalKey(
+            error_name=record.output_primary_key.error_name,
+            stack_trace_key=record.output_primary_key.stack_trace_key,
+        )
+        count_by_package_by_global_key[global_key][record.output_primary_key.package] = \
+            record.count
+        count_error_by_global_key[global_key] += record.count_error
+
+        # Keep the sample of the package with the largest count.
+        sample = sample_by_global_key.get(global_key)
+        if sample is None or sample[0] < record.count:
+            sample_by_global_key[global_key] = (record.count, record.sample_stack_trace)
+
+    global_records = []  # type: List[SanitizerGlobalReportRecord]
+    for global_key in sorted(count_by_package_by_global_key.keys()):
+        count_by_package = count_by_package_by_global_key[global_key]
+        global_records.append(SanitizerGlobalReportRecord(
+            global_key=global_key,
+            count=sum(count_by_package.values()),
+            count_by_package=tuple(sorted(
+                count_by_package.items(), key=lambda package_count: -package_count[1]
+            )),
+            sample_stack_trace=sample_by_global_key[global_key][1],
+            count_error=count_error_by_global_key[global_key],
+        ))
+
+    return global_records
+
+
+def write_global_csv_report(
+        global_records: Iterable[SanitizerGlobalReportRecord], f_out: TextIO, *,
+        with_count_error: bool = False
+) -> None:
+    """Write a csv representation of the given global records to f_out, one row at a time.
+
+    The packages column lists "package:count" for each package, separated by spaces. If
+    with_count_error is True, a count_error column is added after the sample_stack_trace column.
+
+    Each stack trace is the sample of a single line, so sample stack traces are always included
+    rather than referenced by hash.
+    """
+    writer = csv.writer(f_out)
+    writer.writerow([
+        *SanitizerGlobalKey._fields, 'count', 'package_count', 'packages', 'sample_stack_trace',
+        *(('count_error',) if with_count_error else ())
+    ])
+    for global_record in global_records:
+        writer.writerow([
+            *global_record.global_key, global_record.count, len(global_record.count_by_package),
+            ' '.join(
+                '{package}:{count}'.format(package=package, count=count)
+                for package, count in global_record.count_by_package
+            ),
+            '\n'.join(global_record.sample_stack_trace.lines),
+            *((global_record.count_error,) if with_count_error else ())
+        ])
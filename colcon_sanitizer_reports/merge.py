@@ -0,0 +1,159 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+r"""Merge partial sanitizer reports from many machines into a single report.
+
+Each shard is a partial report, as written by the sanitizer_report event handler to
+sanitizer_report_partial.jsonl. Shards are merged with a k-way streaming merge, so only one record
+per shard is held in memory no matter how many shards are merged.
+
+Example:
+    colcon-sanitizer-reports-merge --csv sanitizer_report.csv --xml test_results.xml \
+        node*/sanitizer_report_partial.jsonl
+"""
+
+import argparse
+from contextlib import ExitStack
+from functools import partial
+import sys
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from colcon_sanitizer_reports.global_report import get_global_records, write_global_csv_report
+from colcon_sanitizer_reports.partial_report import (
+    merge_partial_reports, read_partial_report, write_partial_report
+)
+from colcon_sanitizer_reports.report_limits import limit_records, ReportLimits, ReportTruncation
+from colcon_sanitizer_reports.sanitizer_log_parser import (
+    open_csv_report, SanitizerReportRecord, write_csv_report, write_stack_traces_csv
+)
+from colcon_sanitizer_reports.xml_output_generator import write_xml_report
+
+
+def _create_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='colcon-sanitizer-reports-merge',
+        description='Merge partial sanitizer reports into a single csv and/or xml report.',
+    )
+    parser.add_argument(
+        'shards', metavar='SHARD', nargs='+',
+        help='Partial report files (sanitizer_report_partial.jsonl) to merge.',
+    )
+    parser.add_argument(
+        '--csv',
+        help="Path of the merged csv report to write, gzip-compressed if it ends with '.gz'.",
+    )
+    parser.add_argument(
+        '--global-csv',
+        help='Path of a merged csv report to write with one line per error across all packages.',
+    )
+    parser.add_argument('--xml', help='Path of the merged xUnit xml report to write.')
+    parser.add_argument(
+        '--partial', help='Path of a merged partial report to write, eg. for further merging.'
+    )
+    parser.add_argument(
+        '--stack-traces',
+        help='Path of a csv file of the distinct sample stack traces to write. The csv and xml '
+             'reports then reference sample stack traces by hash instead of including them.',
+    )
+    parser.add_argument(
+        '--max-errors-per-package', type=int, metavar='N',
+        help='Report only the N errors with the largest counts of each package.',
+    )
+    parser.add_argument(
+        '--max-stack-trace-lines', type=int, metavar='N',
+        help='Report only the first N lines of each sample stack trace.',
+    )
+    parser.add_argument(
+        '--max-bytes', type=int, metavar='N',
+        help='Leave errors out of the csv and xml reports once they would exceed about N bytes.',
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Merge the partial reports given on the command line."""
+    args = _create_argument_parser().parse_args(argv)
+    output_paths = [
+        path for path in (args.csv, args.global_csv, args.xml, args.partial) if path is not None
+    ]
+    if not output_paths:
+        print(
+            'At least one of --csv, --global-csv, --xml, or --partial is required.',
+            file=sys.stderr,
+        )
+        return 1
+
+    # Each output is written while streaming over the shards, so the shards are read once per
+    # output rather than holding the merged report in memory.
+    # Shards may come from approximate mode parsers, so the csv always includes count errors.
+    # Partial reports always include their sample stack traces, so that each is self-contained.
+    inline_stack_traces = args.stack_traces is None
+
+    # Limits apply to every output but the partial report, with the same records left out of each,
+    # so that the stack traces file matches the csv and xml reports.
+    limits = None  # type: Optional[ReportLimits]
+    if any(limit is not None for limit in (
+        args.max_errors_per_package, args.max_stack_trace_lines, args.max_bytes
+    )):
+        limits = ReportLimits(
+            max_errors_per_package=args.max_errors_per_package,
+            max_stack_trace_lines=args.max_stack_trace_lines,
+            max_bytes=args.max_bytes,
+        )
+    xml_truncation = ReportTruncation()
+    writers = (
+        (args.csv, partial(
+            write_csv_report, with_count_error=True, inline_stack_traces=inline_stack_traces
+        ), ReportTruncation()),
+        (args.xml, partial(
+            write_xml_report, inline_stack_traces=inline_stack_traces, truncation=xml_truncation
+        ), xml_truncation),
+        (args.global_csv, lambda records, f_out: write_global_csv_report(
+            get_global_records(records), f_out, with_count_error=True
+        ), None),
+        (args.partial, write_partial_report, None),
+        (args.stack_traces, write_stack_traces_csv, ReportTruncation()),
+    )  # type: Tuple[Tuple[Optional[str], Callable[..., None], Optional[ReportTruncation]], ...]
+    for output_path, writer, truncation in writers:
+        if output_path is None:
+            continue
+
+        with ExitStack() as stack:
+            shard_records = [
+                read_partial_report(stack.enter_context(open(shard, 'r', encoding='utf-8')))
+                for shard in args.shards
+            ]
+            records = merge_partial_reports(*shard_records)  # type: Iterable[SanitizerReportRecord]
+            if limits is not None and truncation is not None:
+                records = limit_records(records, limits, truncation)
+            open_output = \
+                open_csv_report if output_path in (args.csv, args.global_csv, args.stack_traces) \
+                else partial(open, mode='w', encoding='utf-8', newline='')
+            with open_output(output_path) as f_out:
+                writer(records, f_out)
+
+        if truncation is not None and truncation.is_truncated:
+            print(
+                '{}: left out {} errors with {} occurrences and {} stack trace lines'.format(
+                    output_path, truncation.omitted_error_count,
+                    truncation.omitted_occurrence_count, truncation.omitted_stack_trace_line_count
+                ),
+                file=sys.stderr,
+            )
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Live metrics of a sanitizer report run in the Prometheus text exposition format.
+
+Metrics are served over HTTP by start_metrics_server(), or written to a file for the node_exporter
+textfile collector by write_metrics_textfile(). Scraping never blocks parsing: parser statistics are
+read with SanitizerLogParser.get_stats(), and per-package metrics are rendered by the parsing thread
+when a package is done and swapped in as a whole.
+"""
+
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import os
+from socketserver import ThreadingMixIn
+import threading
+from typing import Dict, List, Tuple
+
+from colcon_sanitizer_reports.sanitizer_log_parser import SanitizerLogParser
+
+_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_metric(name: str, metric_type: str, help_text: str, samples: List[str]) -> str:
+    return ''.join((
+        '# HELP {name} {help_text}\n'.format(**locals()),
+        '# TYPE {name} {metric_type}\n'.format(**locals()),
+        *(sample + '\n' for sample in samples),
+    ))
+
+
+class SanitizerMetrics:
+    """Metrics of a SanitizerLogParser and of the packages it parsed.
+
+    set_package_metrics() must be called from the thread that parses, once a package is done.
+    get_text() may be called from any thread.
+    """
+
+    def __init__(self, parser: SanitizerLogParser) -> None:
+        """Initialize metrics of parser."""
+        self._parser = parser
+
+        # Only used by the parsing thread. Samples of each package are rendered once, when the
+        # package is done.
+        self._samples_by_package = {}  # type: Dict[str, Tuple[str, str, List[str]]]
+
+        # Replaced as a whole by the parsing thread, so that readers never see a partial update.
+        self._package_text = ''  # type: str
+
+    def set_package_metrics(self, package: str, parse_seconds: float, log_bytes: int) -> None:
+        """Record that package was parsed in parse_seconds from a log of log_bytes bytes."""
+        count_by_error_name = defaultdict(int)  # type: Dict[str, int]
+        for record in self._parser.get_records(package=package):
+            count_by_error_name[record.output_primary_key.error_name] += record.count
+
+        package_label = 'package="{}"'.format(_escape_label_value(package))
+        self._samples_by_package[package] = (
+            'sanitizer_reports_package_parse_seconds{{{package_label}}} {parse_seconds}'.format(
+                **locals()
+            ),
+            'sanitizer_reports_package_log_bytes{{{package_label}}} {log_bytes}'.format(
+                **locals()
+            ),
+            [
+                'sanitizer_reports_errors{{{},error_name="{}"}} {}'.format(
+                    package_label, _escape_label_value(error_name), count
+                )
+                for error_name, count in sorted(count_by_error_name.items())
+            ],
+        )
+
+        packages = sorted(self._samples_by_package.keys())
+        self._package_text = ''.join((
+            _format_metric(
+                'sanitizer_reports_package_parse_seconds', 'gauge',
+                'Seconds taken to parse the log of a package.',
+                [self._samples_by_package[package][0] for package in packages],
+            ),
+            _format_metric(
+                'sanitizer_reports_package_log_bytes', 'gauge',
+                'Size in bytes of the log of a package.',
+                [self._samples_by_package[package][1] for package in packages],
+            ),
+            _format_metric(
+                'sanitizer_reports_errors', 'gauge',
+                'Count of sanitizer errors reported by package and error name.',
+                [
+                    sample
+                    for package in packages for sample in self._samples_by_package[package][2]
+                ],
+            ),
+        ))
+
+    def get_text(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        stats = self._parser.get_stats()
+        return ''.join((
+            _format_metric(
+                'sanitizer_reports_parsed_lines_total', 'counter', 'Count of log lines parsed.',
+                ['sanitizer_reports_parsed_lines_total {}'.format(stats.parsed_line_count)],
+            ),
+            _format_metric(
+                'sanitizer_reports_parsed_characters_total', 'counter',
+                'Count of characters of log lines parsed, which are bytes for ASCII logs.',
+                [
+                    'sanitizer_reports_parsed_characters_total {}'.format(
+                        stats.parsed_character_count
+                    )
+                ],
+            ),
+            _format_metric(
+                'sanitizer_reports_open_sections', 'gauge',
+                'Count of sanitizer sections whose end line was not parsed yet.',
+                ['sanitizer_reports_open_sections {}'.format(stats.open_section_count)],
+            ),
+            _format_metric(
+                'sanitizer_reports_evicted_keys_total', 'counter',
+                'Count of sanitizer error keys dropped in approximate mode.',
+                ['sanitizer_reports_evicted_keys_total {}'.format(stats.evicted_key_count)],
+            ),
+            _format_metric(
+                'sanitizer_reports_spilled_runs', 'gauge',
+                'Count of sorted runs spilled to disk.',
+                ['sanitizer_reports_spilled_runs {}'.format(stats.spilled_run_count)],
+            ),
+            self._package_text,
+        ))
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = self.server.metrics.get_text().encode('utf-8')  # type: ignore
+        self.send_response(200)
+        self.send_header('Content-Type', _CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        # Scrapes are not logged.
+        pass
+
+
+class _MetricsHTTPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], metrics: SanitizerMetrics) -> None:
+        super().__init__(address, _MetricsRequestHandler)
+        self.metrics = metrics
+
+
+def start_metrics_server(
+        metrics: SanitizerMetrics, port: int, *, host: str = '127.0.0.1'
+) -> HTTPServer:
+    """Serve metrics at http://host:port/metrics from a daemon thread.
+
+    Port 0 picks a free port, see the server_port attribute of the returned server. Call shutdown()
+    on it to stop serving.
+    """
+    server = _MetricsHTTPServer((host, port), metrics)
+    thread = threading.Thread(target=server.serve_forever, name='sanitizer-reports-metrics')
+    thread.daemon = True
+    thread.start()
+
+    return server
+
+
+def write_metrics_textfile(metrics: SanitizerMetrics, path: str) -> None:
+    """Write metrics to path, replacing it atomically, eg. for the node_exporter textfile collector.
+
+    The node_exporter textfile collector only reads files that end in ".prom".
+    """
+    # The temporary file does not end in ".prom", so that it is never collected.
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f_out:
+        f_out.write(metrics.get_text())
+    os.replace(temporary_path, path)
@@ -0,0 +1,133 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serialized partial sanitizer reports that can be merged across runs.
+
+A partial report holds the state of a SanitizerLogParser, the count and a sample stack trace for
+each SanitizerLogParserOutputPrimaryKey, in a form that can be written on one machine and merged
+with partial reports from any number of other machines.
+
+The format is JSON lines. The first line is a header identifying the format and its version. Each
+following line is one record, and records are sorted by output primary key:
+
+    {"format": "colcon-sanitizer-reports-partial", "version": 1}
+    {"package": "...", "error_name": "...", "stack_trace_key": "...", "count": 3,
+     "sample_stack_trace": ["    #0 ...", "    #1 ..."]}
+
+Records with approximate counts additionally have a "count_error" field.
+
+Because records are sorted, partial reports are merged with a k-way streaming merge that holds a
+single record per input in memory.
+"""
+
+from heapq import merge
+from itertools import groupby
+import json
+from typing import Iterable, Iterator, Optional, TextIO
+
+from colcon_sanitizer_reports._sanitizer_section_part_stack_trace import (
+    SanitizerSectionPartStackTrace
+)
+from colcon_sanitizer_reports.sanitizer_log_parser import (
+    SanitizerLogParserOutputPrimaryKey, SanitizerReportRecord
+)
+
+PARTIAL_REPORT_FORMAT = 'colcon-sanitizer-reports-partial'
+PARTIAL_REPORT_VERSION = 1
+
+
+def write_partial_report(records: Iterable[SanitizerReportRecord], f_out: TextIO) -> None:
+    """Write records, which must be sorted by output primary key, as a partial report."""
+    f_out.write(json.dumps({
+        'format': PARTIAL_REPORT_FORMAT, 'version': PARTIAL_REPORT_VERSION
+    }, sort_keys=True) + '\n')
+    for record in records:
+        f_out.write(json.dumps({
+            **record.output_primary_key._asdict(),
+            'count': record.count,
+            'sample_stack_trace': list(record.sample_stack_trace.lines),
+            **({'count_error': record.count_error} if record.count_error else {}),
+        }, sort_keys=True) + '\n')
+
+
+def read_partial_report(f_in: TextIO) -> Iterator[SanitizerReportRecord]:
+    """Read records from a partial report one at a time.
+
+    Raises ValueError if the input is not a partial report, or if its records are not sorted.
+    """
+    header = json.loads(f_in.readline() or 'null')
+    if not isinstance(header, dict) or header.get('format') != PARTIAL_REPORT_FORMAT:
+        raise ValueError('Input is not a sanitizer partial report.')
+    if header.get('version') != PARTIAL_REPORT_VERSION:
+        raise ValueError(
+            'Unsupported sanitizer partial report version: {}'.format(header.get('version'))
+        )
+
+    previous_output_primary_key = None  # type: Optional[SanitizerLogParserOutputPrimaryKey]
+    for line in f_in:
+        if not line.strip():
+            continue
+
+        fields = json.loads(line)
+        output_primary_key = SanitizerLogParserOutputPrimaryKey(**{
+            field: fields[field] for field in SanitizerLogParserOutputPrimaryKey._fields
+        })
+        if previous_output_primary_key is not None and \
+                output_primary_key <= previous_output_primary_key:
+            raise ValueError(
+                'Sanitizer partial report records are not sorted at: {}'.format(
+                    output_primary_key
+                )
+            )
+        previous_output_primary_key = output_primary_key
+
+        yield SanitizerReportRecord(
+            output_primary_key=output_primary_key,
+            count=fields['count'],
+            sample_stack_trace=SanitizerSectionPartStackTrace(
+                tuple(fields['sample_stack_trace']), key=output_primary_key.stack_trace_key
+            ),
+            count_error=fields.get('count_error', 0),
+        )
+
+
+def merge_partial_reports(
+        *record_iterables: Iterable[SanitizerReportRecord]
+) -> Iterator[SanitizerReportRecord]:
+    """Merge any number of sorted record streams into a single sorted record stream.
+
+    Records with the same output primary key, eg. from partial reports that overlap on packages,
+    are combined by summing their counts and count errors. The sample stack trace is taken from the
+    last stream that has the key, matching how SanitizerLogParser keeps the most recently seen
+    sample.
+    """
+    merged_records = merge(*record_iterables, key=lambda record: record.output_primary_key)
+    for output_primary_key, records in groupby(
+        merged_records, key=lambda record: record.output_primary_key
+    ):
+        count = 0
+        count_error = 0
+        sample_stack_trace = None  # type: Optional[SanitizerSectionPartStackTrace]
+        for record in records:
+            count += record.count
+            count_error += record.count_error
+            sample_stack_trace = record.sample_stack_trace
+
+        assert sample_stack_trace is not None
+        yield SanitizerReportRecord(
+            output_primary_key=output_primary_key,
+            count=count,
+            sample_stack_trace=sample_stack_trace,
+            count_error=count_error,
+        )
@@ -0,0 +1,182 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Size limits for csv and xml reports.
+
+A report of thousands of keys, each with a full sample stack trace, can be too large for tools such
+as the Jenkins JUnit plugin to ingest. Limited reports keep the most frequent errors of each
+package, in order of decreasing count, and record how much was left out in a ReportTruncation.
+"""
+
+from heapq import heappop, heappush, nlargest
+from itertools import chain, groupby
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from colcon_sanitizer_reports._sanitizer_section_part_stack_trace import (
+    SanitizerSectionPartStackTrace
+)
+from colcon_sanitizer_reports.sanitizer_log_parser import (
+    DEGRADED_OUTPUT_NAME, SanitizerReportRecord
+)
+
+ReportLimits = NamedTuple(
+    'ReportLimits',
+    [
+        ('max_errors_per_package', Optional[int]),
+        ('max_stack_trace_lines', Optional[int]),
+        ('max_bytes', Optional[int]),
+    ]
+)
+ReportLimits.__new__.__defaults__ = (None, None, None)  # type: ignore
+
+ReportLimits.__doc__ = (
+    """Limits on the size of a report. A limit of None means unlimited.
+
+    max_errors_per_package:
+        The maximum number of errors, ie. output primary keys, reported for each package. The errors
+        with the largest counts are kept.
+
+    max_stack_trace_lines:
+        The maximum number of lines of each sample stack trace. Further lines are left out.
+
+    max_bytes:
+        The approximate maximum size of the report, as the text of the reported keys and sample
+        stack traces. The errors with the smallest counts across all packages are left out until
+        the rest fits.
+    """
+)
+
+
+class ReportTruncation:
+    """Counts what was left out of a report by limit_records()."""
+
+    def __init__(self) -> None:
+        """Initialize counts of nothing left out."""
+        # Number of errors, ie. output primary keys, that were left out.
+        self.omitted_error_count = 0
+
+        # Sum of the counts of the errors that were left out.
+        self.omitted_occurrence_count = 0
+
+        # Number of sample stack trace lines that were left out of the errors that were reported.
+        self.omitted_stack_trace_line_count = 0
+
+    @property
+    def is_truncated(self) -> bool:
+        """Return True if anything was left out of the report."""
+        return bool(self.omitted_error_count or self.omitted_stack_trace_line_count)
+
+
+def _get_size(record: SanitizerReportRecord) -> int:
+    return sum(len(field) + 1 for field in record.output_primary_key) + \
+        sum(len(line) + 1 for line in record.sample_stack_trace.lines)
+
+
+def limit_records(
+        records: Iterable[SanitizerReportRecord], limits: ReportLimits,
+        truncation: ReportTruncation
+) -> Iterator[SanitizerReportRecord]:
+    """Apply limits to records, which must be sorted by output primary key.
+
+    The records of each package are returned in order of decreasing count, with the largest counts
+    selected from a heap when there are more than max_errors_per_package. Only the records of a
+    single package are held in memory at a time, and with max_bytes, the records that fit in
+    max_bytes. What was left out is added to truncation. Records that mark degraded packages, see
+    DEGRADED_OUTPUT_NAME, are always kept.
+    """
+    package_records = _limit_package_records(records, limits, truncation)
+    if limits.max_bytes is None:
+        return package_records
+
+    return _limit_size(package_records, limits.max_bytes, truncation)
+
+
+def _is_degraded_mark(record: SanitizerReportRecord) -> bool:
+    return record.output_primary_key.error_name == DEGRADED_OUTPUT_NAME
+
+
+def _limit_package_records(
+        records: Iterable[SanitizerReportRecord], limits: ReportLimits,
+        truncation: ReportTruncation
+) -> Iterator[SanitizerReportRecord]:
+    for _, package_record_iterator in groupby(
+        records, key=lambda record: record.output_primary_key.package
+    ):
+        package_records = []  # type: List[SanitizerReportRecord]
+        for record in package_record_iterator:
+            if _is_degraded_mark(record):
+                yield record
+            else:
+                package_records.append(record)
+
+        # Records of equal count stay in output primary key order.
+        if limits.max_errors_per_package is not None and \
+                len(package_records) > limits.max_errors_per_package:
+            kept_records = nlargest(
+                limits.max_errors_per_package, package_records, key=lambda record: record.count
+            )  # type: List[SanitizerReportRecord]
+            truncation.omitted_error_count += len(package_records) - len(kept_records)
+            truncation.omitted_occurrence_count += \
+                sum(record.count for record in package_records) - \
+                sum(record.count for record in kept_records)
+        else:
+            kept_records = sorted(package_records, key=lambda record: record.count, reverse=True)
+
+        for record in kept_records:
+            lines = record.sample_stack_trace.lines
+            if limits.max_stack_trace_lines is not None and \
+                    len(lines) > limits.max_stack_trace_lines:
+                truncation.omitted_stack_trace_line_count += \
+                    len(lines) - limits.max_stack_trace_lines
+                record = record._replace(sample_stack_trace=SanitizerSectionPartStackTrace(
+                    lines[:limits.max_stack_trace_lines],
+                    key=record.sample_stack_trace.key,
+                ))
+
+            yield record
+
+
+def _limit_size(
+        records: Iterable[SanitizerReportRecord], max_bytes: int, truncation: ReportTruncation
+) -> Iterator[SanitizerReportRecord]:
+    """Keep the records with the largest counts that fit in max_bytes, grouped by package."""
+    # Min-heap of (count, -record index, size, record) of the kept records, so that the smallest
+    # count, and of equal counts the last record, is left out first.
+    heap = []  # type: List[Tuple[int, int, int, SanitizerReportRecord]]
+    size = 0
+    marks = []  # type: List[Tuple[int, int, int, SanitizerReportRecord]]
+    for record_i, record in enumerate(records):
+        if _is_degraded_mark(record):
+            marks.append((record.count, -record_i, 0, record))
+            continue
+
+        record_size = _get_size(record)
+        if record_size > max_bytes:
+            truncation.omitted_error_count += 1
+            truncation.omitted_occurrence_count += record.count
+            continue
+
+        heappush(heap, (record.count, -record_i, record_size, record))
+        size += record_size
+        while size > max_bytes:
+            _, _, omitted_size, omitted_record = heappop(heap)
+            size -= omitted_size
+            truncation.omitted_error_count += 1
+            truncation.omitted_occurrence_count += omitted_record.count
+
+    # The records of each package stay in the order they came in.
+    for entry in sorted(
+        chain(marks, heap), key=lambda entry: (entry[3].output_primary_key.package, -entry[1])
+    ):
+        yield entry[3]
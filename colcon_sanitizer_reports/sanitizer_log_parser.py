@@ -12,27 +12,95 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import csv
+import gzip
+import heapq
 from io import StringIO
+from itertools import chain
+import os
 import re
-from typing import Dict, List, NamedTuple, Pattern
+import sys
+from tempfile import mkstemp, TemporaryDirectory
+import time
+from typing import (
+    Dict, Iterable, Iterator, List, NamedTuple, Optional, Pattern, Set, TextIO, Tuple,
+    TYPE_CHECKING
+)
 
-from colcon_sanitizer_reports._sanitizer_section import SanitizerSection
+from colcon_sanitizer_reports._sanitizer_section import get_error_name, SanitizerSection
+from colcon_sanitizer_reports._sanitizer_section_part import SanitizerSectionPart
 from colcon_sanitizer_reports._sanitizer_section_part_stack_trace import (
-    SanitizerSectionPartStackTrace
+    find_stack_trace_key, SanitizerSectionPartStackTrace
 )
+from colcon_sanitizer_reports._space_saving_counter import SpaceSavingCounter
+from colcon_sanitizer_reports.suppressions import SanitizerSuppressions
+
+if TYPE_CHECKING:
+    from colcon_sanitizer_reports._log_file_chunks import ChunkResult  # noqa: F401
+    from colcon_sanitizer_reports.report_limits import (  # noqa: F401
+        ReportLimits, ReportTruncation
+    )
+    from colcon_sanitizer_reports.symbolizer import SanitizerSymbolizer  # noqa: F401
 
 # The start line of a section can be found with the following regex. Additionally, any prefix that
 # is prepended by the logging system can be extracted and be used to lstrip following section lines.
 _FIND_SECTION_START_LINE_REGEX = \
-    re.compile(r'^(?P<prefix>.*?)(==\d+==|)(WARNING|ERROR):.*Sanitizer:.*$')
+    re.compile(r'^(?P<prefix>.*?)(==(?P<pid>\d+)==|)(WARNING|ERROR):.*Sanitizer:.*$')
+
+# ThreadSanitizer start lines have the process id at the end instead, eg.
+# "WARNING: ThreadSanitizer: data race (pid=1234)".
+_FIND_SECTION_START_LINE_PID_REGEX = re.compile(r'\(pid=(?P<pid>\d+)\)$')
+
+# Some section lines, with any prefix removed, begin with the process id of the sanitizer that
+# writes them.
+_FIND_SECTION_LINE_PID_REGEX = re.compile(r'^==(?P<pid>\d+)==')
+
+# Processes that share a prefix, eg. several processes of the same test, can write sections at the
+# same time. At most this many sections are kept open for a prefix, so that sections of processes
+# that died before writing their SUMMARY line are eventually dropped.
+_MAX_OPEN_SECTIONS_PER_PREFIX = 16
 
 # The end line of a section can be found with the following regex. Additionally, any prefix that is
 # prepended by the logging system can be extracted and be used to match the common prefix of the
 # section to which the end line belongs.
 _FIND_SECTION_END_LINE_REGEX = re.compile(r'^(?P<prefix>.*)(SUMMARY: .*Sanitizer: .*)$')
 
+# Memory used by each output key or stored stack trace besides its strings, eg. for dict entries
+# and tuples, as estimated for max_memory_bytes.
+_MEMORY_OVERHEAD_BYTES_PER_ENTRY = 256
+
+# Once this many runs have been spilled to disk, they are merged into a single run, so that the
+# final merge never has more than this many files open.
+_MAX_SPILLED_RUNS = 64
+
+# With a symbolizer, stack traces with unsymbolized frames are symbolized in batches of this many.
+_SYMBOLIZE_BATCH_SIZE = 1024
+
+# With a time budget, the time is checked once per this many lines.
+_TIME_BUDGET_CHECK_LINES = 1024
+
+# Log files are parsed in chunks of at least this many bytes when parsing with multiple jobs.
+_MIN_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Stack trace frame lines of a section, with any prefix removed, match the following pattern.
+_FIND_STACK_TRACE_FRAME_LINE_REGEX = re.compile(r'^\s+#\d+\s')
+
+# Sections of these error names report a separate error in each section part, eg. one part per
+# leak, so suppressions are matched against each part rather than against the whole section.
+_ERROR_NAMES_WITH_AN_ERROR_PER_SECTION_PART = ('detected memory leaks',)
+
+# UndefinedBehaviorSanitizer reports each error on a single line with the following pattern, rather
+# than in a section. Lines without RUNTIME_ERROR_SUBSTRING are skipped before trying the regex.
+_RUNTIME_ERROR_SUBSTRING = ': runtime error: '
+_FIND_RUNTIME_ERROR_LINE_REGEX = re.compile(
+    r'^(?P<prefix>.*?)(?P<line>(?P<location>\S+): runtime error: (?P<message>.*))$'
+)
+
+# The kind of a runtime error is its message up to the first ':', with numbers and addresses, which
+# are changeable between otherwise identical runtime errors, masked with the following pattern.
+_FIND_RUNTIME_ERROR_KIND_SUB_REGEX = re.compile(r'\b(0x[\da-f]+|\d+)\b')
+
 
 SanitizerLogParserOutputPrimaryKey = NamedTuple(
     'SanitizerLogParserOutputPrimaryKey',
@@ -66,6 +134,207 @@ SanitizerLogParserOutputPrimaryKey.__doc__ = (
     """
 )
 
+# An output that is held back until it is symbolized, with its count.
+_UnsymbolizedOutput = Tuple[SanitizerLogParserOutputPrimaryKey, SanitizerSectionPartStackTrace, int]
+
+SanitizerReportRecord = NamedTuple(
+    'SanitizerReportRecord',
+    [
+        ('output_primary_key', SanitizerLogParserOutputPrimaryKey),
+        ('count', int),
+        ('sample_stack_trace', SanitizerSectionPartStackTrace),
+        ('count_error', int),
+    ]
+)
+SanitizerReportRecord.__new__.__defaults__ = (0,)  # type: ignore
+
+SanitizerReportRecord.__doc__ = (
+    """A single line of SanitizerLogParser report output.
+
+    Records are produced in output_primary_key order by SanitizerLogParser.get_records() and by
+    partial report readers, so any number of them can be merged and written as a stream.
+
+    After initialization, SanitizerReportRecord includes the following data members.
+
+    output_primary_key:
+        The SanitizerLogParserOutputPrimaryKey that this record reports.
+
+    count:
+        The count of times the output_primary_key occurred.
+
+    sample_stack_trace:
+        One of the stack traces that matched the output_primary_key.
+
+    count_error:
+        Zero when count is exact. Otherwise, count is approximate and the true count is within
+        count_error of count. See SanitizerLogParser max_keys_per_package.
+    """
+)
+
+SanitizerLogParserStats = NamedTuple(
+    'SanitizerLogParserStats',
+    [
+        ('parsed_line_count', int),
+        ('parsed_character_count', int),
+        ('open_section_count', int),
+        ('evicted_key_count', int),
+        ('spilled_run_count', int),
+    ]
+)
+
+SanitizerLogParserStats.__doc__ = (
+    """Statistics of the work done by a SanitizerLogParser so far.
+
+    parsed_line_count:
+        The count of log lines parsed.
+
+    parsed_character_count:
+        The count of characters of the log lines parsed, including line endings.
+
+    open_section_count:
+        The count of sanitizer sections whose end line has not been parsed yet.
+
+    evicted_key_count:
+        In approximate mode, the count of output keys that were dropped to make room for others.
+
+    spilled_run_count:
+        The count of sorted runs currently spilled to disk. See max_memory_bytes.
+    """
+)
+
+# In approximate mode, occurrences that can not be attributed to one of the reported keys of a
+# package are folded into a record with this error_name and stack_trace_key.
+OTHER_OUTPUT_NAME = '(other)'
+
+# Once the time budget for parsing a log file runs out, sanitizer errors in the rest of the log are
+# counted by error_name only, under this stack_trace_key. The csv, xml and partial reports mark each
+# package whose log was parsed that way with a record that has this error_name and stack_trace_key,
+# and a count of 0.
+DEGRADED_OUTPUT_NAME = '(degraded)'
+
+
+SanitizerSuppressionHitKey = NamedTuple(
+    'SanitizerSuppressionHitKey',
+    [
+        ('package', str),
+        ('error_name', str),
+        ('suppression', str),
+    ]
+)
+
+SanitizerSuppressionHitKey.__doc__ = (
+    """SanitizerLogParser suppression hit counts are keyed on these fields.
+
+    package:
+        Name of the ros2 package where the suppressed error occurred.
+
+    error_name:
+        Name of the suppressed sanitizer error.
+
+    suppression:
+        The line of the suppression file that matched.
+    """
+)
+
+
+def _add_degraded_records(
+        records: Iterable[SanitizerReportRecord], degraded_packages: Iterable[str]
+) -> Iterator[SanitizerReportRecord]:
+    """Add a DEGRADED_OUTPUT_NAME record for each of degraded_packages to records.
+
+    Records must be sorted by package. Each added record comes before the records of its package.
+    """
+    degraded_records = [
+        SanitizerReportRecord(
+            output_primary_key=SanitizerLogParserOutputPrimaryKey(
+                package=package,
+                error_name=DEGRADED_OUTPUT_NAME,
+                stack_trace_key=DEGRADED_OUTPUT_NAME,
+            ),
+            count=0,
+            sample_stack_trace=SanitizerSectionPartStackTrace((), key=DEGRADED_OUTPUT_NAME),
+            count_error=0,
+        )
+        for package in sorted(degraded_packages)
+    ]
+
+    # Ties go to the first iterable, so each added record comes first.
+    return heapq.merge(
+        degraded_records, records, key=lambda record: record.output_primary_key.package
+    )
+
+
+def _get_memory_size(strings: Iterable[str]) -> int:
+    return _MEMORY_OVERHEAD_BYTES_PER_ENTRY + sum(sys.getsizeof(string) for string in strings)
+
+
+def write_csv_report(
+        records: Iterable[SanitizerReportRecord], f_out: TextIO, *,
+        with_count_error: bool = False, inline_stack_traces: bool = True
+) -> None:
+    """Write a csv representation of the given records to f_out, one row at a time.
+
+    If with_count_error is True, a count_error column is added after the sample_stack_trace column.
+
+    If inline_stack_traces is False, the sample_stack_trace column is replaced by a
+    sample_stack_trace_hash column that references the stack traces written by
+    write_stack_traces_csv().
+    """
+    writer = csv.writer(f_out)
+    writer.writerow([
+        *SanitizerLogParserOutputPrimaryKey._fields, 'count',
+        'sample_stack_trace' if inline_stack_traces else 'sample_stack_trace_hash',
+        *(('count_error',) if with_count_error else ())
+    ])
+    for record in records:
+        writer.writerow([
+            *record.output_primary_key, record.count,
+            '\n'.join(record.sample_stack_trace.lines) if inline_stack_traces
+            else record.sample_stack_trace.content_hash,
+            *((record.count_error,) if with_count_error else ())
+        ])
+
+
+def open_csv_report(path: str) -> TextIO:
+    """Open a csv report file for writing, gzip-compressed if path ends with '.gz'."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')  # type: ignore
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_stack_traces_csv(records: Iterable[SanitizerReportRecord], f_out: TextIO) -> None:
+    """Write each distinct sample stack trace of the given records once, keyed by its hash.
+
+    This is the side file for reports written with inline_stack_traces=False. Only the hashes of
+    stack traces that were already written are held in memory.
+    """
+    writer = csv.writer(f_out)
+    writer.writerow(['stack_trace_hash', 'stack_trace'])
+    written_stack_trace_hashes = set()  # type: Set[str]
+    for record in records:
+        stack_trace_hash = record.sample_stack_trace.content_hash
+        if stack_trace_hash not in written_stack_trace_hashes:
+            writer.writerow([stack_trace_hash, '\n'.join(record.sample_stack_trace.lines)])
+            written_stack_trace_hashes.add(stack_trace_hash)
+
+
+class _OpenSection:
+    """Lines gathered so far for a sanitizer section that does not have its SUMMARY line yet.
+
+    When suppressions are given, the frames of the first stack trace of the section are matched
+    against them as they arrive. Once a section is suppressed, its lines are no longer kept.
+    Sections that report an error per section part are matched once they are complete instead.
+    """
+
+    __slots__ = ('lines', 'error_name', 'suppression', 'is_matching_suppressions', 'frame_count')
+
+    def __init__(self) -> None:
+        self.lines = []  # type: List[str]
+        self.error_name = None  # type: Optional[str]
+        self.suppression = None  # type: Optional[str]
+        self.is_matching_suppressions = False
+        self.frame_count = 0
+
 
 class SanitizerLogParser:
     """Parses sanitizer error and warning sections from a log and generates a summary report.
@@ -94,85 +363,1033 @@ class SanitizerLogParser:
     XML output is a xUnit-style Jenkins compatible string. Packages present in
     SanitizerLogParserOutputPrimaryKey are `testcases` in the xml string, and each sanitizer
     warning and error is an `error`. Stack trace key and error count are attributes of the error.
+
+    Sample stack traces:
+        The same stack trace, eg. of a data race in a widely used library, is often the sample of
+        many keys and packages. Sample stack traces are stored once per distinct content, by
+        content hash. CSV and XML output can reference them by hash instead of repeating them,
+        with the stack traces written once to a side file by get_stack_traces_csv().
+
+    Approximate mode:
+        A log with broken symbolization can have a different stack trace key for nearly every
+        sanitizer error, so that the report grows without bound. If max_keys_per_package is given,
+        only the max_keys_per_package most frequent keys of each package are counted, with a
+        SpaceSavingCounter, and memory use is fixed. Reported counts are then lower bounds and the
+        true count of each key may be larger by up to the count_error column/attribute. The
+        remaining occurrences of each package are reported under the OTHER_OUTPUT_NAME key, so
+        that the counts of a package still add up to its true total.
+
+    UndefinedBehaviorSanitizer runtime errors:
+        UndefinedBehaviorSanitizer prints each runtime error on a single line such as
+        "foo.cpp:12:5: runtime error: signed integer overflow: ...", which may repeat millions of
+        times when errors do not halt the test. These lines are counted directly without building
+        a section. The error_name is the kind of runtime error ("signed integer overflow") and the
+        stack_trace_key is its source location ("foo.cpp:12:5"). The sample of a runtime error is
+        the first line that reported it.
+
+    Interleaved sections:
+        Sections of concurrent tests are told apart by the prefix that the logging system prepends
+        to each line. Sections of processes that share a prefix, or of logs without any prefix, are
+        told apart by the "==1234==" process id markers of their lines, with unmarked lines
+        belonging to the process that wrote the last marker. Each line is matched to its section
+        with a few dict lookups, no matter how many sections are open.
+
+    Time budget:
+        If parse_log_file() is given a time_budget and it runs out, the rest of the log file is
+        parsed in a degraded mode that finds section header lines by substring and counts them by
+        error_name under the DEGRADED_OUTPUT_NAME stack_trace_key, with the header line as the
+        sample. Stack traces are not extracted, so the report is still produced on time. CSV, XML
+        and partial report output mark such packages, even if they have no errors, with a record
+        that has DEGRADED_OUTPUT_NAME as its error_name. XML output marks their test cases with
+        degraded="true" instead. See degraded_packages.
+
+    Report limits:
+        CSV and XML output can be limited in size with ReportLimits, eg. to keep only the most
+        frequent errors of each package. Limited output lists the errors of each package in order
+        of decreasing count, and XML output records how much was left out.
+
+    Suppressions:
+        Known, accepted errors can be dropped with SanitizerSuppressions. The frames of the first
+        stack trace of each section are matched against them as soon as they are parsed, and a
+        suppressed section skips the rest of parsing and is not part of the report. Sections that
+        report an error per part, like the leaks of a "detected memory leaks" section, are matched
+        part by part once they are complete, and only the suppressed parts are left out. Suppression
+        hit counts are reported separately by get_suppressions_csv().
+
+    Spilling to disk:
+        If max_memory_bytes is given, the counts and sample stack traces of all output keys are
+        written to a temporary file as a sorted run, in the partial report format, and dropped from
+        memory whenever they use more than about max_memory_bytes. Records are then produced by a
+        streaming merge of the runs and what is still in memory, so memory use stays bounded no
+        matter how many distinct keys a log has. Counts are unchanged, but the sample of a key that
+        was seen both before and after a spill is the one seen last. Spilling can not be combined
+        with approximate mode, whose memory use is fixed already.
+
+    Symbolization:
+        If a SanitizerSymbolizer is given, relevant stack traces with frames that the sanitizer
+        could not symbolize are held back, and symbolized in batches once _SYMBOLIZE_BATCH_SIZE of
+        them are held or records are produced. Each is then counted under the key of its symbolized
+        frames, so that errors that only differ in their unsymbolized frames are told apart.
+        Suppressions are matched against the frames as they were written.
     """
 
-    from colcon_sanitizer_reports.xml_output_generator import XmlOutputGenerator
+    @property
+    def is_approximate(self) -> bool:
+        """Return True if only the most frequent keys of each package are counted."""
+        return self._counter_by_package is not None
 
-    def __init__(self) -> None:
+    @property
+    def degraded_packages(self) -> Set[str]:
+        """Return the packages whose log was partly parsed in degraded mode."""
+        return set(self._degraded_packages)
+
+    def __init__(
+            self, *,
+            max_keys_per_package: Optional[int] = None,
+            suppressions: Optional[SanitizerSuppressions] = None,
+            max_memory_bytes: Optional[int] = None,
+            symbolizer: Optional['SanitizerSymbolizer'] = None
+    ) -> None:
         """Initialize sanitizer report sections."""
+        if max_keys_per_package is not None and max_memory_bytes is not None:
+            raise ValueError('max_keys_per_package and max_memory_bytes can not be combined.')
+
         # Holds count of errors seen for each output key.
         self._count_by_output_primary_key = defaultdict(int) \
             # type: Dict[SanitizerLogParserOutputPrimaryKey, int]
 
-        self._sample_stack_trace_by_output_primary_key = {} \
-            # type: Dict[SanitizerLogParserOutputPrimaryKey, SanitizerSectionPartStackTrace]
+        # In approximate mode, holds counts of the most frequent output keys for each package
+        # instead.
+        self._max_keys_per_package = max_keys_per_package  # type: Optional[int]
+        self._counter_by_package = None \
+            # type: Optional[Dict[str, SpaceSavingCounter[SanitizerLogParserOutputPrimaryKey]]]
+        if max_keys_per_package is not None:
+            self._counter_by_package = {}
+
+        # Sample stack traces are stored once per distinct content hash, with the number of output
+        # keys that reference them, so that they are dropped once no key references them.
+        self._sample_stack_trace_hash_by_output_primary_key = {} \
+            # type: Dict[SanitizerLogParserOutputPrimaryKey, str]
+        self._stack_trace_by_hash = {}  # type: Dict[str, SanitizerSectionPartStackTrace]
+        self._reference_count_by_stack_trace_hash = {}  # type: Dict[str, int]
+
+        # If max_memory_bytes is given, the estimated memory use of output keys and stored stack
+        # traces is tracked, and they are spilled to sorted runs in spill_directory once it is
+        # exceeded.
+        self._max_memory_bytes = max_memory_bytes  # type: Optional[int]
+        self._memory_bytes = 0  # type: int
+        self._spill_directory = None  # type: Optional[TemporaryDirectory]
+        self._spilled_run_paths = []  # type: List[str]
+
+        # The packages with records in each spilled run, so that the records of a single package
+        # are merged from only the runs that have any.
+        self._spilled_run_packages = []  # type: List[Set[str]]
+
+        # Statistics, see get_stats().
+        self._parsed_line_count = 0  # type: int
+        self._parsed_character_count = 0  # type: int
+        self._evicted_key_count = 0  # type: int
+
+        # Packages whose log was partly parsed in degraded mode, see parse_log_file().
+        self._degraded_packages = set()  # type: Set[str]
 
         # Current package output that is being parsed.
         self._package = ''  # type: str
 
-        # We keep lines for partially-gathered sanitizer sections here. Incoming lines that match
-        # one of the find_line_regexes is appended to the associated list of lines.
-        self._lines_by_find_line_regex = {}  # type: Dict[Pattern, List[str]]
+        # We keep lines for partially-gathered sanitizer sections here, by prefix and then by
+        # process id, in order of the last line with a process id marker. See parse_line().
+        self._open_sections_by_prefix = {} \
+            # type: Dict[str, OrderedDict[str, _OpenSection]]
+
+        # Lengths of the prefixes of open sections, longest first.
+        self._open_section_prefix_lengths = []  # type: List[int]
+
+        self._suppressions = suppressions  # type: Optional[SanitizerSuppressions]
+
+        # Stack traces with unsymbolized frames that are held back until they are symbolized in a
+        # batch, with their output keys and counts.
+        self._symbolizer = symbolizer  # type: Optional[SanitizerSymbolizer]
+        self._unsymbolized_outputs = []  # type: List[_UnsymbolizedOutput]
+
+        # Holds count of sections dropped by each suppression.
+        self._count_by_suppression_hit_key = defaultdict(int) \
+            # type: Dict[SanitizerSuppressionHitKey, int]
+
+    def get_stats(self) -> SanitizerLogParserStats:
+        """Return statistics of the work done so far.
+
+        This is cheap and may be called from another thread while the parser is parsing, eg. to
+        export metrics.
+        """
+        return SanitizerLogParserStats(
+            parsed_line_count=self._parsed_line_count,
+            parsed_character_count=self._parsed_character_count,
+            open_section_count=sum(map(len, list(self._open_sections_by_prefix.values()))),
+            evicted_key_count=self._evicted_key_count,
+            spilled_run_count=len(self._spilled_run_paths),
+        )
+
+    def get_records(self, *, package: Optional[str] = None) -> Iterator[SanitizerReportRecord]:
+        """Return reported errors/warnings as records sorted by output primary key.
+
+        If package is given, only the records of that package are returned.
+        """
+        self._symbolize()
+        if not self._spilled_run_paths:
+            yield from self._get_memory_records(package)
+            return
+
+        # Imported here, since partial_report imports this module.
+        from colcon_sanitizer_reports.partial_report import merge_partial_reports
+
+        runs = [
+            (path, run_packages)
+            for path, run_packages in zip(self._spilled_run_paths, self._spilled_run_packages)
+            if package is None or package in run_packages
+        ]
+        for record in merge_partial_reports(
+            *(self._read_spilled_run(path, run_packages) for path, run_packages in runs),
+            self._get_memory_records(package),
+        ):
+            if package is None or record.output_primary_key.package == package:
+                yield record
+
+    def release_package(self, package: str) -> None:
+        """Drop the records of package, eg. once its reports are written.
+
+        Suppression hit counts and statistics are kept.
+        """
+        self._symbolize()
+        if self._counter_by_package is not None:
+            counter = self._counter_by_package.pop(package, None)
+            output_primary_keys = [
+                output_primary_key for output_primary_key, _, _ in counter.items()
+            ] if counter is not None else []
+        else:
+            output_primary_keys = [
+                output_primary_key for output_primary_key in self._count_by_output_primary_key
+                if output_primary_key.package == package
+            ]
+            for output_primary_key in output_primary_keys:
+                del self._count_by_output_primary_key[output_primary_key]
+
+        for output_primary_key in output_primary_keys:
+            self._release_stack_trace(
+                self._sample_stack_trace_hash_by_output_primary_key.pop(output_primary_key)
+            )
+            if self._max_memory_bytes is not None:
+                self._memory_bytes -= _get_memory_size(output_primary_key)
+
+        # Spilled runs are removed once no package with records in them is left.
+        spilled_runs = list(zip(self._spilled_run_paths, self._spilled_run_packages))
+        self._spilled_run_paths = []
+        self._spilled_run_packages = []
+        for run_path, run_packages in spilled_runs:
+            run_packages.discard(package)
+            if run_packages:
+                self._spilled_run_paths.append(run_path)
+                self._spilled_run_packages.append(run_packages)
+            else:
+                os.remove(run_path)
+
+        self._degraded_packages.discard(package)
 
-    def get_csv(self) -> str:
-        """Return a csv representation of reported error/warnings."""
+    def _get_memory_records(self, package: Optional[str]) -> Iterator[SanitizerReportRecord]:
+        if self._counter_by_package is not None:
+            yield from self._get_approximate_records(package)
+            return
+
+        output_primary_keys = self._count_by_output_primary_key.keys()  # type: Iterable
+        if package is not None:
+            output_primary_keys = [
+                output_primary_key for output_primary_key in output_primary_keys
+                if output_primary_key.package == package
+            ]
+        for output_primary_key in sorted(output_primary_keys):
+            yield SanitizerReportRecord(
+                output_primary_key=output_primary_key,
+                count=self._count_by_output_primary_key[output_primary_key],
+                sample_stack_trace=self._get_sample_stack_trace(output_primary_key),
+            )
+
+    def _get_approximate_records(
+            self, package: Optional[str]
+    ) -> Iterator[SanitizerReportRecord]:
+        assert self._counter_by_package is not None
+        packages = sorted(self._counter_by_package.keys())
+        if package is not None:
+            packages = [package] if package in self._counter_by_package else []
+        for package in packages:
+            counter = self._counter_by_package[package]
+            records = []  # type: List[SanitizerReportRecord]
+            other_count = counter.total
+            for output_primary_key, count, error in counter.items():
+                # Report the guaranteed lower bound of the count. The true count is at most error
+                # more.
+                records.append(SanitizerReportRecord(
+                    output_primary_key=output_primary_key,
+                    count=count - error,
+                    sample_stack_trace=self._get_sample_stack_trace(output_primary_key),
+                    count_error=error,
+                ))
+                other_count -= count - error
+
+            if other_count:
+                # The true number of occurrences of unreported keys is anywhere between zero and
+                # other_count.
+                other_output_primary_key = SanitizerLogParserOutputPrimaryKey(
+                    package=package,
+                    error_name=OTHER_OUTPUT_NAME,
+                    stack_trace_key=OTHER_OUTPUT_NAME,
+                )
+                records.append(SanitizerReportRecord(
+                    output_primary_key=other_output_primary_key,
+                    count=other_count,
+                    sample_stack_trace=SanitizerSectionPartStackTrace(
+                        (), key=OTHER_OUTPUT_NAME
+                    ),
+                    count_error=other_count,
+                ))
+
+            yield from sorted(records, key=lambda record: record.output_primary_key)
+
+    @staticmethod
+    def _read_spilled_run(path: str, packages: Set[str]) -> Iterator[SanitizerReportRecord]:
+        from colcon_sanitizer_reports.partial_report import read_partial_report
+
+        # Records of packages that were released since the run was spilled are left out.
+        with open(path, 'r', encoding='utf-8') as run_f_in:
+            for record in read_partial_report(run_f_in):
+                if record.output_primary_key.package in packages:
+                    yield record
+
+    def _spill(self) -> None:
+        """Write all output keys in memory to a sorted run on disk and drop them from memory."""
+        from colcon_sanitizer_reports.partial_report import write_partial_report
+
+        if self._spill_directory is None:
+            self._spill_directory = TemporaryDirectory(prefix='colcon-sanitizer-reports-')
+
+        # With too many runs, all runs and what is in memory are merged into a single new run.
+        merge_runs = len(self._spilled_run_paths) >= _MAX_SPILLED_RUNS
+        packages = {
+            output_primary_key.package for output_primary_key in self._count_by_output_primary_key
+        }
+        if merge_runs:
+            packages.update(*self._spilled_run_packages)
+        run_fd, path = mkstemp(suffix='.jsonl', dir=self._spill_directory.name)
+        with open(run_fd, 'w', encoding='utf-8') as run_f_out:
+            write_partial_report(
+                self.get_records() if merge_runs else self._get_memory_records(None), run_f_out
+            )
+
+        if merge_runs:
+            for run_path in self._spilled_run_paths:
+                os.remove(run_path)
+            self._spilled_run_paths = []
+            self._spilled_run_packages = []
+        self._spilled_run_paths.append(path)
+        self._spilled_run_packages.append(packages)
+
+        self._count_by_output_primary_key.clear()
+        self._sample_stack_trace_hash_by_output_primary_key.clear()
+        self._stack_trace_by_hash.clear()
+        self._reference_count_by_stack_trace_hash.clear()
+        self._memory_bytes = 0
+
+    def _get_sample_stack_trace(
+            self, output_primary_key: SanitizerLogParserOutputPrimaryKey
+    ) -> SanitizerSectionPartStackTrace:
+        return self._stack_trace_by_hash[
+            self._sample_stack_trace_hash_by_output_primary_key[output_primary_key]
+        ]
+
+    def _get_limited_records(
+            self, limits: Optional['ReportLimits'], truncation: Optional['ReportTruncation'], *,
+            package: Optional[str] = None
+    ) -> Iterable[SanitizerReportRecord]:
+        if limits is None:
+            return self._get_marked_records(package)
+
+        # Imported here, since report_limits imports this module.
+        from colcon_sanitizer_reports.report_limits import limit_records, ReportTruncation
+
+        # Limits never leave out the records that mark degraded packages.
+        return limit_records(
+            self._get_marked_records(package), limits,
+            truncation if truncation is not None else ReportTruncation()
+        )
+
+    def _get_marked_records(self, package: Optional[str]) -> Iterator[SanitizerReportRecord]:
+        """Return get_records() with a record that marks each degraded package.
+
+        Packages are marked even if they have no errors, see DEGRADED_OUTPUT_NAME.
+        """
+        return _add_degraded_records(self.get_records(package=package), (
+            degraded_package for degraded_package in self._degraded_packages
+            if package is None or degraded_package == package
+        ))
+
+    def get_csv(
+            self, *,
+            inline_stack_traces: bool = True,
+            limits: Optional['ReportLimits'] = None,
+            truncation: Optional['ReportTruncation'] = None
+    ) -> str:
+        """Return a csv representation of reported error/warnings.
+
+        If inline_stack_traces is False, sample stack traces are referenced by hash. See
+        get_stack_traces_csv().
+
+        If limits are given, what was left out of the csv is added to truncation, if given.
+        """
+        csv_f_out = StringIO()
+        self.write_csv(
+            csv_f_out,
+            inline_stack_traces=inline_stack_traces, limits=limits, truncation=truncation,
+        )
+
+        return csv_f_out.getvalue()
+
+    def write_csv(
+            self,
+            f_out: TextIO, *,
+            inline_stack_traces: bool = True,
+            limits: Optional['ReportLimits'] = None,
+            truncation: Optional['ReportTruncation'] = None
+    ) -> None:
+        """Write a csv representation of reported errors/warnings to f_out, one row at a time.
+
+        Unlike get_csv(), the report is never held in memory as a whole. Use open_csv_report() to
+        write a gzip-compressed report. See get_csv() for the arguments.
+        """
+        write_csv_report(
+            self._get_limited_records(limits, truncation), f_out,
+            with_count_error=self.is_approximate, inline_stack_traces=inline_stack_traces,
+        )
+
+    def write_partial(self, f_out: TextIO, *, package: Optional[str] = None) -> None:
+        """Write a partial report of reported errors/warnings to f_out, one record at a time.
+
+        Like the csv and xml reports, the partial report marks degraded packages. If package is
+        given, only the records of that package are written.
+        """
+        # Imported here, since partial_report imports this module.
+        from colcon_sanitizer_reports.partial_report import write_partial_report
+
+        write_partial_report(self._get_marked_records(package), f_out)
+
+    def get_global_csv(self) -> str:
+        """Return a csv representation of reported errors/warnings with one line per global key.
+
+        Errors of all packages that share an error_name and stack_trace_key are reported on a
+        single line that lists the packages. See global_report for details.
+        """
+        csv_f_out = StringIO()
+        self.write_global_csv(csv_f_out)
+
+        return csv_f_out.getvalue()
+
+    def write_global_csv(self, f_out: TextIO) -> None:
+        """Write a csv representation with one line per global key to f_out.
+
+        See get_global_csv() for details.
+        """
+        # Imported here, since global_report imports this module.
+        from colcon_sanitizer_reports.global_report import (
+            get_global_records, write_global_csv_report
+        )
+
+        write_global_csv_report(
+            get_global_records(self.get_records()), f_out, with_count_error=self.is_approximate
+        )
+
+    def get_stack_traces_csv(self, *, limits: Optional['ReportLimits'] = None) -> str:
+        """Return a csv representation of distinct sample stack traces, keyed by hash.
+
+        The same limits as for get_csv() and get_xml() must be given, so that the hashes match.
+        """
+        csv_f_out = StringIO()
+        self.write_stack_traces_csv(csv_f_out, limits=limits)
+
+        return csv_f_out.getvalue()
+
+    def write_stack_traces_csv(
+            self, f_out: TextIO, *, limits: Optional['ReportLimits'] = None
+    ) -> None:
+        """Write a csv representation of distinct sample stack traces to f_out, one row at a time.
+
+        See get_stack_traces_csv() for the arguments.
+        """
+        write_stack_traces_csv(self._get_limited_records(limits, None), f_out)
+
+    def get_suppressions_csv(self) -> str:
+        """Return a csv representation of suppressed error/warning counts."""
         csv_f_out = StringIO()
         writer = csv.writer(csv_f_out)
-        writer.writerow([
-            *SanitizerLogParserOutputPrimaryKey._fields, 'count', 'sample_stack_trace'
-        ])
-        for output_primary_key, count in self._count_by_output_primary_key.items():
-            sample_stack_trace = self._sample_stack_trace_by_output_primary_key[output_primary_key]
-            writer.writerow([*output_primary_key, count, '\n'.join(sample_stack_trace.lines)])
+        writer.writerow([*SanitizerSuppressionHitKey._fields, 'count'])
+        for suppression_hit_key in sorted(self._count_by_suppression_hit_key.keys()):
+            writer.writerow([
+                *suppression_hit_key, self._count_by_suppression_hit_key[suppression_hit_key]
+            ])
 
         return csv_f_out.getvalue()
 
-    def get_xml(self) -> str:
-        """Return a xml representation of reported errors/warnings."""
-        return self.XmlOutputGenerator(self._count_by_output_primary_key,
-                                       self._sample_stack_trace_by_output_primary_key).xml_string
+    def get_xml(
+            self, *, inline_stack_traces: bool = True, limits: Optional['ReportLimits'] = None
+    ) -> str:
+        """Return a xml representation of reported errors/warnings.
+
+        If inline_stack_traces is False, sample stack traces are referenced by hash. See
+        get_stack_traces_csv().
+
+        If limits are given, the xml records how much was left out of it.
+        """
+        # Imported here, since xml_output_generator imports this module, and xml.dom.minidom is
+        # only needed for xml output.
+        from colcon_sanitizer_reports.report_limits import ReportTruncation
+        from colcon_sanitizer_reports.xml_output_generator import XmlOutputGenerator
+
+        truncation = ReportTruncation()
+        records = list(self._get_limited_records(limits, truncation))
+        return XmlOutputGenerator(
+            {record.output_primary_key: record.count for record in records},
+            {record.output_primary_key: record.sample_stack_trace for record in records},
+            {record.output_primary_key: record.count_error for record in records},
+            inline_stack_traces=inline_stack_traces,
+            truncation=truncation,
+        ).xml_string
+
+    def write_xml(
+            self,
+            f_out: TextIO, *,
+            package: Optional[str] = None,
+            inline_stack_traces: bool = True,
+            limits: Optional['ReportLimits'] = None
+    ) -> None:
+        """Write a xml representation of reported errors/warnings to f_out, one package at a time.
+
+        If package is given, only the errors/warnings of that package are written, eg. for a JUnit
+        file per package. See get_xml() for the other arguments.
+        """
+        # Imported here, since xml_output_generator imports this module.
+        from colcon_sanitizer_reports.report_limits import ReportTruncation
+        from colcon_sanitizer_reports.xml_output_generator import write_xml_report
+
+        truncation = ReportTruncation()
+        write_xml_report(
+            self._get_limited_records(limits, truncation, package=package), f_out,
+            inline_stack_traces=inline_stack_traces, truncation=truncation,
+        )
 
     def set_package(self, package: str) -> None:
         """Set the package name to which each sanitizer error/warning belongs."""
         self._package = package
 
+    def parse_log_file(
+            self, path: str, *,
+            jobs: int = 1,
+            min_chunk_size: int = _MIN_CHUNK_SIZE,
+            time_budget: Optional[float] = None
+    ) -> bool:
+        """Parse a whole colcon test log file, optionally in parallel.
+
+        With more than one job, a log file larger than min_chunk_size is split into chunks on line
+        boundaries that are parsed in worker processes. Sections that cross chunk boundaries are
+        stitched together, so that the result is identical to parsing the file line by line.
+
+        If time_budget is given and parsing takes more than time_budget seconds, the rest of the
+        file is parsed in degraded mode, see the class docstring. Return True if it was.
+        """
+        from colcon_sanitizer_reports._log_file_chunks import (
+            ChunkParser, get_chunk_ranges, read_lines
+        )
+
+        # Lines are decoded as UTF-8, replacing any bytes that are not valid UTF-8.
+        size = os.path.getsize(path)
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+        chunk_ranges = get_chunk_ranges(path, jobs, min_chunk_size) if jobs > 1 else []
+        if len(chunk_ranges) < 2:
+            return self._parse_lines(read_lines(path, 0, size), deadline)
+
+        chunk_parser = ChunkParser(
+            path, chunk_ranges, jobs=jobs, package=self._package, suppressions=self._suppressions
+        )
+        try:
+            # Results are stitched in order as they arrive, while later chunks are still being
+            # parsed.
+            for chunk_i, (begin, end) in enumerate(chunk_ranges):
+                result = chunk_parser.get_result(
+                    chunk_i,
+                    timeout=max(0.0, deadline - time.monotonic()) if deadline is not None else None,
+                )
+                if result is None:
+                    self._parse_degraded_lines(read_lines(path, begin, size))
+                    return True
+
+                is_stitched = \
+                    self._stitch_chunk_result(read_lines(path, begin, end), result, deadline)
+                if is_stitched is None:
+                    # The deadline passed while the chunk was parsed again.
+                    chunk_parser.close()
+                    self._parse_degraded_lines(read_lines(path, end, size))
+                    return True
+
+                if not is_stitched:
+                    # A section stayed open for the whole chunk, so the chunk was parsed twice. The
+                    # rest of the file is parsed sequentially rather than risk that again.
+                    chunk_parser.close()
+                    return self._parse_lines(read_lines(path, end, size), deadline)
+        finally:
+            chunk_parser.close()
+
+        return False
+
+    def _parse_lines(self, lines: Iterator[str], deadline: Optional[float]) -> bool:
+        """Parse lines, in degraded mode once deadline has passed. Return True if it did."""
+        if deadline is None:
+            for line in lines:
+                self.parse_line(line)
+            return False
+
+        for line_index, line in enumerate(lines):
+            if not line_index % _TIME_BUDGET_CHECK_LINES and time.monotonic() >= deadline:
+                self._parse_degraded_lines(chain((line,), lines))
+                return True
+
+            self.parse_line(line)
+
+        return False
+
+    def _stitch_chunk_result(
+            self, lines: Iterator[str], result: 'ChunkResult', deadline: Optional[float]
+    ) -> Optional[bool]:
+        """Add the result of a chunk with the given lines to the report, see _log_file_chunks.
+
+        Return False if the chunk parser never had the same state as this parser, so that this
+        parser parsed the whole chunk itself. Return None if deadline passed while this parser
+        parsed lines of the chunk itself, so that the rest of them were parsed in degraded mode.
+        """
+        from colcon_sanitizer_reports._log_file_chunks import is_synchronized
+
+        # Lines that are parsed again below are counted once.
+        line_count = self._parsed_line_count + result.line_count
+        character_count = self._parsed_character_count + result.character_count
+
+        replay_line_index = 0
+        if self._open_sections_by_prefix:
+            for replay_line_index, line in enumerate(lines):
+                # The outcomes from aggregate_line_index on are only known per key, so they can not
+                # be replayed from a later line.
+                if replay_line_index <= result.aggregate_line_index and \
+                        not self._open_sections_by_prefix and \
+                        is_synchronized(result, replay_line_index):
+                    break
+
+                if deadline is not None and not replay_line_index % _TIME_BUDGET_CHECK_LINES and \
+                        time.monotonic() >= deadline:
+                    self._parse_degraded_lines(chain((line,), lines))
+                    return None
+
+                self.parse_line(line)
+            else:
+                return False
+
+        self._parsed_line_count = line_count
+        self._parsed_character_count = character_count
+
+        for line_index, method_name, args in result.outcomes:
+            if line_index >= replay_line_index:
+                getattr(self, method_name)(*args)
+        for aggregated_outcome in result.aggregated_outcomes:
+            # Replayed as the first occurrence and then all others at once, which keeps the same
+            # samples as adding them one by one.
+            method = getattr(self, aggregated_outcome.method_name)
+            method(*aggregated_outcome.first_args)
+            if aggregated_outcome.count > 1:
+                method(*aggregated_outcome.last_args, count=aggregated_outcome.count - 1)
+        self._open_sections_by_prefix = result.open_sections_by_prefix
+        self._update_open_section_prefix_lengths()
+
+        return True
+
+    def _parse_degraded_lines(self, lines: Iterable[str]) -> None:
+        """Parse the rest of the log in degraded mode, see the class docstring."""
+        self._start_degraded_parse()
+        for line in lines:
+            self._parse_degraded_line(line)
+
+    def _start_degraded_parse(self) -> None:
+        """Count the open sections by error_name only and stop gathering lines for sections."""
+        self._degraded_packages.add(self._package)
+        for open_sections in self._open_sections_by_prefix.values():
+            for open_section in open_sections.values():
+                if open_section.suppression is not None:
+                    assert open_section.error_name is not None
+                    self._add_suppression_hit(SanitizerSuppressionHitKey(
+                        package=self._package,
+                        error_name=open_section.error_name,
+                        suppression=open_section.suppression,
+                    ))
+                elif open_section.lines:
+                    self._parse_degraded_line(open_section.lines[0], is_counted=False)
+
+        self._open_sections_by_prefix = {}
+        self._update_open_section_prefix_lengths()
+
+    def _parse_degraded_line(self, line: str, *, is_counted: bool = True) -> None:
+        """Parse a line in degraded mode, see the class docstring."""
+        if is_counted:
+            self._parsed_line_count += 1
+            self._parsed_character_count += len(line)
+
+        if 'Sanitizer: ' in line:
+            if 'ERROR: ' not in line and 'WARNING: ' not in line:
+                return
+
+            # Only header lines get this far, so matching them is cheap.
+            match = _FIND_SECTION_START_LINE_REGEX.match(line.rstrip())
+            if match is None:
+                return
+
+            header_line = match.group(0)[len(match.group('prefix')):]
+            error_name = get_error_name(header_line)
+            if error_name is not None:
+                # Counted like a runtime error, which also keeps its first line as the sample.
+                self._add_runtime_error(
+                    SanitizerLogParserOutputPrimaryKey(
+                        package=self._package,
+                        error_name=error_name,
+                        stack_trace_key=DEGRADED_OUTPUT_NAME,
+                    ),
+                    header_line,
+                )
+        elif _RUNTIME_ERROR_SUBSTRING in line:
+            # Runtime errors are single lines without stack traces, so they are parsed as usual.
+            match = _FIND_RUNTIME_ERROR_LINE_REGEX.match(line.rstrip())
+            if match is not None:
+                self._parse_runtime_error_line(
+                    match.group('line'), match.group('location'), match.group('message')
+                )
+
     def parse_line(self, line: str) -> None:
         """Parse colcon test log file line by line and generate report of errors/warnings."""
+        self._parsed_line_count += 1
+        self._parsed_character_count += len(line)
         line = line.rstrip()
 
+        # Runtime errors are complete on their own line, so they are never part of a section.
+        if _RUNTIME_ERROR_SUBSTRING in line:
+            match = _FIND_RUNTIME_ERROR_LINE_REGEX.match(line)
+            if match is not None:
+                self._parse_runtime_error_line(
+                    match.group('line'), match.group('location'), match.group('message')
+                )
+                return
+
         # If we have a sanitizer section starting line, start gathering lines for it.
         match = _FIND_SECTION_START_LINE_REGEX.match(line)
         if match is not None:
             # Future lines for this new sanitizer section are sometimes interleaved with unrelated
             # log lines due to multi-threaded logging. The log lines we care about will have the
-            # same prefix, so they will match the following pattern with the prefix included.
-            prefix = match.groupdict()['prefix']
-            find_line_regex = re.compile(r'^{prefix}(?P<line>.*)$'.format(prefix=re.escape(prefix)))
-            self._lines_by_find_line_regex[find_line_regex] = []
+            # same prefix, and lines of sanitizers of different processes are told apart by their
+            # process id.
+            prefix = match.group('prefix')
+            pid = match.group('pid')
+            if pid is None:
+                pid_match = _FIND_SECTION_START_LINE_PID_REGEX.search(line)
+                pid = pid_match.group('pid') if pid_match is not None else ''
+
+            open_sections = self._open_sections_by_prefix.get(prefix)
+            if open_sections is None:
+                open_sections = OrderedDict()
+                self._open_sections_by_prefix[prefix] = open_sections
+                self._update_open_section_prefix_lengths()
+            open_sections.pop(pid, None)
+            if len(open_sections) >= _MAX_OPEN_SECTIONS_PER_PREFIX:
+                open_sections.popitem(last=False)
+            open_sections[pid] = _OpenSection()
+            self._append_section_line(prefix, pid, line[len(prefix):])
+            return
 
         # If this line belongs to one of the sections we're currently building, append it to lines
-        # for that section.
-        for find_line_regex, lines in self._lines_by_find_line_regex.items():
-            match = find_line_regex.match(line)
+        # for that section. The longest prefix that sections are open for wins, so this is a few
+        # dict lookups no matter how many sections are open.
+        for prefix_length in self._open_section_prefix_lengths:
+            prefix = line[:prefix_length]
+            open_sections = self._open_sections_by_prefix.get(prefix)
+            if open_sections is not None:
+                break
+        else:
+            return
+
+        # Lines with a process id marker belong to the section of that process. Other lines belong
+        # to the section of the process that wrote the last marker.
+        section_line = line[prefix_length:]
+        pid = next(reversed(open_sections))
+        if section_line.startswith('=='):
+            # Separator lines are written before a start line, so they belong to no open section.
+            if not section_line.rstrip().strip('='):
+                return
+
+            match = _FIND_SECTION_LINE_PID_REGEX.match(section_line)
             if match is not None:
-                lines.append(match.groupdict()['line'])
-
-                # If this is the last line of a section, create the section and stop gathering lines
-                # for it.
-                match = _FIND_SECTION_END_LINE_REGEX.match(line)
-                if match is not None:
-                    section = SanitizerSection(lines=tuple(lines))
-                    for part in section.parts:
-                        for relevant_stack_trace in part.relevant_stack_traces:
-                            output_primary_key = SanitizerLogParserOutputPrimaryKey(
-                                package=self._package,
-                                error_name=section.error_name,
-                                stack_trace_key=relevant_stack_trace.key,
-                            )
-                            self._count_by_output_primary_key[output_primary_key] += 1
-                            self._sample_stack_trace_by_output_primary_key[output_primary_key] = (
-                                relevant_stack_trace
-                            )
-                    del self._lines_by_find_line_regex[find_line_regex]
+                if match.group('pid') in open_sections:
+                    pid = match.group('pid')
+                    open_sections.move_to_end(pid)
+                elif '' not in open_sections:
+                    # This is a line of a process without an open section, eg. the ABORTING line
+                    # that follows a SUMMARY line.
+                    return
+        self._append_section_line(prefix, pid, section_line)
 
-                break
+    def _update_open_section_prefix_lengths(self) -> None:
+        self._open_section_prefix_lengths = sorted(
+            {len(prefix) for prefix in self._open_sections_by_prefix.keys()}, reverse=True
+        )
+
+    def _append_section_line(self, prefix: str, pid: str, line: str) -> None:
+        open_sections = self._open_sections_by_prefix[prefix]
+        open_section = open_sections[pid]
+        self._append_line(open_section, line)
+
+        # If this is the last line of a section, create the section and stop gathering lines for
+        # it.
+        if 'SUMMARY: ' not in line or _FIND_SECTION_END_LINE_REGEX.match(line) is None:
+            return
+
+        del open_sections[pid]
+        if not open_sections:
+            del self._open_sections_by_prefix[prefix]
+            self._update_open_section_prefix_lengths()
+
+        if open_section.suppression is not None:
+            assert open_section.error_name is not None
+            self._add_suppression_hit(SanitizerSuppressionHitKey(
+                package=self._package,
+                error_name=open_section.error_name,
+                suppression=open_section.suppression,
+            ))
+            return
+
+        section = SanitizerSection(lines=tuple(open_section.lines))
+        is_matching_parts = (
+            self._suppressions is not None and
+            section.error_name in _ERROR_NAMES_WITH_AN_ERROR_PER_SECTION_PART and
+            self._suppressions.has_suppressions(section.error_name)
+        )
+        for part in section.parts:
+            if is_matching_parts:
+                suppression = self._match_section_part(section.error_name, part)
+                if suppression is not None:
+                    self._add_suppression_hit(SanitizerSuppressionHitKey(
+                        package=self._package,
+                        error_name=section.error_name,
+                        suppression=suppression,
+                    ))
+                    continue
+
+            for relevant_stack_trace in part.relevant_stack_traces:
+                output_primary_key = SanitizerLogParserOutputPrimaryKey(
+                    package=self._package,
+                    error_name=section.error_name,
+                    stack_trace_key=relevant_stack_trace.key,
+                )
+                self._add_output(output_primary_key, relevant_stack_trace)
+
+    def _match_section_part(self, error_name: str, part: SanitizerSectionPart) -> Optional[str]:
+        """Return the suppression that matches a frame of the stack trace of part, if any."""
+        assert self._suppressions is not None
+        frame_count = 0
+        for line in part.lines:
+            if _FIND_STACK_TRACE_FRAME_LINE_REGEX.match(line) is None:
+                if frame_count:
+                    # The first stack trace has ended without a match.
+                    break
+                continue
+
+            suppression = self._suppressions.match(error_name, line, is_top_frame=frame_count == 0)
+            if suppression is not None:
+                return suppression
+            frame_count += 1
+
+        return None
+
+    def _parse_runtime_error_line(self, line: str, location: str, message: str) -> None:
+        error_name = _FIND_RUNTIME_ERROR_KIND_SUB_REGEX.sub('N', message.partition(':')[0])
+        if self._suppressions is not None:
+            # The location line is the only frame of a runtime error.
+            suppression = self._suppressions.match(error_name, line, is_top_frame=True)
+            if suppression is not None:
+                self._add_suppression_hit(SanitizerSuppressionHitKey(
+                    package=self._package, error_name=error_name, suppression=suppression,
+                ))
+                return
+
+        self._add_runtime_error(
+            SanitizerLogParserOutputPrimaryKey(
+                package=self._package, error_name=error_name, stack_trace_key=location,
+            ),
+            line,
+        )
+
+    def _append_line(self, open_section: _OpenSection, line: str) -> None:
+        """Append a line to an open section, matching suppressions as frames arrive."""
+        if open_section.suppression is not None:
+            return
+
+        if not open_section.lines and self._suppressions is not None:
+            # This is the header line. Only match frames if some suppression may match them.
+            open_section.error_name = get_error_name(line)
+            open_section.is_matching_suppressions = (
+                open_section.error_name is not None and
+                open_section.error_name not in _ERROR_NAMES_WITH_AN_ERROR_PER_SECTION_PART and
+                self._suppressions.has_suppressions(open_section.error_name)
+            )
+
+        open_section.lines.append(line)
+
+        if open_section.is_matching_suppressions:
+            assert self._suppressions is not None and open_section.error_name is not None
+            if _FIND_STACK_TRACE_FRAME_LINE_REGEX.match(line) is not None:
+                open_section.suppression = self._suppressions.match(
+                    open_section.error_name, line, is_top_frame=open_section.frame_count == 0
+                )
+                open_section.frame_count += 1
+                if open_section.suppression is not None:
+                    # The rest of the section is skipped, so its lines are no longer needed.
+                    open_section.lines = []
+            elif open_section.frame_count:
+                # The first stack trace has ended without a match.
+                open_section.is_matching_suppressions = False
+
+    def _add_output(
+            self,
+            output_primary_key: SanitizerLogParserOutputPrimaryKey,
+            stack_trace: SanitizerSectionPartStackTrace,
+            count: int = 1
+    ) -> None:
+        """Count count occurrences of output_primary_key and keep stack_trace as its sample."""
+        if self._symbolizer is not None and self._symbolizer.get_addresses(stack_trace.lines):
+            self._unsymbolized_outputs.append((output_primary_key, stack_trace, count))
+            if len(self._unsymbolized_outputs) >= _SYMBOLIZE_BATCH_SIZE:
+                self._symbolize()
+            return
+
+        self._count_output(output_primary_key, stack_trace, count)
+
+    def _symbolize(self) -> None:
+        """Symbolize and count the stack traces that are held back, in a single batch."""
+        if not self._unsymbolized_outputs:
+            return
+
+        assert self._symbolizer is not None
+        unsymbolized_outputs = self._unsymbolized_outputs
+        self._unsymbolized_outputs = []
+        self._symbolizer.resolve(
+            address
+            for _, stack_trace, _ in unsymbolized_outputs
+            for address in self._symbolizer.get_addresses(stack_trace.lines)
+        )
+        for output_primary_key, stack_trace, count in unsymbolized_outputs:
+            lines = self._symbolizer.symbolize(stack_trace.lines)
+            stack_trace_key = find_stack_trace_key(lines)
+            if stack_trace_key is not None:
+                # Otherwise, no symbolized frame is ros2 code, and the key of the frames as they
+                # were written is kept.
+                output_primary_key = output_primary_key._replace(stack_trace_key=stack_trace_key)
+                stack_trace = SanitizerSectionPartStackTrace(lines, key=stack_trace_key)
+            self._count_output(output_primary_key, stack_trace, count)
+
+    def _count_output(
+            self,
+            output_primary_key: SanitizerLogParserOutputPrimaryKey,
+            stack_trace: SanitizerSectionPartStackTrace,
+            count: int = 1
+    ) -> None:
+        if self._counter_by_package is None:
+            self._count_by_output_primary_key[output_primary_key] += count
+        else:
+            counter = self._counter_by_package.get(output_primary_key.package)
+            if counter is None:
+                assert self._max_keys_per_package is not None
+                counter = SpaceSavingCounter(self._max_keys_per_package)
+                self._counter_by_package[output_primary_key.package] = counter
+
+            evicted_output_primary_key = counter.add(output_primary_key)
+            # Once added, the key is monitored, so adding it again evicts no other key.
+            for _ in range(count - 1):
+                counter.add(output_primary_key)
+            if evicted_output_primary_key is not None:
+                self._evicted_key_count += 1
+                self._release_stack_trace(
+                    self._sample_stack_trace_hash_by_output_primary_key.pop(
+                        evicted_output_primary_key
+                    )
+                )
+
+        self._set_sample_stack_trace(output_primary_key, stack_trace)
+
+        if self._max_memory_bytes is not None and self._memory_bytes > self._max_memory_bytes:
+            self._spill()
+
+    def _set_sample_stack_trace(
+            self,
+            output_primary_key: SanitizerLogParserOutputPrimaryKey,
+            stack_trace: SanitizerSectionPartStackTrace
+    ) -> None:
+        stack_trace_hash = stack_trace.content_hash
+        previous_stack_trace_hash = \
+            self._sample_stack_trace_hash_by_output_primary_key.get(output_primary_key)
+        if stack_trace_hash == previous_stack_trace_hash:
+            return
+
+        if self._max_memory_bytes is not None and previous_stack_trace_hash is None:
+            self._memory_bytes += _get_memory_size(output_primary_key)
+
+        # Keep the stored stack trace if there is one, so that equal stack traces share one copy.
+        if stack_trace_hash not in self._stack_trace_by_hash:
+            self._stack_trace_by_hash[stack_trace_hash] = stack_trace
+            self._reference_count_by_stack_trace_hash[stack_trace_hash] = 0
+            if self._max_memory_bytes is not None:
+                self._memory_bytes += _get_memory_size(stack_trace.lines)
+        self._reference_count_by_stack_trace_hash[stack_trace_hash] += 1
+        self._sample_stack_trace_hash_by_output_primary_key[output_primary_key] = stack_trace_hash
+
+        if previous_stack_trace_hash is not None:
+            self._release_stack_trace(previous_stack_trace_hash)
+
+    def _release_stack_trace(self, stack_trace_hash: str) -> None:
+        self._reference_count_by_stack_trace_hash[stack_trace_hash] -= 1
+        if not self._reference_count_by_stack_trace_hash[stack_trace_hash]:
+            del self._reference_count_by_stack_trace_hash[stack_trace_hash]
+            stack_trace = self._stack_trace_by_hash.pop(stack_trace_hash)
+            if self._max_memory_bytes is not None:
+                self._memory_bytes -= _get_memory_size(stack_trace.lines)
+
+    def _add_runtime_error(
+            self, output_primary_key: SanitizerLogParserOutputPrimaryKey, line: str, count: int = 1
+    ) -> None:
+        """Count count runtime errors, keeping line as the sample if they are the first ones."""
+        if output_primary_key in self._sample_stack_trace_hash_by_output_primary_key:
+            # The common case for repeated runtime errors, which needs neither a sample nor a hash.
+            # In approximate mode, the key is monitored, so adding it evicts no other key.
+            if self._counter_by_package is None:
+                self._count_by_output_primary_key[output_primary_key] += count
+            else:
+                counter = self._counter_by_package[output_primary_key.package]
+                for _ in range(count):
+                    counter.add(output_primary_key)
+            return
+
+        self._add_output(
+            output_primary_key,
+            SanitizerSectionPartStackTrace((line,), key=output_primary_key.stack_trace_key),
+            count,
+        )
+
+    def _add_suppression_hit(
+            self, suppression_hit_key: SanitizerSuppressionHitKey, count: int = 1
+    ) -> None:
+        """Count count sections dropped by a suppression."""
+        self._count_by_suppression_hit_key[suppression_hit_key] += count
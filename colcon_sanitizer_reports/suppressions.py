@@ -0,0 +1,161 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import defaultdict
+import re
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+# Suppression types used in sanitizer suppression files, and the error names they suppress.
+_ERROR_NAMES_BY_SUPPRESSION_TYPE = {
+    'race': ('data race',),
+    'race_top': ('data race',),
+    'deadlock': ('lock-order-inversion',),
+    'leak': ('detected memory leaks',),
+    'mutex': ('destroy of a locked mutex', 'unlock of an unlocked mutex'),
+    'signal': ('signal-unsafe call inside of a signal', 'signal handler spoils errno'),
+    'thread': ('thread leak',),
+}  # type: Dict[str, Tuple[str, ...]]
+
+# Suppression types that only match the top frame of a stack trace.
+_TOP_FRAME_SUPPRESSION_TYPES = ('race_top',)
+
+# Suppresses any error name.
+_ANY_ERROR_NAME = '*'
+
+
+def _normalize_error_name(error_name: str) -> str:
+    # Error names are written with dashes instead of spaces in the xml report, so accept both.
+    return error_name.strip().replace('-', ' ').lower()
+
+
+def _translate_pattern(pattern: str) -> str:
+    # Like sanitizer suppressions, a pattern matches any substring of a frame. '*' matches any
+    # characters, and a leading '^' or trailing '$' anchor the pattern to the frame text.
+    anchor_begin = pattern.startswith('^')
+    anchor_end = pattern.endswith('$') and len(pattern) > int(anchor_begin)
+    pattern = pattern[int(anchor_begin):len(pattern) - int(anchor_end)]
+
+    regex = '.*'.join(re.escape(part) for part in pattern.split('*'))
+    if anchor_begin:
+        regex = r'(?<![^\s(])' + regex
+    if anchor_end:
+        regex = regex + r'(?=[\s()+:]|$)'
+    return regex
+
+
+class SanitizerSuppressions:
+    """Matches stack trace frames against known, accepted sanitizer errors.
+
+    Suppressions are given one per line in the same syntax as sanitizer suppression files:
+
+        # Comments and blank lines are ignored.
+        race:libfastrtps.so
+        deadlock:eprosima::fastrtps::*::Domain
+        leak:^rcl_init$
+
+    Each line is "<type>:<pattern>". The type is a sanitizer suppression type (race, race_top,
+    deadlock, leak, mutex, signal, thread), an error name as it appears in the report (eg.
+    "heap-use-after-free" or "SEGV on unknown address"), or '*' for any error. The pattern matches
+    any substring of a stack trace frame, '*' matches any characters, and '^' and '$' anchor the
+    pattern to the beginning and end of a word of the frame such as a function name, a source file,
+    or a module.
+
+    All patterns for an error name are compiled into a single regular expression, so a frame is
+    matched against hundreds of suppressions with a single search.
+    """
+
+    def __init__(self, lines: Iterable[str]) -> None:
+        """Compile suppressions from lines of a suppression file."""
+        patterns_by_error_name = defaultdict(list) \
+            # type: Dict[str, List[Tuple[str, str, bool]]]
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            suppression_type, separator, pattern = line.partition(':')
+            if not separator or not suppression_type.strip() or not pattern.strip():
+                raise ValueError(
+                    'Invalid sanitizer suppression on line {line_number}: {line}'
+                    .format(**locals())
+                )
+
+            suppression_type = suppression_type.strip()
+            error_names = _ERROR_NAMES_BY_SUPPRESSION_TYPE.get(
+                suppression_type, (suppression_type,)
+            )
+            is_top_frame_only = suppression_type in _TOP_FRAME_SUPPRESSION_TYPES
+            for error_name in error_names:
+                patterns_by_error_name[_normalize_error_name(error_name)].append(
+                    (line, _translate_pattern(pattern.strip()), is_top_frame_only)
+                )
+
+        # Each compiled regex is an alternation of one named group per suppression, so the name of
+        # the group that matched tells which suppression matched.
+        self._suppressions = []  # type: List[str]
+        self._regexes_by_error_name = {} \
+            # type: Dict[str, Tuple[Optional[Pattern[str]], Optional[Pattern[str]]]]
+        for error_name, patterns in patterns_by_error_name.items():
+            if error_name != _normalize_error_name(_ANY_ERROR_NAME):
+                patterns = patterns + patterns_by_error_name.get(_ANY_ERROR_NAME, [])
+            self._regexes_by_error_name[error_name] = (
+                self._compile([pattern for pattern in patterns if not pattern[2]]),
+                self._compile([pattern for pattern in patterns if pattern[2]]),
+            )
+
+    @classmethod
+    def from_file(cls, path: str) -> 'SanitizerSuppressions':
+        """Read suppressions from a suppression file."""
+        with open(path, 'r') as suppressions_f_in:
+            return cls(suppressions_f_in)
+
+    def _compile(self, patterns: List[Tuple[str, str, bool]]) -> Optional[Pattern[str]]:
+        if not patterns:
+            return None
+
+        group_regexes = []  # type: List[str]
+        for suppression, regex, _ in patterns:
+            group_regexes.append('(?P<s{}>{})'.format(len(self._suppressions), regex))
+            self._suppressions.append(suppression)
+        return re.compile('|'.join(group_regexes))
+
+    def has_suppressions(self, error_name: str) -> bool:
+        """Return True if any suppression may match frames of errors with the given name."""
+        return self._get_regexes(error_name) is not None
+
+    def match(self, error_name: str, frame: str, is_top_frame: bool) -> Optional[str]:
+        """Return the suppression that matches a stack trace frame of an error, if any."""
+        regexes = self._get_regexes(error_name)
+        if regexes is None:
+            return None
+
+        # Suppressions of the top frame only are searched only for the top frame.
+        for regex in regexes if is_top_frame else regexes[:1]:
+            if regex is None:
+                continue
+
+            match = regex.search(frame)
+            if match is not None:
+                assert match.lastgroup is not None
+                return self._suppressions[int(match.lastgroup[1:])]
+
+        return None
+
+    def _get_regexes(
+            self, error_name: str
+    ) -> Optional[Tuple[Optional[Pattern[str]], Optional[Pattern[str]]]]:
+        regexes = self._regexes_by_error_name.get(_normalize_error_name(error_name))
+        if regexes is None:
+            regexes = self._regexes_by_error_name.get(_ANY_ERROR_NAME)
+        return regexes
@@ -0,0 +1,306 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Offline symbolization of stack trace frames that a sanitizer could not symbolize.
+
+When a sanitizer can not symbolize a frame, eg. because no symbolizer was found while the tests ran,
+the frame only names a module and an offset into it:
+
+    #3 0x7f619f689d1e  (/ros2_install/rclcpp/lib/librclcpp.so+0x55bd1e)
+    #3 <null> <null> (librclcpp.so+0x55bd1e)
+
+Addresses are masked in stack trace keys, so unrelated errors with such frames share a key.
+SanitizerSymbolizer resolves the (module, offset) pairs of these frames after the fact with a single
+long-lived llvm-symbolizer process, and rewrites the frames the way the sanitizer would have written
+them. Each (module, offset) pair is sent to the process at most once.
+
+Resolutions can be kept in a cache file across runs. The format is JSON lines. The first line is a
+header identifying the format and its version, and each following line is one resolution:
+
+    {"format": "colcon-sanitizer-reports-symbolizer-cache", "version": 1}
+    {"module": "...", "module_id": "...", "offset": "0x55bd1e", "function": "...",
+     "location": "..."}
+
+The module_id identifies the build of the module by its size and modification time, so that
+resolutions are not used once a module was rebuilt. Function and location are null if they could
+not be resolved.
+"""
+
+import json
+import os
+import re
+import subprocess
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+SYMBOLIZER_CACHE_FORMAT = 'colcon-sanitizer-reports-symbolizer-cache'
+SYMBOLIZER_CACHE_VERSION = 1
+
+# Frames that were not symbolized match the following pattern. AddressSanitizer writes the program
+# counter, ThreadSanitizer writes <null> for the function and the location instead.
+_FIND_UNSYMBOLIZED_FRAME_REGEX = re.compile(
+    r'^(?P<frame>\s*#\d+) (?:(?P<pc>0x[\da-f]+) |<null> <null>)\s*'
+    r'\((?P<module>[^()]+)\+(?P<offset>0x[\da-f]+)\)\s*$'
+)
+
+# llvm-symbolizer writes this for each function or location that it could not resolve.
+_UNKNOWN = '??'
+
+# (function, location) of a resolved address. The location is None if only the function is known.
+_Resolution = Optional[Tuple[str, Optional[str]]]
+
+
+def _get_location(output_line: str) -> Optional[str]:
+    """Return the location from a llvm-symbolizer "file:line:column" output line, if it is known."""
+    location = output_line[:-len(':0')] if output_line.endswith(':0') else output_line
+    if location.startswith(_UNKNOWN) or location.endswith(':0'):
+        return None
+
+    return location
+
+
+class SanitizerSymbolizer:
+    """Resolves and rewrites stack trace frames that a sanitizer could not symbolize.
+
+    The symbolizer process is started the first time an address needs resolving. If it can not be
+    started, or exits, the addresses it did not resolve are left as they are for the rest of the
+    run. Call close() to stop it.
+    """
+
+    def __init__(
+            self, command: Sequence[str] = ('llvm-symbolizer',), *,
+            cache_path: Optional[str] = None
+    ) -> None:
+        """Initialize a symbolizer that runs command, with resolutions cached in cache_path."""
+        self._command = tuple(command)
+        self._process = None  # type: Optional[subprocess.Popen]
+        self._is_available = True
+
+        # Resolutions of this run, by (module, offset). None if the address could not be resolved.
+        self._resolution_by_address = {}  # type: Dict[Tuple[str, str], _Resolution]
+
+        # Ids of the modules seen in this run. None if the module does not exist here.
+        self._module_id_by_module = {}  # type: Dict[str, Optional[str]]
+
+        # Resolutions from the cache file, by (module, module_id, offset).
+        self._cache_path = cache_path
+        self._cached_resolution_by_key = {} \
+            # type: Dict[Tuple[str, str, str], _Resolution]
+        self._is_cache_valid = False
+        if cache_path is not None:
+            self._read_cache(cache_path)
+
+    def close(self) -> None:
+        """Stop the symbolizer process, if it is running."""
+        if self._process is not None:
+            assert self._process.stdin is not None
+            self._process.stdin.close()
+            self._process.wait()
+            self._process = None
+
+    @staticmethod
+    def get_addresses(lines: Iterable[str]) -> List[Tuple[str, str]]:
+        """Return the (module, offset) of each unsymbolized frame in lines."""
+        addresses = []  # type: List[Tuple[str, str]]
+        for line in lines:
+            if '+0x' not in line:
+                continue
+
+            match = _FIND_UNSYMBOLIZED_FRAME_REGEX.match(line)
+            if match is not None:
+                addresses.append((match.group('module'), match.group('offset')))
+
+        return addresses
+
+    def resolve(self, addresses: Iterable[Tuple[str, str]]) -> None:
+        """Resolve the addresses that were not resolved yet, in a single batch."""
+        unresolved_addresses = []  # type: List[Tuple[str, str]]
+        for address in addresses:
+            if address in self._resolution_by_address:
+                continue
+
+            module, offset = address
+            module_id = self._get_module_id(module)
+            if module_id is None:
+                # The symbolizer can not read a module that is not here, eg. one that
+                # ThreadSanitizer named without a path.
+                self._resolution_by_address[address] = None
+            elif (module, module_id, offset) in self._cached_resolution_by_key:
+                self._resolution_by_address[address] = \
+                    self._cached_resolution_by_key[(module, module_id, offset)]
+            else:
+                # Marked as unresolved until the batch resolves it, which also drops duplicates.
+                self._resolution_by_address[address] = None
+                unresolved_addresses.append(address)
+
+        if unresolved_addresses and self._is_available:
+            resolution_by_address = self._resolve_batch(unresolved_addresses)
+            self._resolution_by_address.update(resolution_by_address)
+            if self._cache_path is not None and resolution_by_address:
+                self._write_cache(self._cache_path, resolution_by_address)
+
+    def symbolize(self, lines: Sequence[str]) -> Tuple[str, ...]:
+        """Return lines with each unsymbolized frame rewritten with its resolution, if it has one.
+
+        Addresses that were not resolved yet are resolved first.
+        """
+        self.resolve(self.get_addresses(lines))
+
+        symbolized_lines = []  # type: List[str]
+        for line in lines:
+            match = _FIND_UNSYMBOLIZED_FRAME_REGEX.match(line) if '+0x' in line else None
+            resolution = None  # type: _Resolution
+            if match is not None:
+                resolution = self._resolution_by_address[
+                    (match.group('module'), match.group('offset'))
+                ]
+            if resolution is None:
+                symbolized_lines.append(line)
+                continue
+
+            assert match is not None
+            frame, pc, module, offset = match.group('frame', 'pc', 'module', 'offset')
+            function, location = resolution
+            if pc is None:
+                # ThreadSanitizer always writes the module.
+                symbolized_lines.append('{frame} {function} {location} ({module}+{offset})'.format(
+                    frame=frame, function=function, location=location or '<null>', module=module,
+                    offset=offset,
+                ))
+            elif location is not None:
+                symbolized_lines.append('{frame} {pc} in {function} {location}'.format(**locals()))
+            else:
+                symbolized_lines.append(
+                    '{frame} {pc} in {function} ({module}+{offset})'.format(**locals())
+                )
+
+        return tuple(symbolized_lines)
+
+    def _get_module_id(self, module: str) -> Optional[str]:
+        if module not in self._module_id_by_module:
+            try:
+                stat = os.stat(module) if os.path.isabs(module) else None
+            except OSError:
+                stat = None
+            self._module_id_by_module[module] = (
+                '{}:{}'.format(stat.st_size, stat.st_mtime_ns) if stat is not None else None
+            )
+
+        return self._module_id_by_module[module]
+
+    def _resolve_batch(
+            self, addresses: List[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], _Resolution]:
+        """Resolve addresses with the symbolizer process, returning the ones it answered."""
+        resolution_by_address = {}  # type: Dict[Tuple[str, str], _Resolution]
+        try:
+            if self._process is None:
+                self._process = subprocess.Popen(
+                    self._command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL, universal_newlines=True,
+                )
+            process = self._process
+            assert process.stdout is not None
+
+            # The answers are read while the batch is written, so that neither pipe fills up.
+            writer = threading.Thread(target=self._write_batch, args=(process, addresses))
+            writer.start()
+            try:
+                for address in addresses:
+                    output_lines = []  # type: List[str]
+                    while True:
+                        output_line = process.stdout.readline()
+                        if not output_line:
+                            raise OSError('{} exited'.format(self._command[0]))
+                        if not output_line.strip():
+                            break
+                        output_lines.append(output_line.rstrip('\n'))
+
+                    # Inlined functions add more (function, location) pairs. The first one is the
+                    # innermost, as a sanitizer would have written it.
+                    function = output_lines[0] if output_lines else _UNKNOWN
+                    location = _get_location(output_lines[1]) if len(output_lines) > 1 else None
+                    resolution_by_address[address] = \
+                        (function, location) if function != _UNKNOWN else None
+            finally:
+                writer.join()
+        except OSError:
+            self._is_available = False
+            if self._process is not None:
+                self._process.kill()
+                self._process.wait()
+                self._process = None
+
+        return resolution_by_address
+
+    @staticmethod
+    def _write_batch(process: subprocess.Popen, addresses: List[Tuple[str, str]]) -> None:
+        assert process.stdin is not None
+        try:
+            # Modules are quoted, so that paths with spaces are not split.
+            process.stdin.write(''.join(
+                '"{module}" {offset}\n'.format(module=module, offset=offset)
+                for module, offset in addresses
+            ))
+            process.stdin.flush()
+        except OSError:
+            # The process exited, which the reader finds out as well.
+            pass
+
+    def _read_cache(self, cache_path: str) -> None:
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f_in:
+                header = json.loads(f_in.readline() or 'null')
+                if not isinstance(header, dict) or \
+                        header.get('format') != SYMBOLIZER_CACHE_FORMAT or \
+                        header.get('version') != SYMBOLIZER_CACHE_VERSION:
+                    return
+
+                self._is_cache_valid = True
+                for line in f_in:
+                    try:
+                        entry = json.loads(line)
+                        key = (entry['module'], entry['module_id'], entry['offset'])
+                        function = entry['function']
+                        location = entry['location']
+                    except (ValueError, KeyError, TypeError):
+                        # Eg. the last line of a run that was interrupted while writing it.
+                        continue
+
+                    self._cached_resolution_by_key[key] = \
+                        (function, location) if function is not None else None
+        except (IOError, ValueError):
+            return
+
+    def _write_cache(
+            self, cache_path: str, resolution_by_address: Dict[Tuple[str, str], _Resolution]
+    ) -> None:
+        try:
+            # A missing or invalid cache file is started over.
+            with open(cache_path, 'a' if self._is_cache_valid else 'w', encoding='utf-8') as f_out:
+                if not self._is_cache_valid:
+                    f_out.write(json.dumps({
+                        'format': SYMBOLIZER_CACHE_FORMAT, 'version': SYMBOLIZER_CACHE_VERSION
+                    }, sort_keys=True) + '\n')
+                    self._is_cache_valid = True
+
+                for (module, offset), resolution in sorted(resolution_by_address.items()):
+                    function, location = resolution if resolution is not None else (None, None)
+                    f_out.write(json.dumps({
+                        'module': module, 'module_id': self._module_id_by_module[module],
+                        'offset': offset, 'function': function, 'location': location,
+                    }, sort_keys=True) + '\n')
+        except IOError:
+            # The cache only saves time, so the run goes on without it.
+            self._cache_path = None
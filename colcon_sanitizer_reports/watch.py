@@ -0,0 +1,421 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+r"""Keep a sanitizer report up to date while colcon writes package logs.
+
+This is for runs of "colcon test" that do not use the sanitizer_report event handler, eg. in a
+container or on a remote runner that writes its log directory to a shared volume. The log directory
+of the run is watched for <package>/stdout_stderr.log files, and each is parsed incrementally from
+where parsing last stopped as it grows. The report files are rewritten whenever the report changed,
+at most once per interval.
+
+On Linux, the log directory is watched with inotify, so that nothing is done while no log is
+written. Elsewhere, or if inotify is not available, the log directory is polled once per interval.
+
+Example:
+    colcon-sanitizer-reports-watch --csv sanitizer_report.csv --xml test_results.xml \
+        log/latest_test
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import signal
+import struct
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from colcon_sanitizer_reports.partial_report import merge_partial_reports, write_partial_report
+from colcon_sanitizer_reports.sanitizer_log_parser import (
+    open_csv_report, SanitizerLogParser, SanitizerReportRecord, write_csv_report
+)
+from colcon_sanitizer_reports.suppressions import SanitizerSuppressions
+from colcon_sanitizer_reports.xml_output_generator import write_xml_report
+
+# Same as colcon_output.event_handler.log.STDOUT_STDERR_LOG_FILENAME, which is not imported so that
+# the watcher can run without colcon.
+_LOG_FILENAME = 'stdout_stderr.log'
+
+# Log files are read in blocks of this many bytes.
+_READ_SIZE = 1024 * 1024
+
+# inotify constants from <sys/inotify.h>.
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify:
+    """A minimal inotify binding, with ctypes since the standard library has none."""
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)  # type: int
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+        self._path_by_watch_descriptor = {}  # type: Dict[int, str]
+
+    def add_watch(self, path: str, mask: int) -> None:
+        """Watch a directory for the events in mask."""
+        watch_descriptor = self._add_watch(self._fd, os.fsencode(path), mask)
+        if watch_descriptor < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()), path)
+        self._path_by_watch_descriptor[watch_descriptor] = path
+
+    def read_events(self, timeout: Optional[float]) -> Iterator[Optional[str]]:
+        """Wait up to timeout seconds for events and return the paths they happened to.
+
+        None is returned when events were lost, after which every watched path should be checked.
+        """
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return
+            raise
+
+        offset = 0
+        while offset < len(data):
+            watch_descriptor, mask, _, name_length = \
+                _INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_length].rstrip(b'\0'))
+            offset += name_length
+
+            if mask & _IN_Q_OVERFLOW:
+                yield None
+                continue
+
+            path = self._path_by_watch_descriptor.get(watch_descriptor)
+            if path is not None:
+                yield os.path.join(path, name) if name else path
+
+    def close(self) -> None:
+        """Stop watching."""
+        os.close(self._fd)
+
+
+class _PackageLogTail:
+    """Parses the lines of a package log that were written since it was last read."""
+
+    def __init__(
+            self, package: str, path: str, parser_factory: Callable[[], SanitizerLogParser]
+    ) -> None:
+        self._package = package
+        self._path = path
+        self._parser_factory = parser_factory
+        self._reset()
+
+    def _reset(self) -> None:
+        self.parser = self._parser_factory()
+        self.parser.set_package(self._package)
+        self._offset = 0
+        self._partial_line = b''
+
+    def read(self) -> bool:
+        """Parse complete lines written since the last read. Return True if anything was read."""
+        try:
+            size = os.path.getsize(self._path)
+        except OSError:
+            return False
+
+        if size < self._offset:
+            # The log was truncated or replaced, eg. by a new run of the package's tests.
+            self._reset()
+        if size == self._offset:
+            return False
+
+        with open(self._path, 'rb') as log_f_in:
+            log_f_in.seek(self._offset)
+            while True:
+                data = log_f_in.read(_READ_SIZE)
+                if not data:
+                    break
+
+                self._offset += len(data)
+                lines = (self._partial_line + data).split(b'\n')
+
+                # The last line is kept until its newline is written.
+                self._partial_line = lines.pop()
+                for line in lines:
+                    self.parser.parse_line(line.decode('utf-8', errors='replace'))
+
+        return True
+
+
+class SanitizerLogWatcher:
+    """Incrementally parses the package logs of a colcon log directory as they are written.
+
+    Each package log is parsed by its own SanitizerLogParser, so that sections that are still open
+    in one package log do not swallow lines of another. The records of all packages are merged into
+    a single report by get_records().
+    """
+
+    def __init__(
+            self, log_path: str, *,
+            max_keys_per_package: Optional[int] = None,
+            suppressions: Optional[SanitizerSuppressions] = None
+    ) -> None:
+        """Watch the package logs in log_path, eg. log/latest_test."""
+        # Normalized, so that it compares equal to the directory of the paths of inotify events.
+        self._log_path = os.path.normpath(log_path)
+        self._max_keys_per_package = max_keys_per_package
+        self._suppressions = suppressions
+        self._tail_by_package = {}  # type: Dict[str, _PackageLogTail]
+
+    @property
+    def log_path(self) -> str:
+        """Return the watched log directory."""
+        return self._log_path
+
+    def _create_parser(self) -> SanitizerLogParser:
+        return SanitizerLogParser(
+            max_keys_per_package=self._max_keys_per_package, suppressions=self._suppressions
+        )
+
+    def get_package_paths(self) -> List[str]:
+        """Return the package directories of the log directory."""
+        try:
+            return sorted(entry.path for entry in os.scandir(self._log_path) if entry.is_dir())
+        except OSError:
+            return []
+
+    def read_package(self, package_path: str) -> bool:
+        """Parse what was written to the log of a package. Return True if the report changed."""
+        log_path = os.path.join(package_path, _LOG_FILENAME)
+        package = os.path.basename(package_path)
+        tail = self._tail_by_package.get(package)
+        if tail is None:
+            if not os.path.isfile(log_path):
+                return False
+
+            tail = _PackageLogTail(package, log_path, self._create_parser)
+            self._tail_by_package[package] = tail
+
+        return tail.read()
+
+    def read_all(self) -> bool:
+        """Parse what was written to any package log. Return True if the report changed."""
+        is_changed = False
+        for package_path in self.get_package_paths():
+            is_changed = self.read_package(package_path) or is_changed
+        return is_changed
+
+    def get_records(self) -> Iterator[SanitizerReportRecord]:
+        """Return the records of all package logs, sorted by output primary key."""
+        return merge_partial_reports(*(
+            self._tail_by_package[package].parser.get_records()
+            for package in sorted(self._tail_by_package.keys())
+        ))
+
+
+def _write_atomically(
+        path: str, writer: Callable[..., None], records: Iterator[SanitizerReportRecord]
+) -> None:
+    # Readers of the report never see a partially written file. The temporary file keeps the
+    # extension, so that open_csv_report() compresses it like the report.
+    temporary_path = os.path.join(os.path.dirname(path), '.tmp.' + os.path.basename(path))
+    with open_csv_report(temporary_path) as f_out:
+        writer(records, f_out)
+    os.replace(temporary_path, path)
+
+
+def _write_reports(watcher: SanitizerLogWatcher, args: argparse.Namespace) -> None:
+    writers = (
+        (args.csv, lambda records, f_out: write_csv_report(
+            records, f_out, with_count_error=args.max_keys_per_package is not None
+        )),
+        (args.xml, write_xml_report),
+        (args.partial, write_partial_report),
+    )
+    for output_path, writer in writers:
+        if output_path is not None:
+            _write_atomically(output_path, writer, watcher.get_records())
+
+
+def watch(
+        watcher: SanitizerLogWatcher, on_change: Callable[[], None], *, interval: float,
+        use_inotify: bool = True
+) -> None:
+    """Parse package logs as they are written, until interrupted.
+
+    on_change is called after the report changed, at most once per interval seconds.
+    """
+    inotify = None  # type: Optional[_Inotify]
+    if use_inotify:
+        try:
+            inotify = _Inotify()
+            inotify.add_watch(watcher.log_path, _IN_CREATE | _IN_MOVED_TO)
+        except (AttributeError, OSError):
+            # Not Linux, or out of inotify instances or watches.
+            if inotify is not None:
+                inotify.close()
+            inotify = None
+
+    watched_package_paths = set()  # type: Set[str]
+
+    # Package directories that can not be watched, eg. once inotify runs out of watches, are polled
+    # every interval seconds instead.
+    polled_package_paths = set()  # type: Set[str]
+
+    def _watch_new_packages() -> None:
+        assert inotify is not None
+        for package_path in watcher.get_package_paths():
+            if package_path in watched_package_paths or package_path in polled_package_paths:
+                continue
+
+            try:
+                inotify.add_watch(package_path, _IN_CREATE | _IN_MODIFY | _IN_CLOSE_WRITE)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    polled_package_paths.add(package_path)
+                # Otherwise, the directory was removed after it was listed.
+                continue
+            watched_package_paths.add(package_path)
+
+    try:
+        # Packages are watched before they are first read, so that nothing written in between is
+        # missed.
+        if inotify is not None:
+            _watch_new_packages()
+        is_changed = watcher.read_all()
+        last_change_time = time.monotonic()
+        while True:
+            # Wait for the next change, but no longer than until the pending report is due.
+            timeout = None  # type: Optional[float]
+            if is_changed:
+                timeout = max(0.0, last_change_time + interval - time.monotonic())
+                if timeout == 0.0:
+                    on_change()
+                    is_changed = False
+                    last_change_time = time.monotonic()
+                    continue
+
+            if inotify is None:
+                time.sleep(interval if timeout is None else timeout)
+                is_changed = watcher.read_all() or is_changed
+                continue
+
+            if polled_package_paths:
+                timeout = interval if timeout is None else min(timeout, interval)
+            package_paths = set()  # type: Set[Optional[str]]
+            for path in inotify.read_events(timeout):
+                package_paths.add(path if path is None else os.path.dirname(path))
+            if None in package_paths or watcher.log_path in package_paths:
+                # Events were lost, or a package directory was created.
+                _watch_new_packages()
+                is_changed = watcher.read_all() or is_changed
+            else:
+                for package_path in package_paths | polled_package_paths:
+                    assert package_path is not None
+                    is_changed = watcher.read_package(package_path) or is_changed
+    finally:
+        if inotify is not None:
+            inotify.close()
+
+
+def _create_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='colcon-sanitizer-reports-watch',
+        description='Keep a sanitizer report up to date while colcon writes package logs.',
+    )
+    parser.add_argument(
+        'log_path', metavar='LOG_DIR',
+        help='Log directory of a colcon test run, with a stdout_stderr.log per package, eg. '
+             'log/latest_test.',
+    )
+    parser.add_argument(
+        '--csv',
+        help="Path of the csv report to keep up to date, gzip-compressed if it ends with '.gz'.",
+    )
+    parser.add_argument('--xml', help='Path of the xUnit xml report to keep up to date.')
+    parser.add_argument('--partial', help='Path of the partial report to keep up to date.')
+    parser.add_argument(
+        '--interval', type=float, default=5.0, metavar='SECONDS',
+        help='Rewrite the reports at most once per interval, and poll the log directory once per '
+             'interval if inotify is not used (default: %(default)s).',
+    )
+    parser.add_argument(
+        '--poll', action='store_true', help='Poll the log directory instead of using inotify.'
+    )
+    parser.add_argument(
+        '--once', action='store_true',
+        help='Parse the logs written so far, write the reports, and exit.',
+    )
+    parser.add_argument(
+        '--max-keys-per-package', type=int, metavar='N',
+        help='Report only the N most frequent errors of each package, with approximate counts.',
+    )
+    parser.add_argument(
+        '--suppressions', metavar='PATH',
+        help='Sanitizer suppression file listing known errors to leave out of the report.',
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Watch the log directory given on the command line."""
+    args = _create_argument_parser().parse_args(argv)
+    if args.csv is None and args.xml is None and args.partial is None:
+        print('At least one of --csv, --xml, or --partial is required.', file=sys.stderr)
+        return 1
+
+    watcher = SanitizerLogWatcher(
+        args.log_path,
+        max_keys_per_package=args.max_keys_per_package,
+        suppressions=(
+            SanitizerSuppressions.from_file(args.suppressions)
+            if args.suppressions is not None else None
+        ),
+    )
+
+    if args.once:
+        watcher.read_all()
+        _write_reports(watcher, args)
+        return 0
+
+    def _stop(signal_number, frame) -> None:
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        watch(
+            watcher, lambda: _write_reports(watcher, args),
+            interval=args.interval, use_inotify=not args.poll,
+        )
+    except KeyboardInterrupt:
+        # Parse what was written until now, so that the final report is complete.
+        watcher.read_all()
+        _write_reports(watcher, args)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
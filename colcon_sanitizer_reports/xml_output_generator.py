@@ -13,7 +13,10 @@
 # limitations under the License.
 
 from collections import defaultdict
-from typing import Dict, Set
+from itertools import groupby
+import shutil
+from tempfile import TemporaryFile
+from typing import Dict, Iterable, Optional, Set, TextIO
 import xml.dom.minidom
 import xml.etree.cElementTree as eTree
 
@@ -21,22 +24,140 @@ import xml.etree.cElementTree as eTree
 from colcon_sanitizer_reports._sanitizer_section_part_stack_trace import (
     SanitizerSectionPartStackTrace
 )
-from colcon_sanitizer_reports.sanitizer_log_parser import SanitizerLogParserOutputPrimaryKey
+from colcon_sanitizer_reports.report_limits import ReportTruncation
+from colcon_sanitizer_reports.sanitizer_log_parser import (
+    DEGRADED_OUTPUT_NAME, SanitizerLogParserOutputPrimaryKey, SanitizerReportRecord
+)
+
+
+def _is_degraded_mark(output_primary_key: SanitizerLogParserOutputPrimaryKey) -> bool:
+    # The record that marks a package whose log was partly parsed without stack traces, which is
+    # not an error of its own.
+    return output_primary_key.error_name == DEGRADED_OUTPUT_NAME
+
+
+def _create_error_element(testcase: eTree.Element,
+                          output_primary_key: SanitizerLogParserOutputPrimaryKey,
+                          count: int,
+                          stack_trace: SanitizerSectionPartStackTrace,
+                          count_error: int = 0,
+                          inline_stack_trace: bool = True) -> eTree.Element:
+    error = eTree.SubElement(testcase, 'error')
+    if output_primary_key.stack_trace_key == DEGRADED_OUTPUT_NAME:
+        # Part of the log of the package was parsed without stack traces.
+        testcase.set('degraded', 'true')
+    error.set('message', str(output_primary_key.error_name.replace(' ', '-')))
+    error.set('key', str(output_primary_key.stack_trace_key))
+    error.set('count', str(count))
+    if count_error:
+        error.set('count_error', str(count_error))
+    if inline_stack_trace:
+        error.text = '\n'.join(stack_trace.lines)
+    else:
+        error.set('stack_trace_hash', stack_trace.content_hash)
+
+    return error
+
+
+def _create_truncation_element(truncation: ReportTruncation) -> eTree.Element:
+    # Test suite properties are shown by Jenkins with the test results.
+    properties = eTree.Element('properties')
+    for name, value in (
+        ('truncated', 'true'),
+        ('omitted_errors', truncation.omitted_error_count),
+        ('omitted_error_occurrences', truncation.omitted_occurrence_count),
+        ('omitted_stack_trace_lines', truncation.omitted_stack_trace_line_count),
+    ):
+        eTree.SubElement(properties, 'property', {'name': name, 'value': str(value)})
+
+    return properties
+
+
+def write_xml_report(
+        records: Iterable[SanitizerReportRecord], f_out: TextIO, *,
+        inline_stack_traces: bool = True, truncation: Optional[ReportTruncation] = None
+) -> None:
+    """Write a xUnit compatible xml report of the given records to f_out.
+
+    If inline_stack_traces is False, errors reference their sample stack trace with a
+    stack_trace_hash attribute instead of including it. See write_stack_traces_csv().
+
+    If truncation is given, eg. when records come from limit_records(), and anything was left out of
+    the report, the testsuite has a properties element that records how much.
+
+    Test cases of packages whose log was partly parsed in degraded mode, see
+    SanitizerLogParser.parse_log_file(), have a degraded="true" attribute. The records that mark
+    such packages, see DEGRADED_OUTPUT_NAME, are not reported as errors.
+
+    Records must be sorted by output primary key, as they are when they come from
+    SanitizerLogParser.get_records() or a partial report. Only the records of a single package are
+    held in memory at a time. Test cases are staged in a temporary file until the number of
+    packages for the enclosing testsuite is known.
+    """
+    package_count = 0
+    with TemporaryFile('w+', encoding='utf-8') as testcases_f:
+        for package, package_records in groupby(
+            records, key=lambda record: record.output_primary_key.package
+        ):
+            testcase = eTree.Element('testcase', {'name': str(package)})
+            error_count = 0
+            for record in package_records:
+                if _is_degraded_mark(record.output_primary_key):
+                    testcase.set('degraded', 'true')
+                    continue
+
+                _create_error_element(
+                    testcase, record.output_primary_key, record.count, record.sample_stack_trace,
+                    record.count_error, inline_stack_traces,
+                )
+                error_count += 1
+            testcase.set('errors', str(error_count))
+
+            testcases_f.write('\t{}\n'.format(eTree.tostring(testcase, encoding='unicode')))
+            package_count += 1
+
+        f_out.write('<?xml version="1.0" ?>\n')
+        f_out.write('<testsuite tests="{package_count}">\n'.format(**locals()))
+        if truncation is not None and truncation.is_truncated:
+            f_out.write('\t{}\n'.format(
+                eTree.tostring(_create_truncation_element(truncation), encoding='unicode')
+            ))
+        testcases_f.seek(0)
+        shutil.copyfileobj(testcases_f, f_out)
+        f_out.write('</testsuite>\n')
 
 
 class XmlOutputGenerator:
-    """Converts the sanitizer error report into a xUnit compatible xml test report."""
+    """Converts the sanitizer error report into a xUnit compatible xml test report.
+
+    If count_error_map is given, errors with approximate counts have a count_error attribute. See
+    SanitizerReportRecord for its meaning.
+
+    If inline_stack_traces is False, errors have a stack_trace_hash attribute instead of the text
+    of their sample stack trace.
+
+    Errors are listed in the order of error_map. If truncation is given and anything was left out
+    of the report, the testsuite has a properties element that records how much.
+    """
 
     def __init__(self,
                  error_map: Dict[SanitizerLogParserOutputPrimaryKey, int],
                  stack_trace_map: Dict[SanitizerLogParserOutputPrimaryKey,
-                                       SanitizerSectionPartStackTrace]):
+                                       SanitizerSectionPartStackTrace],
+                 count_error_map: Optional[Dict[SanitizerLogParserOutputPrimaryKey, int]] = None,
+                 inline_stack_traces: bool = True,
+                 truncation: Optional[ReportTruncation] = None):
         """Convert sanitizer error into xml representation."""
         self._count_by_error = error_map  # type: Dict[SanitizerLogParserOutputPrimaryKey, int]
         self._stack_trace_by_error = stack_trace_map \
             # type: Dict[SanitizerLogParserOutputPrimaryKey, SanitizerSectionPartStackTrace]
+        self._count_error_by_error = count_error_map or {} \
+            # type: Dict[SanitizerLogParserOutputPrimaryKey, int]
+        self._inline_stack_traces = inline_stack_traces  # type: bool
         self._packages = self._get_unique_packages()  # type: Set[str]
         testsuite = self._create_error_report(self._create_results_base())  # type: eTree.Element
+        if truncation is not None and truncation.is_truncated:
+            testsuite.insert(0, _create_truncation_element(truncation))
         self._xml_string = self.encode_and_pretty_print(testsuite)  # type: str
 
     def _get_unique_packages(self) -> Set[str]:
@@ -64,11 +185,14 @@ class XmlOutputGenerator:
 
         # Gather error details for all packages
         for key, count in self._count_by_error.items():
-            error = eTree.SubElement(testcases[key[0]], 'error')
-            error.set('message', str(key[1].replace(' ', '-')))
-            error.set('key', str(key[2]))
-            error.set('count', str(count))
-            error.text = '\n'.join(self._stack_trace_by_error[key].lines)
+            if _is_degraded_mark(key):
+                testcases[key[0]].set('degraded', 'true')
+                continue
+
+            _create_error_element(
+                testcases[key[0]], key, count, self._stack_trace_by_error[key],
+                self._count_error_by_error.get(key, 0), self._inline_stack_traces,
+            )
             error_count_by_package[key[0]] += 1
 
         for package in self._packages:
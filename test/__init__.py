@@ -11,3 +11,84 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+
+from csv import DictReader
+import os
+from typing import Any, Optional
+import xml.etree.cElementTree as eTree
+
+from colcon_sanitizer_reports.sanitizer_log_parser import SanitizerLogParser
+
+# Directories of test/resources include 'input.log', and most include 'expected_output.csv' and
+# 'expected_output.xml'.
+RESOURCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+
+
+def get_input_log_path(resource_name: str) -> str:
+    return os.path.join(RESOURCES_PATH, resource_name, 'input.log')
+
+
+def parse_resource_log(parser: SanitizerLogParser, resource_name: str) -> None:
+    with open(get_input_log_path(resource_name), 'r') as input_log_f_in:
+        for line in input_log_f_in:
+            parser.parse_line(line)
+
+
+def parse_resources(
+        *resource_names: str, package: Optional[str] = None, **parser_kwargs: Any
+) -> SanitizerLogParser:
+    # Each log is parsed line by line, as the package of its resource name unless package is given.
+    parser = SanitizerLogParser(**parser_kwargs)
+    for resource_name in resource_names:
+        parser.set_package(package if package is not None else resource_name)
+        parse_resource_log(parser, resource_name)
+
+    return parser
+
+
+class SanitizerLogParserFixture:
+
+    def __init__(self, resource_name: str) -> None:
+        self.resource_name = resource_name
+        self._sanitizer_log_parser = None  # type: Optional[SanitizerLogParser]
+
+    @property
+    def resource_path(self) -> str:
+        return os.path.join(RESOURCES_PATH, self.resource_name)
+
+    @property
+    def input_log_path(self) -> str:
+        return get_input_log_path(self.resource_name)
+
+    @property
+    def expected_output_csv_path(self) -> str:
+        return os.path.join(self.resource_path, 'expected_output.csv')
+
+    @property
+    def expected_output_xml_path(self) -> str:
+        return os.path.join(self.resource_path, 'expected_output.xml')
+
+    @property
+    def sanitizer_log_parser(self) -> SanitizerLogParser:
+        if self._sanitizer_log_parser is None:
+            self._sanitizer_log_parser = parse_resources(self.resource_name)
+
+        return self._sanitizer_log_parser
+
+    @property
+    def report_csv(self) -> DictReader:
+        return DictReader(self.sanitizer_log_parser.get_csv().split('\n'))
+
+    @property
+    def expected_csv(self) -> DictReader:
+        with open(self.expected_output_csv_path, 'r') as expected_output_csv_f_in:
+            return DictReader(expected_output_csv_f_in.read().split('\n'))
+
+    @property
+    def report_xml(self) -> eTree.Element:
+        return eTree.fromstring(self.sanitizer_log_parser.get_xml())
+
+    @property
+    def expected_xml(self) -> eTree.Element:
+        with open(self.expected_output_xml_path, 'r') as expected_output_xml_f_in:
+            return eTree.parse(expected_output_xml_f_in).getroot()
@@ -12,14 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from csv import DictReader
+import os
+from pathlib import Path
+import shutil
+from types import SimpleNamespace
+import xml.etree.cElementTree as eTree
 
 from colcon_core.event.job import JobEnded
+from colcon_core.event_reactor import EventReactorShutdown
 from colcon_sanitizer_reports.event_handlers.sanitizer_report import SanitizerReportEventHandler
-from mock import patch
+from colcon_sanitizer_reports.merge import main as merge_main
+from mock import Mock, patch
 
 
 def test_event_handler_asan_report():
     extension = SanitizerReportEventHandler()
+
+    # The log parser is only created once the first event is handled.
+    assert extension._log_parser is None
+
     with patch(
         'colcon_sanitizer_reports.event_handlers.sanitizer_report.'
         'SanitizerReportEventHandler._handle'
@@ -37,3 +49,61 @@ def test_event_handler_asan_report():
         handler.reset_mock()
         extension(('unknown', None))
         assert handler.call_count == 0
+
+
+def test_event_handler_closes_symbolizer_on_shutdown(monkeypatch):
+    monkeypatch.setenv('COLCON_SANITIZER_REPORTS_SYMBOLIZER', 'llvm-symbolizer')
+    symbolizer = Mock()
+    extension = SanitizerReportEventHandler()
+    with patch('shutil.which', return_value='/usr/bin/llvm-symbolizer'), patch(
+        'colcon_sanitizer_reports.symbolizer.SanitizerSymbolizer', return_value=symbolizer
+    ):
+        extension._get_log_parser()
+
+    extension((EventReactorShutdown(), None))
+    assert symbolizer.close.call_count == 1
+
+
+def test_event_handler_writes_xml_shards(tmpdir, monkeypatch):
+    resources_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+    packages = ('data_race_different_keys', 'segv')
+    log_path = tmpdir.join('log')
+    for package in packages:
+        log_path.join(package).ensure(dir=True)
+        shutil.copy(
+            os.path.join(resources_path, package, 'input.log'),
+            str(log_path.join(package, 'stdout_stderr.log')),
+        )
+
+    shards_path = tmpdir.join('shards')
+    monkeypatch.chdir(str(tmpdir))
+    monkeypatch.setenv('COLCON_SANITIZER_REPORTS_XML_SHARDS_DIRECTORY', str(shards_path))
+
+    extension = SanitizerReportEventHandler()
+    with patch(
+        'colcon_sanitizer_reports.event_handlers.sanitizer_report.get_log_path',
+        return_value=Path(str(log_path)),
+    ):
+        for package in packages:
+            extension((JobEnded(package, 0), SimpleNamespace(identifier=package)))
+            shard = eTree.parse(str(shards_path.join(package + '.xml'))).getroot()
+            assert [testcase.get('name') for testcase in shard.findall('testcase')] == [package]
+
+            # The records of the package are released once its shards are written.
+            assert not list(extension._log_parser.get_records())
+
+    assert sorted(os.listdir(str(shards_path))) == \
+        sorted(package + suffix for package in packages for suffix in ('.jsonl', '.xml'))
+
+    # The reports of all packages are not rewritten per job, but merged from the partial reports.
+    for filename in (
+        'test_results.xml', 'sanitizer_report.csv', 'sanitizer_report_partial.jsonl'
+    ):
+        assert not tmpdir.join(filename).exists()
+    csv_path = tmpdir.join('sanitizer_report.csv')
+    assert merge_main([
+        *(str(shards_path.join(package + '.jsonl')) for package in packages),
+        '--csv', str(csv_path),
+    ]) == 0
+    with open(str(csv_path), 'r') as csv_f_in:
+        assert {row['package'] for row in DictReader(csv_f_in)} == set(packages)
@@ -0,0 +1,115 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from csv import DictReader
+
+from colcon_sanitizer_reports.global_report import get_global_records, SanitizerGlobalKey
+from colcon_sanitizer_reports.merge import main
+from colcon_sanitizer_reports.partial_report import write_partial_report
+from colcon_sanitizer_reports.sanitizer_log_parser import DEGRADED_OUTPUT_NAME, SanitizerLogParser
+
+from . import get_input_log_path, parse_resource_log
+
+# Packages and the resource logs that their tests write, several times over for some packages.
+_RESOURCE_NAMES_BY_PACKAGE = {
+    'package_a': ('data_race_different_keys',),
+    'package_b': ('data_race_different_keys', 'data_race_different_keys', 'segv'),
+    'package_c': ('data_race_different_keys', 'lock_order_inversion_same_key'),
+}
+
+
+def _parse() -> SanitizerLogParser:
+    parser = SanitizerLogParser()
+    for package, resource_names in _RESOURCE_NAMES_BY_PACKAGE.items():
+        parser.set_package(package)
+        for resource_name in resource_names:
+            parse_resource_log(parser, resource_name)
+
+    return parser
+
+
+def test_global_records_combine_packages() -> None:
+    records = list(_parse().get_records())
+    global_records = get_global_records(records)
+
+    global_keys = sorted({
+        SanitizerGlobalKey(
+            record.output_primary_key.error_name, record.output_primary_key.stack_trace_key
+        )
+        for record in records
+    })
+    assert [global_record.global_key for global_record in global_records] == global_keys
+    assert sum(global_record.count for global_record in global_records) == \
+        sum(record.count for record in records)
+
+    for global_record in global_records:
+        assert global_record.count == sum(count for _, count in global_record.count_by_package)
+        counts = [count for _, count in global_record.count_by_package]
+        assert counts == sorted(counts, reverse=True)
+        if global_record.global_key.error_name == 'data race':
+            # package_b ran into each data race twice as often as the other packages.
+            assert [package for package, _ in global_record.count_by_package][0] == 'package_b'
+            assert len(global_record.count_by_package) == 3
+
+
+def test_global_csv() -> None:
+    parser = _parse()
+    global_csv = list(DictReader(parser.get_global_csv().split('\n')))
+
+    assert len(global_csv) == len(get_global_records(parser.get_records()))
+    for line in global_csv:
+        packages = line['packages'].split(' ')
+        assert int(line['package_count']) == len(packages)
+        assert int(line['count']) == sum(int(package.split(':')[1]) for package in packages)
+        assert line['sample_stack_trace']
+
+
+def test_merge_command_global_csv(tmpdir) -> None:
+    shard_path = str(tmpdir.join('shard.jsonl'))
+    with open(shard_path, 'w') as f_out:
+        write_partial_report(_parse().get_records(), f_out)
+    global_csv_path = str(tmpdir.join('sanitizer_report_global.csv'))
+
+    assert main(['--global-csv', global_csv_path, shard_path, shard_path]) == 0
+
+    with open(global_csv_path, 'r') as f_in:
+        global_csv = list(DictReader(f_in))
+    expected_global_records = get_global_records(_parse().get_records())
+    assert [int(line['count']) for line in global_csv] == \
+        [2 * global_record.count for global_record in expected_global_records]
+    assert all('count_error' in line for line in global_csv)
+
+
+def test_merge_command_global_csv_leaves_out_degraded_marks(tmpdir) -> None:
+    parser = SanitizerLogParser()
+    shard_paths = []
+    for package in ('package_a', 'package_b'):
+        parser.set_package(package)
+        assert parser.parse_log_file(
+            get_input_log_path('data_race_different_keys'), time_budget=0
+        )
+        shard_paths.append(str(tmpdir.join(package + '.jsonl')))
+        with open(shard_paths[-1], 'w') as f_out:
+            parser.write_partial(f_out, package=package)
+    global_csv_path = str(tmpdir.join('sanitizer_report_global.csv'))
+
+    assert main(['--global-csv', global_csv_path, *shard_paths]) == 0
+
+    with open(global_csv_path, 'r') as f_in:
+        global_csv = list(DictReader(f_in))
+    assert [(line['error_name'], line['packages']) for line in global_csv] == [
+        (line['error_name'], line['packages'])
+        for line in DictReader(parser.get_global_csv().split('\n'))
+    ]
+    assert global_csv and all(line['error_name'] != DEGRADED_OUTPUT_NAME for line in global_csv)
@@ -0,0 +1,66 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import subprocess
+import sys
+from typing import Dict, Set
+
+# colcon imports and creates every event handler on every invocation, so creating the
+# sanitizer_report event handler must not import any of these modules. They are imported when the
+# enabled event handler handles its first event.
+_DEFERRED_MODULES = (
+    'colcon_sanitizer_reports._log_file_chunks',
+    'colcon_sanitizer_reports.partial_report',
+    'colcon_sanitizer_reports.sanitizer_log_parser',
+    'colcon_sanitizer_reports.suppressions',
+    'colcon_sanitizer_reports.xml_output_generator',
+    'xml.dom.minidom',
+    'xml.etree.ElementTree',
+)
+
+# Imports the event handler module, creates the event handler like colcon does, and prints the
+# modules that this imported on top of colcon itself along with the import time in microseconds.
+_BENCHMARK = """
+import json
+import sys
+import time
+
+import colcon_core.event_handler
+import colcon_core.location
+import colcon_output.event_handler.log
+
+modules_before = set(sys.modules)
+start = time.perf_counter()
+from colcon_sanitizer_reports.event_handlers.sanitizer_report import SanitizerReportEventHandler
+SanitizerReportEventHandler()
+import_time_us = int((time.perf_counter() - start) * 1e6)
+print(json.dumps({
+    'modules': sorted(set(sys.modules) - modules_before),
+    'import_time_us': import_time_us,
+}))
+"""
+
+
+def _run_benchmark() -> Dict:
+    output = subprocess.check_output([sys.executable, '-c', _BENCHMARK])
+    return json.loads(output.decode())
+
+
+def test_event_handler_defers_imports():
+    result = _run_benchmark()
+    imported_modules = set(result['modules'])  # type: Set[str]
+
+    assert not imported_modules.intersection(_DEFERRED_MODULES)
+    print('sanitizer_report event handler import time: {}us'.format(result['import_time_us']))
@@ -0,0 +1,136 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import defaultdict
+import os
+import re
+from typing import Dict
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from colcon_sanitizer_reports.metrics import (
+    SanitizerMetrics, start_metrics_server, write_metrics_textfile
+)
+from colcon_sanitizer_reports.sanitizer_log_parser import SanitizerLogParser
+import pytest
+
+from . import get_input_log_path
+
+_RESOURCE_NAMES = (
+    'data_race_different_keys',
+    'segv',
+)
+
+_FIND_SAMPLE_LINE_REGEX = re.compile(r'^(?P<name>[a-z_]+)(?P<labels>\{.*\})? (?P<value>\S+)$')
+
+
+def _get_samples(text: str) -> Dict[str, str]:
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+
+        match = _FIND_SAMPLE_LINE_REGEX.match(line)
+        assert match is not None, line
+        samples[match.group('name') + (match.group('labels') or '')] = match.group('value')
+
+    return samples
+
+
+def _parse(parser: SanitizerLogParser, metrics: SanitizerMetrics) -> None:
+    for resource_name in _RESOURCE_NAMES:
+        parser.set_package(resource_name)
+        log_path = get_input_log_path(resource_name)
+        parser.parse_log_file(log_path)
+        metrics.set_package_metrics(resource_name, 0.5, os.path.getsize(log_path))
+
+
+def test_metrics_text() -> None:
+    parser = SanitizerLogParser()
+    metrics = SanitizerMetrics(parser)
+    assert _get_samples(metrics.get_text())['sanitizer_reports_parsed_lines_total'] == '0'
+
+    _parse(parser, metrics)
+    samples = _get_samples(metrics.get_text())
+
+    line_count = 0
+    for resource_name in _RESOURCE_NAMES:
+        with open(get_input_log_path(resource_name), 'r') as f_in:
+            line_count += len(f_in.readlines())
+        assert samples[
+            'sanitizer_reports_package_parse_seconds{{package="{}"}}'.format(resource_name)
+        ] == '0.5'
+    assert samples['sanitizer_reports_parsed_lines_total'] == str(line_count)
+    assert samples['sanitizer_reports_open_sections'] == '0'
+
+    count_by_package_error_name = defaultdict(int)  # type: Dict[str, int]
+    for record in parser.get_records():
+        name = 'sanitizer_reports_errors{{package="{}",error_name="{}"}}'.format(
+            record.output_primary_key.package, record.output_primary_key.error_name
+        )
+        count_by_package_error_name[name] += record.count
+    assert {
+        name: int(value) for name, value in samples.items()
+        if name.startswith('sanitizer_reports_errors')
+    } == count_by_package_error_name
+
+
+def test_metrics_count_open_sections_and_evictions() -> None:
+    parser = SanitizerLogParser(max_keys_per_package=1)
+    metrics = SanitizerMetrics(parser)
+    _parse(parser, metrics)
+    assert int(_get_samples(metrics.get_text())['sanitizer_reports_evicted_keys_total']) > 0
+
+    parser.parse_line('==1==ERROR: AddressSanitizer: SEGV on unknown address 0x0')
+    parser.parse_line('==2==ERROR: AddressSanitizer: SEGV on unknown address 0x0')
+    assert _get_samples(metrics.get_text())['sanitizer_reports_open_sections'] == '2'
+
+
+def test_metrics_label_values_are_escaped() -> None:
+    parser = SanitizerLogParser()
+    metrics = SanitizerMetrics(parser)
+    metrics.set_package_metrics('package "a"\\b', 1.0, 0)
+    assert 'sanitizer_reports_package_log_bytes{package="package \\"a\\"\\\\b"} 0' in \
+        metrics.get_text().splitlines()
+
+
+def test_metrics_server() -> None:
+    parser = SanitizerLogParser()
+    metrics = SanitizerMetrics(parser)
+    _parse(parser, metrics)
+
+    server = start_metrics_server(metrics, 0)
+    try:
+        url = 'http://127.0.0.1:{}'.format(server.server_port)
+        with urlopen(url + '/metrics') as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert response.read().decode('utf-8') == metrics.get_text()
+
+        with pytest.raises(HTTPError):
+            urlopen(url + '/')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_write_metrics_textfile(tmpdir) -> None:
+    parser = SanitizerLogParser()
+    metrics = SanitizerMetrics(parser)
+    _parse(parser, metrics)
+
+    path = str(tmpdir.join('sanitizer_reports.prom'))
+    write_metrics_textfile(metrics, path)
+    with open(path, 'r') as f_in:
+        assert f_in.read() == metrics.get_text()
+    assert os.listdir(str(tmpdir)) == ['sanitizer_reports.prom']
@@ -0,0 +1,164 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from csv import DictReader
+import gzip
+from io import StringIO
+import os
+from typing import List
+import xml.etree.cElementTree as eTree
+
+from colcon_sanitizer_reports.merge import main
+from colcon_sanitizer_reports.partial_report import (
+    merge_partial_reports, read_partial_report, write_partial_report
+)
+from colcon_sanitizer_reports.sanitizer_log_parser import SanitizerLogParser, SanitizerReportRecord
+import pytest
+
+from . import parse_resources
+
+_RESOURCE_NAMES = (
+    'data_race_and_lock_order_inversion_interleaved_output',
+    'data_race_different_keys',
+    'detected_memory_leaks_multiple_subsections_direct_and_indirect_leaks',
+    'lock_order_inversion_same_key',
+    'segv',
+)
+
+
+def _round_trip(parser: SanitizerLogParser) -> List[SanitizerReportRecord]:
+    partial_f = StringIO()
+    write_partial_report(parser.get_records(), partial_f)
+    partial_f.seek(0)
+    return list(read_partial_report(partial_f))
+
+
+def _write_partial(parser: SanitizerLogParser, path: str) -> str:
+    with open(path, 'w') as f_out:
+        write_partial_report(parser.get_records(), f_out)
+
+    return path
+
+
+@pytest.mark.parametrize('resource_name', _RESOURCE_NAMES)
+def test_round_trip(resource_name: str) -> None:
+    parser = parse_resources(resource_name)
+    records = _round_trip(parser)
+
+    assert [record.output_primary_key for record in records] == \
+        [record.output_primary_key for record in parser.get_records()]
+    assert [record.count for record in records] == \
+        [record.count for record in parser.get_records()]
+    assert [record.sample_stack_trace.lines for record in records] == \
+        [record.sample_stack_trace.lines for record in parser.get_records()]
+
+
+def test_merge_disjoint_shards_matches_single_parser() -> None:
+    shards = [_round_trip(parse_resources(resource_name)) for resource_name in _RESOURCE_NAMES]
+    merged = list(merge_partial_reports(*shards))
+    expected = list(parse_resources(*_RESOURCE_NAMES).get_records())
+
+    assert [(record.output_primary_key, record.count) for record in merged] == \
+        [(record.output_primary_key, record.count) for record in expected]
+
+
+def test_merge_overlapping_shards_sums_counts() -> None:
+    shard = _round_trip(parse_resources(*_RESOURCE_NAMES))
+    merged = list(merge_partial_reports(shard, shard, shard))
+
+    assert [(record.output_primary_key, record.count) for record in merged] == \
+        [(record.output_primary_key, 3 * record.count) for record in shard]
+
+
+def test_read_rejects_unsorted_records() -> None:
+    partial_f = StringIO()
+    write_partial_report(reversed(list(parse_resources(*_RESOURCE_NAMES).get_records())), partial_f)
+    partial_f.seek(0)
+
+    with pytest.raises(ValueError):
+        list(read_partial_report(partial_f))
+
+
+def test_read_rejects_other_input() -> None:
+    with pytest.raises(ValueError):
+        list(read_partial_report(StringIO('package,error_name,stack_trace_key,count\n')))
+
+
+def test_merge_command(tmpdir) -> None:
+    shard_paths = [
+        _write_partial(parse_resources(*_RESOURCE_NAMES[:3]), str(tmpdir.join('shard1.jsonl'))),
+        _write_partial(parse_resources(*_RESOURCE_NAMES[2:]), str(tmpdir.join('shard2.jsonl'))),
+    ]
+    csv_path = str(tmpdir.join('sanitizer_report.csv'))
+    xml_path = str(tmpdir.join('test_results.xml'))
+
+    assert main(['--csv', csv_path, '--xml', xml_path, *shard_paths]) == 0
+
+    count_by_package = dict.fromkeys(_RESOURCE_NAMES, 0)
+    with open(csv_path, 'r') as f_in:
+        for line in DictReader(f_in):
+            count_by_package[line['package']] += int(line['count'])
+
+    expected_parser = parse_resources(*_RESOURCE_NAMES, _RESOURCE_NAMES[2])
+    for record in expected_parser.get_records():
+        count_by_package[record.output_primary_key.package] -= record.count
+    assert not any(count_by_package.values())
+
+    xml_tree = eTree.parse(xml_path).getroot()
+    assert xml_tree.get('tests') == str(len(_RESOURCE_NAMES))
+    assert len(xml_tree.findall('testcase')) == len(_RESOURCE_NAMES)
+
+
+def test_merge_command_requires_output() -> None:
+    assert main([os.devnull]) == 1
+
+
+def test_merge_command_stack_traces_by_hash(tmpdir) -> None:
+    shard_path = _write_partial(parse_resources(*_RESOURCE_NAMES), str(tmpdir.join('shard.jsonl')))
+    csv_path = str(tmpdir.join('sanitizer_report.csv'))
+    xml_path = str(tmpdir.join('test_results.xml'))
+    stack_traces_path = str(tmpdir.join('sanitizer_stack_traces.csv'))
+
+    assert main([
+        '--csv', csv_path, '--xml', xml_path, '--stack-traces', stack_traces_path, shard_path,
+        shard_path,
+    ]) == 0
+
+    with open(stack_traces_path, 'r') as f_in:
+        stack_trace_by_hash = {
+            line['stack_trace_hash']: line['stack_trace'] for line in DictReader(f_in)
+        }
+    expected_records = list(parse_resources(*_RESOURCE_NAMES).get_records())
+    assert len(stack_trace_by_hash) == \
+        len({record.sample_stack_trace.lines for record in expected_records})
+
+    with open(csv_path, 'r') as f_in:
+        csv_lines = list(DictReader(f_in))
+    assert [
+        stack_trace_by_hash[line['sample_stack_trace_hash']] for line in csv_lines
+    ] == ['\n'.join(record.sample_stack_trace.lines) for record in expected_records]
+
+    for error in eTree.parse(xml_path).getroot().findall('testcase/error'):
+        assert error.get('stack_trace_hash') in stack_trace_by_hash
+
+
+def test_merge_command_compresses_csv(tmpdir) -> None:
+    shard_path = _write_partial(parse_resources(*_RESOURCE_NAMES), str(tmpdir.join('shard.jsonl')))
+    csv_gz_path = str(tmpdir.join('sanitizer_report.csv.gz'))
+
+    assert main(['--csv', csv_gz_path, shard_path]) == 0
+
+    with gzip.open(csv_gz_path, 'rt', encoding='utf-8', newline='') as f_in:
+        assert len(list(DictReader(f_in))) == \
+            len(list(parse_resources(*_RESOURCE_NAMES).get_records()))
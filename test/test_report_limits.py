@@ -0,0 +1,194 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from csv import DictReader
+from io import StringIO
+from itertools import groupby
+from typing import Dict, List
+import xml.etree.cElementTree as eTree
+
+from colcon_sanitizer_reports._sanitizer_section_part_stack_trace import (
+    SanitizerSectionPartStackTrace
+)
+from colcon_sanitizer_reports.merge import main
+from colcon_sanitizer_reports.partial_report import write_partial_report
+from colcon_sanitizer_reports.report_limits import (
+    _get_size, limit_records, ReportLimits, ReportTruncation
+)
+from colcon_sanitizer_reports.sanitizer_log_parser import (
+    SanitizerLogParserOutputPrimaryKey, SanitizerReportRecord
+)
+from colcon_sanitizer_reports.xml_output_generator import write_xml_report
+
+from . import parse_resources
+
+_RESOURCE_NAMES = (
+    'data_race_and_lock_order_inversion_interleaved_output',
+    'data_race_different_keys',
+    'detected_memory_leaks_multiple_subsections_direct_and_indirect_leaks',
+    'lock_order_inversion_same_key',
+    'segv',
+)
+
+
+def _get_records_by_package(
+        records: List[SanitizerReportRecord]
+) -> Dict[str, List[SanitizerReportRecord]]:
+    return {
+        package: list(package_records) for package, package_records in groupby(
+            records, key=lambda record: record.output_primary_key.package
+        )
+    }
+
+
+def _get_truncation_properties(xml_tree: eTree.Element) -> Dict[str, str]:
+    return {
+        element.get('name'): element.get('value')
+        for element in xml_tree.findall('properties/property')
+    }
+
+
+def test_no_limits_orders_package_errors_by_count() -> None:
+    records = list(parse_resources(*_RESOURCE_NAMES).get_records())
+    truncation = ReportTruncation()
+    limited_records = list(limit_records(records, ReportLimits(), truncation))
+
+    assert not truncation.is_truncated
+    assert sorted(limited_records) == sorted(records)
+    for package_records in _get_records_by_package(limited_records).values():
+        counts = [record.count for record in package_records]
+        assert counts == sorted(counts, reverse=True)
+
+
+def test_max_errors_per_package_keeps_largest_counts() -> None:
+    records = list(parse_resources(*_RESOURCE_NAMES).get_records())
+    truncation = ReportTruncation()
+    limited_records = list(limit_records(
+        records, ReportLimits(max_errors_per_package=1), truncation
+    ))
+
+    records_by_package = _get_records_by_package(records)
+    assert [record.output_primary_key.package for record in limited_records] == \
+        list(records_by_package.keys())
+    for record in limited_records:
+        assert record.count == max(
+            package_record.count
+            for package_record in records_by_package[record.output_primary_key.package]
+        )
+
+    assert truncation.omitted_error_count == len(records) - len(limited_records)
+    assert truncation.omitted_occurrence_count == \
+        sum(record.count for record in records) - sum(record.count for record in limited_records)
+    assert truncation.omitted_stack_trace_line_count == 0
+
+
+def test_max_stack_trace_lines_shortens_samples() -> None:
+    records = list(parse_resources(*_RESOURCE_NAMES).get_records())
+    truncation = ReportTruncation()
+    limited_records = list(limit_records(
+        records, ReportLimits(max_stack_trace_lines=2), truncation
+    ))
+
+    assert len(limited_records) == len(records)
+    assert all(len(record.sample_stack_trace.lines) <= 2 for record in limited_records)
+    assert truncation.omitted_stack_trace_line_count == sum(
+        max(0, len(record.sample_stack_trace.lines) - 2) for record in records
+    )
+
+
+def test_max_bytes_leaves_out_errors() -> None:
+    records = list(parse_resources(*_RESOURCE_NAMES).get_records())
+    truncation = ReportTruncation()
+    limited_records = list(limit_records(records, ReportLimits(max_bytes=4096), truncation))
+
+    assert 0 < len(limited_records) < len(records)
+    assert sum(
+        len('\n'.join(record.sample_stack_trace.lines)) for record in limited_records
+    ) <= 4096
+    assert truncation.omitted_error_count == len(records) - len(limited_records)
+
+
+def test_max_bytes_keeps_largest_counts_across_packages() -> None:
+    # Many errors of an alphabetically early package occur once, and those of a later package
+    # occur often.
+    records = [
+        SanitizerReportRecord(
+            output_primary_key=SanitizerLogParserOutputPrimaryKey(
+                package, 'data race', 'key_{:03}'.format(key_i)
+            ),
+            count=count,
+            sample_stack_trace=SanitizerSectionPartStackTrace(
+                ('    #0 frame_{:03} /ros2/src/file.cpp:1'.format(key_i),)
+            ),
+        )
+        for package, count in (('package_a', 1), ('package_b', 100))
+        for key_i in range(100)
+    ]
+    truncation = ReportTruncation()
+    limited_records = list(limit_records(
+        records, ReportLimits(max_bytes=50 * _get_size(records[0])), truncation
+    ))
+
+    # Of equal counts, the errors that come first are kept.
+    assert [record.output_primary_key for record in limited_records] == \
+        [record.output_primary_key for record in records[100:150]]
+    assert truncation.omitted_error_count == 150
+    assert truncation.omitted_occurrence_count == 100 * 1 + 50 * 100
+
+
+def test_xml_records_truncation() -> None:
+    parser = parse_resources(*_RESOURCE_NAMES)
+    limits = ReportLimits(max_errors_per_package=1, max_stack_trace_lines=3)
+
+    xml_tree = eTree.fromstring(parser.get_xml(limits=limits))
+    assert len(xml_tree.findall('testcase/error')) == len(_RESOURCE_NAMES)
+    properties = _get_truncation_properties(xml_tree)
+    assert properties['truncated'] == 'true'
+    assert int(properties['omitted_errors']) > 0
+    assert int(properties['omitted_stack_trace_lines']) > 0
+
+    truncation = ReportTruncation()
+    xml_f = StringIO()
+    write_xml_report(
+        limit_records(parser.get_records(), limits, truncation), xml_f, truncation=truncation
+    )
+    assert _get_truncation_properties(eTree.fromstring(xml_f.getvalue())) == properties
+
+    assert not eTree.fromstring(parser.get_xml()).findall('properties')
+
+
+def test_merge_command_limits(tmpdir) -> None:
+    shard_path = str(tmpdir.join('shard.jsonl'))
+    with open(shard_path, 'w') as f_out:
+        write_partial_report(parse_resources(*_RESOURCE_NAMES).get_records(), f_out)
+    csv_path = str(tmpdir.join('sanitizer_report.csv'))
+    xml_path = str(tmpdir.join('test_results.xml'))
+    stack_traces_path = str(tmpdir.join('sanitizer_stack_traces.csv'))
+
+    assert main([
+        '--csv', csv_path, '--xml', xml_path, '--stack-traces', stack_traces_path,
+        '--max-errors-per-package', '1', '--max-stack-trace-lines', '3', shard_path,
+    ]) == 0
+
+    with open(csv_path, 'r') as f_in:
+        csv_lines = list(DictReader(f_in))
+    with open(stack_traces_path, 'r') as f_in:
+        stack_trace_by_hash = {
+            line['stack_trace_hash']: line['stack_trace'] for line in DictReader(f_in)
+        }
+    assert len(csv_lines) == len(_RESOURCE_NAMES)
+    for line in csv_lines:
+        assert len(stack_trace_by_hash[line['sample_stack_trace_hash']].split('\n')) <= 3
+
+    assert _get_truncation_properties(eTree.parse(xml_path).getroot())['truncated'] == 'true'
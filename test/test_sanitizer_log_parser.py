@@ -13,15 +13,27 @@
 # limitations under the License.
 
 from csv import DictReader
-import os
-from typing import Dict, Optional
+import gzip
+from io import StringIO
+import multiprocessing
+from typing import Dict, List, Optional, Set
 import xml.etree.cElementTree as eTree
 
+from colcon_sanitizer_reports import _log_file_chunks
+from colcon_sanitizer_reports._log_file_chunks import (
+    _RecordingSanitizerLogParser, ChunkParser, get_chunk_ranges
+)
+from colcon_sanitizer_reports.partial_report import read_partial_report
+from colcon_sanitizer_reports.report_limits import ReportLimits
 from colcon_sanitizer_reports.sanitizer_log_parser import (
+    _MAX_OPEN_SECTIONS_PER_PREFIX, DEGRADED_OUTPUT_NAME, open_csv_report, OTHER_OUTPUT_NAME,
     SanitizerLogParser, SanitizerLogParserOutputPrimaryKey
 )
+from colcon_sanitizer_reports.suppressions import SanitizerSuppressions
 import pytest
 
+from . import parse_resource_log, parse_resources, SanitizerLogParserFixture
+
 # Directory names of resources in test/resources. Directories should include 'input.log' and
 # 'expected_output.csv'.
 _RESOURCE_NAMES = (
@@ -34,62 +46,6 @@ _RESOURCE_NAMES = (
 )
 
 
-class SanitizerLogParserFixture:
-
-    def __init__(self, resource_name: str) -> None:
-        self.resource_name = resource_name
-        self._sanitizer_log_parser = None  # type: Optional[SanitizerLogParser]
-
-    @property
-    def resource_path(self) -> str:
-        return os.path.join(
-            os.path.dirname(os.path.abspath(__file__)), 'resources', self.resource_name
-        )
-
-    @property
-    def input_log_path(self) -> str:
-        return os.path.join(self.resource_path, 'input.log')
-
-    @property
-    def expected_output_csv_path(self) -> str:
-        return os.path.join(self.resource_path, 'expected_output.csv')
-
-    @property
-    def expected_output_xml_path(self) -> str:
-        return os.path.join(self.resource_path, 'expected_output.xml')
-
-    @property
-    def sanitizer_log_parser(self) -> SanitizerLogParser:
-        if self._sanitizer_log_parser is None:
-            parser = SanitizerLogParser()
-            parser.set_package(self.resource_name)
-            with open(self.input_log_path, 'r') as input_log_f_in:
-                for line in input_log_f_in.readlines():
-                    parser.parse_line(line)
-
-            self._sanitizer_log_parser = parser
-
-        return self._sanitizer_log_parser
-
-    @property
-    def report_csv(self) -> DictReader:
-        return DictReader(self.sanitizer_log_parser.get_csv().split('\n'))
-
-    @property
-    def expected_csv(self) -> DictReader:
-        with open(self.expected_output_csv_path, 'r') as expected_output_csv_f_in:
-            return DictReader(expected_output_csv_f_in.read().split('\n'))
-
-    @property
-    def report_xml(self) -> eTree.Element:
-        return eTree.fromstring(self.sanitizer_log_parser.get_xml())
-
-    @property
-    def expected_xml(self) -> eTree.Element:
-        with open(self.expected_output_xml_path, 'r') as expected_output_xml_f_in:
-            return eTree.parse(expected_output_xml_f_in).getroot()
-
-
 @pytest.fixture(params=_RESOURCE_NAMES)
 def sanitizer_log_parser_fixture(request) -> SanitizerLogParserFixture:
     return SanitizerLogParserFixture(request.param)
@@ -165,3 +121,742 @@ def test_xml_has_expected_errors(sanitizer_log_parser_fixture) -> None:
 
     if (case_actual is not None) and (case_reported is not None):
         assert len(case_reported.findall('error')) == len(case_actual.findall('error'))
+
+
+def _parse_approximate(resource_name: str, max_keys_per_package: int) -> SanitizerLogParser:
+    parser = parse_resources(resource_name, max_keys_per_package=max_keys_per_package)
+
+    return parser
+
+
+@pytest.mark.parametrize('resource_name', _RESOURCE_NAMES)
+def test_approximate_mode_is_exact_within_capacity(resource_name: str) -> None:
+    exact_parser = SanitizerLogParserFixture(resource_name).sanitizer_log_parser
+    exact_records = list(exact_parser.get_records())
+    approximate_records = list(_parse_approximate(resource_name, 1000).get_records())
+
+    assert [(record.output_primary_key, record.count, 0) for record in exact_records] == \
+        [(record.output_primary_key, record.count, record.count_error)
+         for record in approximate_records]
+
+
+@pytest.mark.parametrize('resource_name', _RESOURCE_NAMES)
+def test_approximate_mode_folds_tail_into_other(resource_name: str) -> None:
+    exact_parser = SanitizerLogParserFixture(resource_name).sanitizer_log_parser
+    exact_records = list(exact_parser.get_records())
+    parser = _parse_approximate(resource_name, 1)
+    approximate_records = list(parser.get_records())
+
+    assert sum(record.count for record in approximate_records) == \
+        sum(record.count for record in exact_records)
+    assert len([
+        record for record in approximate_records
+        if record.output_primary_key.error_name != OTHER_OUTPUT_NAME
+    ]) == min(1, len(exact_records))
+
+    report_csv = list(DictReader(parser.get_csv().split('\n')))
+    assert len(report_csv) == len(approximate_records)
+    assert all('count_error' in line for line in report_csv)
+    assert len(eTree.fromstring(parser.get_xml()).findall('testcase/error')) == \
+        len(approximate_records)
+
+
+@pytest.fixture
+def concatenated_log_path(tmpdir) -> str:
+    # All resource logs and runtime error lines, several times over, with and without their logging
+    # prefixes, so that sections cross chunk boundaries at many different places.
+    log_path = str(tmpdir.join('stdout_stderr.log'))
+    with open(log_path, 'w') as log_f_out:
+        for repeat in range(3):
+            for resource_name in _RESOURCE_NAMES:
+                input_log_path = SanitizerLogParserFixture(resource_name).input_log_path
+                with open(input_log_path, 'r') as input_log_f_in:
+                    for line in input_log_f_in:
+                        if repeat == 1 and line.startswith('1: '):
+                            line = line[len('1: '):]
+                        log_f_out.write(line)
+                log_f_out.writelines(line + '\n' for line in _RUNTIME_ERROR_LINES)
+
+    return log_path
+
+
+def _get_open_section_pids(parser: SanitizerLogParser) -> Dict[str, List[str]]:
+    return {
+        prefix: list(open_sections.keys())
+        for prefix, open_sections in parser._open_sections_by_prefix.items()
+    }
+
+
+@pytest.mark.parametrize('stitch_line_count', (0, 8, _log_file_chunks._STITCH_LINE_COUNT))
+@pytest.mark.parametrize('suppressions', (None, SanitizerSuppressions(['deadlock:*'])))
+@pytest.mark.parametrize('min_chunk_size', (1, 997, 20000))
+def test_parse_log_file_in_chunks_matches_sequential_parse(
+        concatenated_log_path: str, monkeypatch, suppressions: Optional[SanitizerSuppressions],
+        min_chunk_size: int, stitch_line_count: int
+) -> None:
+    # Worker processes are forked, so they aggregate from the patched line on.
+    monkeypatch.setattr(_log_file_chunks, '_STITCH_LINE_COUNT', stitch_line_count)
+
+    sequential_parser = SanitizerLogParser(suppressions=suppressions)
+    sequential_parser.set_package('package')
+    with open(concatenated_log_path, 'r') as log_f_in:
+        for line in log_f_in:
+            sequential_parser.parse_line(line)
+
+    chunked_parser = SanitizerLogParser(suppressions=suppressions)
+    chunked_parser.set_package('package')
+    chunked_parser.parse_log_file(concatenated_log_path, jobs=3, min_chunk_size=min_chunk_size)
+
+    assert [
+        (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+        for record in chunked_parser.get_records()
+    ] == [
+        (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+        for record in sequential_parser.get_records()
+    ]
+    assert chunked_parser.get_suppressions_csv() == sequential_parser.get_suppressions_csv()
+    assert _get_open_section_pids(chunked_parser) == _get_open_section_pids(sequential_parser)
+    assert chunked_parser.get_stats() == sequential_parser.get_stats()
+
+
+def test_parse_log_file_in_chunks_replays_aggregated_outcomes(tmpdir, monkeypatch) -> None:
+    # Sections of a few different keys, so that chunks are synchronized within their first lines
+    # and most outcomes of each chunk are aggregated. The frames below the key frame differ, so
+    # that the samples of each key do too. Runtime errors first occur in the middle of a chunk.
+    monkeypatch.setattr(_log_file_chunks, '_STITCH_LINE_COUNT', 64)
+    log_path = str(tmpdir.join('stdout_stderr.log'))
+    with open(log_path, 'w') as log_f_out:
+        for i in range(300):
+            log_f_out.writelines(
+                line.replace('_start', '_start_%d' % i) + '\n'
+                for line in _get_unprefixed_segv_section_lines(str(i % 7), 'function_%d' % (i % 5))
+            )
+            if i >= 160:
+                log_f_out.writelines(
+                    line.replace('2147483647', str(2147483000 + i)) + '\n'
+                    for line in _RUNTIME_ERROR_LINES
+                )
+
+    sequential_parser = SanitizerLogParser()
+    sequential_parser.set_package('package')
+    sequential_parser.parse_log_file(log_path)
+
+    chunked_parser = SanitizerLogParser()
+    chunked_parser.set_package('package')
+    chunked_parser.parse_log_file(log_path, jobs=3, min_chunk_size=1)
+
+    assert [
+        (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+        for record in chunked_parser.get_records()
+    ] == [
+        (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+        for record in sequential_parser.get_records()
+    ]
+    assert chunked_parser.get_stats() == sequential_parser.get_stats()
+
+
+def test_chunk_outcomes_are_aggregated_past_the_stitch_lines(monkeypatch) -> None:
+    monkeypatch.setattr(_log_file_chunks, '_STITCH_LINE_COUNT', 2)
+    parser = _RecordingSanitizerLogParser(suppressions=None)
+    parser.set_package('package')
+    result = parser.parse_chunk(_RUNTIME_ERROR_LINES * 100)
+
+    # Only the first lines are recorded one by one, the rest are aggregated per key.
+    assert [line_index for line_index, _, _ in result.outcomes] == [0, 1]
+    assert len(result.aggregated_outcomes) <= len(_RUNTIME_ERROR_LINES)
+    assert sum(outcome.count for outcome in result.aggregated_outcomes) == \
+        100 * len(_RUNTIME_ERROR_LINES) - 2
+    assert {outcome.method_name for outcome in result.aggregated_outcomes} == \
+        {'_add_runtime_error'}
+
+
+def test_chunk_parser_parses_a_bounded_number_of_chunks_ahead(concatenated_log_path: str) -> None:
+    chunk_ranges = get_chunk_ranges(concatenated_log_path, 4, 1)
+    chunk_parser = ChunkParser(
+        concatenated_log_path, chunk_ranges, jobs=2, package='package', suppressions=None
+    )
+    try:
+        for chunk_i in range(len(chunk_ranges)):
+            assert sorted(chunk_parser._worker_by_chunk_i) == \
+                list(range(chunk_i, min(chunk_i + 2, len(chunk_ranges))))
+            assert chunk_parser.get_result(chunk_i) is not None
+    finally:
+        chunk_parser.close()
+
+    assert not multiprocessing.active_children()
+
+
+def test_chunk_parser_raises_once_a_worker_fails(concatenated_log_path: str, monkeypatch) -> None:
+    def _parse_chunk(args):
+        raise ValueError('parse failed')
+    # Worker processes are forked, so they fail too.
+    monkeypatch.setattr(_log_file_chunks, '_parse_chunk', _parse_chunk)
+
+    parser = SanitizerLogParser()
+    parser.set_package('package')
+    with pytest.raises(RuntimeError):
+        parser.parse_log_file(concatenated_log_path, jobs=2, min_chunk_size=997)
+    assert not multiprocessing.active_children()
+
+
+def test_parse_log_file_continues_sequentially_once_a_chunk_is_parsed_twice(
+        tmpdir, monkeypatch, concatenated_log_path: str
+) -> None:
+    # A section that never gets its SUMMARY line stays open across every chunk boundary.
+    log_path = str(tmpdir.join('never_closed.log'))
+    with open(log_path, 'w') as log_f_out:
+        log_f_out.write('==1==ERROR: AddressSanitizer: SEGV on unknown address 0x000000000000\n')
+        with open(concatenated_log_path, 'r') as log_f_in:
+            log_f_out.write(log_f_in.read())
+
+    chunk_results = []  # type: List[int]
+    get_result = ChunkParser.get_result
+
+    def _get_result(self, chunk_i: int, **kwargs):
+        chunk_results.append(chunk_i)
+        return get_result(self, chunk_i, **kwargs)
+    monkeypatch.setattr(ChunkParser, 'get_result', _get_result)
+
+    sequential_parser = SanitizerLogParser()
+    sequential_parser.set_package('package')
+    sequential_parser.parse_log_file(log_path)
+
+    chunked_parser = SanitizerLogParser()
+    chunked_parser.set_package('package')
+    chunked_parser.parse_log_file(log_path, jobs=3, min_chunk_size=997)
+
+    # The second chunk is parsed again by the owning parser, which then parses the rest itself.
+    assert chunk_results == [0, 1]
+    assert chunked_parser.get_csv() == sequential_parser.get_csv()
+    assert chunked_parser.get_stats() == sequential_parser.get_stats()
+
+
+def test_sample_stack_traces_are_stored_once_across_packages() -> None:
+    parser = SanitizerLogParser()
+    for package in ('package_a', 'package_b', 'package_c'):
+        parser.set_package(package)
+        parse_resource_log(parser, 'data_race_different_keys')
+
+    records = list(parser.get_records())
+    stack_trace_hashes = {record.sample_stack_trace.content_hash for record in records}
+    assert len(records) == 3 * len(stack_trace_hashes)
+    assert parser._stack_trace_by_hash.keys() == stack_trace_hashes
+    assert len({id(record.sample_stack_trace) for record in records}) == len(stack_trace_hashes)
+
+
+def test_approximate_mode_drops_stack_traces_of_evicted_keys() -> None:
+    parser = _parse_approximate('data_race_different_keys', 1)
+
+    assert parser._stack_trace_by_hash.keys() == {
+        record.sample_stack_trace.content_hash for record in parser.get_records()
+        if record.output_primary_key.error_name != OTHER_OUTPUT_NAME
+    }
+
+
+def test_stack_traces_by_hash(sanitizer_log_parser_fixture) -> None:
+    parser = sanitizer_log_parser_fixture.sanitizer_log_parser
+    stack_trace_by_hash = {
+        line['stack_trace_hash']: line['stack_trace']
+        for line in DictReader(parser.get_stack_traces_csv().split('\n'))
+    }
+
+    report_csv = list(DictReader(parser.get_csv(inline_stack_traces=False).split('\n')))
+    inline_report_csv = list(sanitizer_log_parser_fixture.report_csv)
+    assert len(report_csv) == len(inline_report_csv)
+    for line, inline_line in zip(report_csv, inline_report_csv):
+        assert 'sample_stack_trace' not in line
+        assert stack_trace_by_hash[line['sample_stack_trace_hash']] == \
+            inline_line['sample_stack_trace']
+
+    errors = eTree.fromstring(parser.get_xml(inline_stack_traces=False)).findall('testcase/error')
+    assert len(errors) == len(report_csv)
+    for error in errors:
+        assert not (error.text or '').strip()
+        assert error.get('stack_trace_hash') in stack_trace_by_hash
+
+
+_RUNTIME_ERROR_LINES = (
+    '1: /ros2/rcutils/src/time.c:42:13: runtime error: signed integer overflow: 2147483647 + 1 '
+    "cannot be represented in type 'int'",
+    "1: /ros2/rcl/src/node.c:7:3: runtime error: load of null pointer of type 'int32_t'",
+    '1: /ros2/rcutils/src/time.c:42:13: runtime error: signed integer overflow: 2147483640 + 9 '
+    "cannot be represented in type 'int'",
+    "/ros2/rcl/src/node.c:9:1: runtime error: shift exponent 40 is too large for 32-bit type 'int'",
+    '1: /ros2/rcutils/src/time.c:42:13: runtime error: signed integer overflow: 2147483647 + 1 '
+    "cannot be represented in type 'int'",
+)
+
+
+def _parse_runtime_error_lines(**kwargs) -> SanitizerLogParser:
+    parser = SanitizerLogParser(**kwargs)
+    parser.set_package('package')
+    parser.parse_line('1: [ RUN      ] TestTime.overflow')
+    for line in _RUNTIME_ERROR_LINES:
+        parser.parse_line(line)
+
+    return parser
+
+
+@pytest.mark.parametrize('max_keys_per_package', (None, 1000))
+def test_runtime_errors_are_counted_by_kind_and_location(
+        max_keys_per_package: Optional[int]
+) -> None:
+    parser = _parse_runtime_error_lines(max_keys_per_package=max_keys_per_package)
+
+    assert [
+        (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+        for record in parser.get_records()
+    ] == [
+        (
+            SanitizerLogParserOutputPrimaryKey(
+                'package', "load of null pointer of type 'int32_t'", '/ros2/rcl/src/node.c:7:3'
+            ),
+            1,
+            (_RUNTIME_ERROR_LINES[1][len('1: '):],),
+        ),
+        (
+            SanitizerLogParserOutputPrimaryKey(
+                'package', "shift exponent N is too large for N-bit type 'int'",
+                '/ros2/rcl/src/node.c:9:1'
+            ),
+            1,
+            (_RUNTIME_ERROR_LINES[3],),
+        ),
+        (
+            SanitizerLogParserOutputPrimaryKey(
+                'package', 'signed integer overflow', '/ros2/rcutils/src/time.c:42:13'
+            ),
+            3,
+            (_RUNTIME_ERROR_LINES[0][len('1: '):],),
+        ),
+    ]
+    assert not parser._open_sections_by_prefix
+
+    errors = eTree.fromstring(parser.get_xml()).findall('testcase/error')
+    assert [error.get('count') for error in errors] == ['1', '1', '3']
+
+
+def test_runtime_errors_are_suppressed_by_check_name() -> None:
+    parser = _parse_runtime_error_lines(
+        suppressions=SanitizerSuppressions(['signed-integer-overflow:rcutils/src/time.c'])
+    )
+
+    assert [record.output_primary_key.error_name for record in parser.get_records()] == [
+        "load of null pointer of type 'int32_t'",
+        "shift exponent N is too large for N-bit type 'int'",
+    ]
+    assert list(DictReader(parser.get_suppressions_csv().split('\n'))) == [{
+        'package': 'package',
+        'error_name': 'signed integer overflow',
+        'suppression': 'signed-integer-overflow:rcutils/src/time.c',
+        'count': '3',
+    }]
+
+
+def test_write_csv_matches_get_csv(sanitizer_log_parser_fixture, tmpdir) -> None:
+    parser = sanitizer_log_parser_fixture.sanitizer_log_parser
+    csv_f_out = StringIO()
+    parser.write_csv(csv_f_out)
+    assert csv_f_out.getvalue() == parser.get_csv()
+
+    csv_gz_path = str(tmpdir.join('sanitizer_report.csv.gz'))
+    with open_csv_report(csv_gz_path) as csv_gz_f_out:
+        parser.write_csv(csv_gz_f_out)
+    with gzip.open(csv_gz_path, 'rt', encoding='utf-8', newline='') as csv_gz_f_in:
+        assert csv_gz_f_in.read() == parser.get_csv()
+
+
+def _get_unprefixed_segv_section_lines(pid: str, function_name: str) -> List[str]:
+    # The lines of the segv resource from its start line up to and including its ABORTING line,
+    # as a test without a ctest prefix would write them.
+    with open(SanitizerLogParserFixture('segv').input_log_path, 'r') as input_log_f_in:
+        lines = [line[len('1: '):].rstrip('\n') for line in input_log_f_in.readlines()[8:25]]
+
+    return [
+        line.replace('==5054==', '==' + pid + '==').replace(
+            'rcutils_logging_get_logger_effective_level', function_name
+        )
+        for line in lines
+    ]
+
+
+@pytest.mark.parametrize('interleave', ('nested', 'alternating_headers'))
+def test_sections_of_processes_without_prefix_are_demultiplexed(interleave: str) -> None:
+    lines_a = _get_unprefixed_segv_section_lines('5054', 'function_a')
+    lines_b = _get_unprefixed_segv_section_lines('6000', 'function_b')
+
+    sequential_parser = SanitizerLogParser()
+    sequential_parser.set_package('package')
+    for line in lines_a + lines_b:
+        sequential_parser.parse_line(line)
+
+    if interleave == 'nested':
+        # Process b writes its whole section in the middle of the stack trace of process a.
+        lines = lines_a[:5] + lines_b + lines_a[5:]
+    else:
+        # Both processes start a section, then continue with a line with a process id marker.
+        lines = lines_a[:1] + lines_b[:1] + lines_a[1:] + lines_b[1:]
+
+    parser = SanitizerLogParser()
+    parser.set_package('package')
+    for line in lines:
+        parser.parse_line(line)
+
+    records = [
+        (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+        for record in parser.get_records()
+    ]
+    assert records == [
+        (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+        for record in sequential_parser.get_records()
+    ]
+    assert len(records) == 2
+    assert not parser._open_sections_by_prefix
+
+
+def test_sections_of_processes_that_never_finish_are_dropped() -> None:
+    parser = SanitizerLogParser()
+    parser.set_package('package')
+    for pid in range(100):
+        parser.parse_line(
+            '=={pid}==ERROR: AddressSanitizer: SEGV on unknown address 0x0'.format(pid=pid)
+        )
+
+    assert [len(open_sections) for open_sections in parser._open_sections_by_prefix.values()] == \
+        [_MAX_OPEN_SECTIONS_PER_PREFIX]
+
+    for line in _get_unprefixed_segv_section_lines('5054', 'function_a'):
+        parser.parse_line(line)
+    assert [record.count for record in parser.get_records()] == [1]
+
+
+@pytest.mark.parametrize('max_keys_per_package', (None, 1))
+def test_package_records_and_xml(max_keys_per_package: Optional[int]) -> None:
+    parser = parse_resources(*_RESOURCE_NAMES, max_keys_per_package=max_keys_per_package)
+
+    records = [
+        (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+        for record in parser.get_records()
+    ]
+    for resource_name in _RESOURCE_NAMES:
+        assert [
+            (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+            for record in parser.get_records(package=resource_name)
+        ] == [record for record in records if record[0].package == resource_name]
+
+        xml_f_out = StringIO()
+        parser.write_xml(xml_f_out, package=resource_name)
+        testcases = eTree.fromstring(xml_f_out.getvalue()).findall('testcase')
+        assert [testcase.get('name') for testcase in testcases] == \
+            ([resource_name] if resource_name != 'no_errors' else [])
+
+    assert not list(parser.get_records(package='unknown_package'))
+
+
+@pytest.mark.parametrize('max_spilled_runs', (2, 64))
+def test_spilling_to_disk_keeps_counts(concatenated_log_path: str, monkeypatch, max_spilled_runs):
+    monkeypatch.setattr(
+        'colcon_sanitizer_reports.sanitizer_log_parser._MAX_SPILLED_RUNS', max_spilled_runs
+    )
+    parser = SanitizerLogParser()
+    spilling_parser = SanitizerLogParser(max_memory_bytes=4096)
+    for each_parser in (parser, spilling_parser):
+        each_parser.set_package('package')
+        each_parser.parse_log_file(concatenated_log_path)
+
+    assert 0 < len(spilling_parser._spilled_run_paths) <= max_spilled_runs
+    assert spilling_parser._memory_bytes <= 4096
+    spilled_records = list(spilling_parser.get_records())
+    assert [
+        (record.output_primary_key, record.count) for record in spilled_records
+    ] == [(record.output_primary_key, record.count) for record in parser.get_records()]
+    assert all(
+        record.sample_stack_trace.key == record.output_primary_key.stack_trace_key
+        for record in spilled_records
+    )
+
+    csv_f_out = StringIO()
+    spilling_parser.write_csv(csv_f_out)
+    assert len(list(DictReader(csv_f_out.getvalue().split('\n')))) == len(spilled_records)
+
+
+def test_spilled_package_records_are_read_from_runs_of_package(monkeypatch) -> None:
+    parser = SanitizerLogParser()
+    spilling_parser = SanitizerLogParser(max_memory_bytes=4096)
+    for resource_name in _RESOURCE_NAMES:
+        for each_parser in (parser, spilling_parser):
+            each_parser.set_package(resource_name)
+            each_parser.parse_log_file(SanitizerLogParserFixture(resource_name).input_log_path)
+
+    read_run_paths = []  # type: List[str]
+    read_spilled_run = SanitizerLogParser._read_spilled_run
+
+    def _read_spilled_run(path: str, packages: Set[str]):
+        read_run_paths.append(path)
+        return read_spilled_run(path, packages)
+    monkeypatch.setattr(SanitizerLogParser, '_read_spilled_run', staticmethod(_read_spilled_run))
+
+    for resource_name in _RESOURCE_NAMES:
+        assert [
+            (record.output_primary_key, record.count)
+            for record in spilling_parser.get_records(package=resource_name)
+        ] == [
+            (record.output_primary_key, record.count)
+            for record in parser.get_records(package=resource_name)
+        ]
+
+    # Each run was read for the few packages that it has records of, rather than for all of them.
+    assert len(spilling_parser._spilled_run_paths) > 1
+    assert len(read_run_paths) < len(spilling_parser._spilled_run_paths) * len(_RESOURCE_NAMES)
+
+
+def test_spilling_to_disk_requires_exact_mode() -> None:
+    with pytest.raises(ValueError):
+        SanitizerLogParser(max_keys_per_package=10, max_memory_bytes=4096)
+
+
+@pytest.mark.parametrize(
+    'parser_kwargs', ({}, {'max_keys_per_package': 2}, {'max_memory_bytes': 4096})
+)
+def test_released_packages_are_dropped(monkeypatch, parser_kwargs: Dict[str, int]) -> None:
+    # Spilled runs are merged often, so that they have records of several packages.
+    monkeypatch.setattr(
+        'colcon_sanitizer_reports.sanitizer_log_parser._MAX_SPILLED_RUNS', 2
+    )
+    parser = SanitizerLogParser(**parser_kwargs)
+    reference_parser = SanitizerLogParser(**parser_kwargs)
+    for resource_name in _RESOURCE_NAMES:
+        for each_parser in (parser, reference_parser):
+            each_parser.set_package(resource_name)
+            each_parser.parse_log_file(
+                SanitizerLogParserFixture(resource_name).input_log_path,
+                time_budget=0 if resource_name == 'segv' else None,
+            )
+
+    released_resource_names = _RESOURCE_NAMES[::2] + ('segv',)
+    for resource_name in released_resource_names:
+        parser.release_package(resource_name)
+
+    assert [
+        (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+        for record in parser.get_records()
+    ] == [
+        (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+        for record in reference_parser.get_records()
+        if record.output_primary_key.package not in released_resource_names
+    ]
+    assert not parser.degraded_packages
+
+    for resource_name in _RESOURCE_NAMES:
+        parser.release_package(resource_name)
+
+    assert not list(parser.get_records())
+    assert not parser._stack_trace_by_hash
+    assert not parser._spilled_run_paths
+    assert parser._memory_bytes == 0
+    assert parser.get_stats().parsed_line_count == reference_parser.get_stats().parsed_line_count
+
+
+def _get_error_names(records) -> Set[str]:
+    return {record.output_primary_key.error_name for record in records}
+
+
+@pytest.mark.parametrize('resource_name', _RESOURCE_NAMES)
+def test_time_budget_degrades_to_error_name_counts(resource_name: str) -> None:
+    fixture = SanitizerLogParserFixture(resource_name)
+    parser = SanitizerLogParser()
+    parser.set_package(resource_name)
+    assert parser.parse_log_file(fixture.input_log_path, time_budget=0)
+
+    # Headers are counted without waiting for the summary line, so sections that never finish, like
+    # the one in no_errors, are counted as well.
+    records = list(parser.get_records())
+    assert _get_error_names(records) >= _get_error_names(fixture.sanitizer_log_parser.get_records())
+    for record in records:
+        assert record.output_primary_key.stack_trace_key == DEGRADED_OUTPUT_NAME
+        assert len(record.sample_stack_trace.lines) == 1
+        assert record.output_primary_key.error_name in record.sample_stack_trace.lines[0]
+
+    testcases = eTree.fromstring(parser.get_xml()).findall('testcase')
+    assert [testcase.get('degraded') for testcase in testcases] == ['true'] * len(testcases)
+
+
+def test_time_budget_counts_open_sections() -> None:
+    parser = SanitizerLogParser()
+    parser.set_package('package')
+    lines = _get_unprefixed_segv_section_lines('5054', 'function_a')
+    for line in lines[:5]:
+        parser.parse_line(line)
+
+    parser._start_degraded_parse()
+    for line in lines[5:]:
+        parser._parse_degraded_line(line)
+
+    assert [(record.output_primary_key, record.count) for record in parser.get_records()] == [(
+        SanitizerLogParserOutputPrimaryKey(
+            'package', 'SEGV on unknown address', DEGRADED_OUTPUT_NAME
+        ),
+        1,
+    )]
+    assert not parser._open_sections_by_prefix
+
+
+@pytest.mark.parametrize('jobs', (1, 3))
+def test_time_budget_that_does_not_run_out(concatenated_log_path: str, jobs: int) -> None:
+    sequential_parser = SanitizerLogParser()
+    sequential_parser.set_package('package')
+    sequential_parser.parse_log_file(concatenated_log_path)
+
+    parser = SanitizerLogParser()
+    parser.set_package('package')
+    assert not parser.parse_log_file(
+        concatenated_log_path, jobs=jobs, min_chunk_size=997, time_budget=3600
+    )
+    assert parser.get_csv() == sequential_parser.get_csv()
+
+
+def test_time_budget_degrades_chunked_parse(concatenated_log_path: str) -> None:
+    sequential_parser = SanitizerLogParser()
+    sequential_parser.set_package('package')
+    sequential_parser.parse_log_file(concatenated_log_path)
+
+    parser = SanitizerLogParser()
+    parser.set_package('package')
+    assert parser.parse_log_file(concatenated_log_path, jobs=3, min_chunk_size=997, time_budget=0)
+
+    records = list(parser.get_records())
+    assert any(
+        record.output_primary_key.stack_trace_key == DEGRADED_OUTPUT_NAME for record in records
+    )
+    assert not parser._open_sections_by_prefix
+
+    # Runtime errors have no stack traces, so they are counted as usual.
+    def _get_runtime_error_count(records) -> int:
+        return sum(
+            record.count for record in records
+            if record.output_primary_key.error_name == 'signed integer overflow'
+        )
+    assert _get_runtime_error_count(records) == \
+        _get_runtime_error_count(sequential_parser.get_records())
+
+    # The processes that were still parsing chunks are stopped.
+    assert not multiprocessing.active_children()
+
+
+def _get_degraded_marks(parser: SanitizerLogParser) -> Dict[str, List[str]]:
+    """Return the packages that the csv and xml reports of parser mark as degraded."""
+    marks = {}  # type: Dict[str, List[str]]
+    marks['csv'] = [
+        row['package'] for row in DictReader(StringIO(parser.get_csv()))
+        if row['error_name'] == DEGRADED_OUTPUT_NAME and row['count'] == '0'
+    ]
+    xml_f_out = StringIO()
+    parser.write_xml(xml_f_out)
+    for output, xml in (('xml', xml_f_out.getvalue()), ('get_xml', parser.get_xml())):
+        marks[output] = [
+            testcase.get('name') for testcase in eTree.fromstring(xml).findall('testcase')
+            if testcase.get('degraded') == 'true'
+        ]
+
+    return marks
+
+
+def test_time_budget_marks_package_without_errors(tmpdir) -> None:
+    log_path = tmpdir.join('stdout_stderr.log')
+    log_path.write('[ RUN      ] test\n[       OK ] test\n')
+
+    parser = SanitizerLogParser()
+    parser.set_package('package')
+    assert parser.parse_log_file(str(log_path), time_budget=0)
+
+    assert parser.degraded_packages == {'package'}
+    assert not list(parser.get_records())
+    assert _get_degraded_marks(parser) == {
+        'csv': ['package'], 'xml': ['package'], 'get_xml': ['package']
+    }
+    testcase = eTree.fromstring(parser.get_xml()).find('testcase')
+    assert testcase.get('errors') == '0' and not testcase.findall('error')
+
+    # Partial reports keep the mark, so that merged reports have it as well.
+    partial_f_out = StringIO()
+    parser.write_partial(partial_f_out)
+    assert [
+        record.output_primary_key for record in read_partial_report(
+            StringIO(partial_f_out.getvalue())
+        )
+    ] == [SanitizerLogParserOutputPrimaryKey('package', DEGRADED_OUTPUT_NAME, DEGRADED_OUTPUT_NAME)]
+
+
+@pytest.mark.parametrize('limits', (
+    ReportLimits(max_errors_per_package=1), ReportLimits(max_bytes=1)
+))
+def test_time_budget_marks_package_whose_degraded_errors_are_left_out(
+        tmpdir, limits: ReportLimits
+) -> None:
+    parser = SanitizerLogParser()
+    parser.set_package('package')
+    for _ in range(3):
+        for line in _get_unprefixed_segv_section_lines('5054', 'function_a'):
+            parser.parse_line(line)
+    log_path = tmpdir.join('stdout_stderr.log')
+    log_path.write('\n'.join(_get_unprefixed_segv_section_lines('5054', 'function_b')) + '\n')
+    assert parser.parse_log_file(str(log_path), time_budget=0)
+
+    rows = list(DictReader(StringIO(parser.get_csv(limits=limits))))
+    assert [(row['error_name'], row['stack_trace_key']) for row in rows][0] == \
+        (DEGRADED_OUTPUT_NAME, DEGRADED_OUTPUT_NAME)
+    assert not any(
+        row['stack_trace_key'] == DEGRADED_OUTPUT_NAME for row in rows[1:]
+    )
+    testcase = eTree.fromstring(parser.get_xml(limits=limits)).find('testcase')
+    assert testcase.get('degraded') == 'true'
+
+
+def test_time_budget_marks_package_whose_degraded_errors_are_evicted(tmpdir) -> None:
+    log_path = tmpdir.join('stdout_stderr.log')
+    with open(str(log_path), 'w') as f_out:
+        f_out.write(_get_unprefixed_segv_section_lines('5054', 'function_a')[1] + '\n')
+        for _ in range(5):
+            f_out.write('/ros2/src/node.cpp:3:5: runtime error: signed integer overflow\n')
+
+    parser = SanitizerLogParser(max_keys_per_package=1)
+    parser.set_package('package')
+    assert parser.parse_log_file(str(log_path), time_budget=0)
+
+    assert [
+        record.output_primary_key.stack_trace_key for record in parser.get_records()
+    ] == [OTHER_OUTPUT_NAME, '/ros2/src/node.cpp:3:5']
+    assert _get_degraded_marks(parser) == {
+        'csv': ['package'], 'xml': ['package'], 'get_xml': ['package']
+    }
+
+
+def test_time_budget_degrades_stitching(tmpdir, monkeypatch) -> None:
+    # The section of process 1 is never closed, so the second chunk is parsed again while it is
+    # stitched.
+    log_path = tmpdir.join('stdout_stderr.log')
+    with open(str(log_path), 'w') as f_out:
+        f_out.write(_get_unprefixed_segv_section_lines('1', 'function_a')[1] + '\n')
+        for _ in range(200):
+            f_out.write('\n'.join(_get_unprefixed_segv_section_lines('2', 'function_b')) + '\n')
+
+    # Chunk results arrive however long they take, so that the deadline passes while stitching.
+    get_result = ChunkParser.get_result
+    monkeypatch.setattr(
+        ChunkParser, 'get_result', lambda self, chunk_i, timeout=None: get_result(self, chunk_i)
+    )
+    parsed_lines = []  # type: List[str]
+    parse_line = SanitizerLogParser.parse_line
+
+    def _parse_line(self, line: str) -> None:
+        parsed_lines.append(line)
+        parse_line(self, line)
+    monkeypatch.setattr(SanitizerLogParser, 'parse_line', _parse_line)
+
+    parser = SanitizerLogParser()
+    parser.set_package('package')
+    assert parser.parse_log_file(str(log_path), jobs=2, min_chunk_size=1024, time_budget=0)
+
+    assert not parsed_lines
+    assert sum(record.count for record in parser.get_records()) == 1 + 200
+    assert not multiprocessing.active_children()
@@ -0,0 +1,61 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import Counter
+import random
+
+from colcon_sanitizer_reports._space_saving_counter import SpaceSavingCounter
+
+
+def test_exact_below_capacity():
+    counter = SpaceSavingCounter(3)
+    for key in 'abacab':
+        assert counter.add(key) is None
+
+    assert sorted(counter.items()) == [('a', 3, 0), ('b', 2, 0), ('c', 1, 0)]
+    assert counter.total == 6
+    assert counter.eviction_count == 0
+
+
+def test_evicts_oldest_minimum():
+    counter = SpaceSavingCounter(2)
+    counter.add('a')
+    counter.add('a')
+    counter.add('b')
+
+    assert counter.add('c') == 'b'
+    assert sorted(counter.items()) == [('a', 2, 0), ('c', 2, 1)]
+    assert counter.eviction_count == 1
+
+
+def test_error_bounds_hold():
+    rng = random.Random(0)
+    keys = [min(int(rng.paretovariate(1.0)), 1000) for _ in range(20000)]
+    true_count_by_key = Counter(keys)
+
+    capacity = 50
+    counter = SpaceSavingCounter(capacity)
+    for key in keys:
+        counter.add(key)
+
+    items = list(counter.items())
+    assert len(items) == capacity
+    assert sum(count for _, count, _ in items) == len(keys)
+    for key, count, error in items:
+        assert count - error <= true_count_by_key[key] <= count
+
+    monitored_keys = {key for key, _, _ in items}
+    for key, true_count in true_count_by_key.items():
+        if true_count > len(keys) / capacity:
+            assert key in monitored_keys
@@ -0,0 +1,111 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from csv import DictReader
+
+from colcon_sanitizer_reports.suppressions import SanitizerSuppressions
+import pytest
+
+from . import parse_resources
+
+_FRAME = '    #1 rclcpp::Node::Node() /ros2/src/rclcpp/node.cpp:42 (librclcpp.so+0x1a2b3c)'
+
+
+@pytest.mark.parametrize('suppression,error_name,is_match', (
+    ('race:librclcpp.so', 'data race', True),
+    ('race:librclcpp.so', 'lock-order-inversion', False),
+    ('deadlock:librclcpp.so', 'lock-order-inversion', True),
+    ('lock-order-inversion:librclcpp.so', 'lock-order-inversion', True),
+    ('SEGV on unknown address:rclcpp::*::Node', 'SEGV on unknown address', True),
+    ('*:node.cpp', 'heap-use-after-free', True),
+    ('race:^rclcpp::Node::Node$', 'data race', True),
+    ('race:^Node::Node', 'data race', False),
+    ('race:librclcpp$', 'data race', False),
+    ('race:rclcpp::Executor', 'data race', False),
+))
+def test_match(suppression: str, error_name: str, is_match: bool) -> None:
+    suppressions = SanitizerSuppressions(['# comment', '', suppression])
+    expected = suppression if is_match else None
+    assert suppressions.match(error_name, _FRAME, is_top_frame=True) == expected
+
+
+def test_match_reports_matching_suppression() -> None:
+    suppressions = SanitizerSuppressions(
+        ['race:libfastrtps.so', 'race:node.cpp', 'race_top:librclcpp.so']
+    )
+    assert suppressions.match('data race', _FRAME, is_top_frame=False) == 'race:node.cpp'
+    assert suppressions.has_suppressions('data race')
+    assert not suppressions.has_suppressions('detected memory leaks')
+
+
+def test_race_top_only_matches_top_frame() -> None:
+    suppressions = SanitizerSuppressions(['race_top:librclcpp.so'])
+    assert suppressions.match('data race', _FRAME, is_top_frame=True) is not None
+    assert suppressions.match('data race', _FRAME, is_top_frame=False) is None
+
+
+def test_invalid_suppression() -> None:
+    with pytest.raises(ValueError):
+        SanitizerSuppressions(['race'])
+
+
+def test_parser_drops_suppressed_sections() -> None:
+    parser = parse_resources(
+        'data_race_different_keys',
+        suppressions=SanitizerSuppressions(['race:reactive_socket_service_base::construct']),
+    )
+
+    assert not list(parser.get_records())
+    suppressions_csv = list(DictReader(parser.get_suppressions_csv().split('\n')))
+    assert [(line['error_name'], line['suppression'], line['count']) for line in suppressions_csv] \
+        == [('data race', 'race:reactive_socket_service_base::construct', '1')]
+
+
+def test_parser_only_matches_first_stack_trace() -> None:
+    # receive_from is only in the second stack trace of the data race.
+    parser = parse_resources(
+        'data_race_different_keys', suppressions=SanitizerSuppressions(['race:receive_from'])
+    )
+
+    assert len(list(parser.get_records())) == 2
+    assert len(list(DictReader(parser.get_suppressions_csv().split('\n')))) == 0
+
+
+def test_parser_keeps_unsuppressed_interleaved_sections() -> None:
+    resource_name = 'data_race_and_lock_order_inversion_interleaved_output'
+    parser = parse_resources(resource_name, suppressions=SanitizerSuppressions(['deadlock:*']))
+
+    assert {record.output_primary_key.error_name for record in parser.get_records()} == \
+        {'data race'}
+    assert len(list(DictReader(parser.get_suppressions_csv().split('\n')))) == 1
+
+
+def test_parser_keeps_unsuppressed_leaks_of_leak_section() -> None:
+    # Each leak of a detected memory leaks section is a separate error, so only the matching leak
+    # is dropped.
+    resource_name = 'detected_memory_leaks_multiple_subsections_direct_and_indirect_leaks'
+    parser = parse_resources(
+        resource_name,
+        suppressions=SanitizerSuppressions(['leak:rosidl_generator_c__octet__Sequence__init']),
+    )
+
+    assert {record.output_primary_key.stack_trace_key for record in parser.get_records()} == {
+        'rosidl_generator_c__boolean__Sequence__init '
+        '(/ros2_install/rosidl_generator_c/lib/librosidl_generator_c.so+0xX)',
+        'rclcpp::NodeOptions::get_rcl_node_options() const '
+        '(/ros2_install/rclcpp/lib/librclcpp.so+0xX)',
+    }
+    suppressions_csv = list(DictReader(parser.get_suppressions_csv().split('\n')))
+    assert [(line['error_name'], line['suppression'], line['count']) for line in suppressions_csv] \
+        == [('detected memory leaks', 'leak:rosidl_generator_c__octet__Sequence__init', '1')]
@@ -0,0 +1,216 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+from typing import List, Tuple
+
+from colcon_sanitizer_reports.sanitizer_log_parser import SanitizerLogParser
+from colcon_sanitizer_reports.symbolizer import SanitizerSymbolizer
+import pytest
+
+# Answers like llvm-symbolizer, with an inlined function for offset 0x2, nothing for offset 0xbad,
+# and no location for offset 0xf00. Each start and request is logged to the file given as argument.
+_FAKE_SYMBOLIZER = """
+import sys
+
+with open(sys.argv[1], 'a') as f_out:
+    f_out.write('start\\n')
+for line in sys.stdin:
+    with open(sys.argv[1], 'a') as f_out:
+        f_out.write(line)
+    module, offset = line.rsplit(' ', 1)
+    assert module.startswith('"') and module.endswith('"'), module
+    offset = offset.strip()
+    if offset == '0xbad':
+        sys.stdout.write('??\\n??:0:0\\n\\n')
+    elif offset == '0xf00':
+        sys.stdout.write('function_f00\\n??:0:0\\n\\n')
+    else:
+        if offset == '0x2':
+            sys.stdout.write('inlined_function\\n/ros2/src/rclcpp/inlined.hpp:7:3\\n')
+        sys.stdout.write('function_{0}\\n/ros2/src/rclcpp/node.cpp:{0}:0\\n\\n'.format(
+            int(offset, 16)
+        ))
+    sys.stdout.flush()
+"""
+
+
+class _FakeSymbolizer:
+
+    def __init__(self, tmpdir) -> None:
+        script_path = tmpdir.join('fake_symbolizer.py')
+        script_path.write(_FAKE_SYMBOLIZER)
+        self.log_path = tmpdir.join('fake_symbolizer.log')
+        self.command = (sys.executable, str(script_path), str(self.log_path))
+
+        tmpdir.ensure('ros2', 'lib', dir=True)
+        self.module_path = tmpdir.join('ros2', 'lib', 'librclcpp.so')
+        self.module_path.write('module')
+        self.module = str(self.module_path)
+
+    def get_requests(self) -> List[str]:
+        if not self.log_path.check():
+            return []
+
+        return self.log_path.read().splitlines()
+
+
+@pytest.fixture
+def fake_symbolizer(tmpdir) -> _FakeSymbolizer:
+    return _FakeSymbolizer(tmpdir)
+
+
+def test_symbolize_rewrites_unsymbolized_frames(fake_symbolizer: _FakeSymbolizer) -> None:
+    module = fake_symbolizer.module
+    symbolizer = SanitizerSymbolizer(fake_symbolizer.command)
+    try:
+        assert symbolizer.symbolize((
+            'READ of size 4 at 0x602000000010 thread T0',
+            '    #0 0x7f0000000001  ({module}+0x1)'.format(**locals()),
+            '    #1 <null> <null> ({module}+0x1)'.format(**locals()),
+            '    #2 0x7f0000000002  ({module}+0x2)'.format(**locals()),
+            '    #3 0x7f0000000003  ({module}+0xf00)'.format(**locals()),
+            '    #4 <null> <null> ({module}+0xf00)'.format(**locals()),
+            '    #5 0x7f0000000004  ({module}+0xbad)'.format(**locals()),
+            '    #6 <null> <null> (libtsan.so.0+0x2bcfe)',
+            '    #7 0x7f0000000005 in main /ros2/src/main.cpp:3 ({module}+0x5)'.format(**locals()),
+        )) == (
+            'READ of size 4 at 0x602000000010 thread T0',
+            '    #0 0x7f0000000001 in function_1 /ros2/src/rclcpp/node.cpp:1',
+            '    #1 function_1 /ros2/src/rclcpp/node.cpp:1 ({module}+0x1)'.format(**locals()),
+            '    #2 0x7f0000000002 in inlined_function /ros2/src/rclcpp/inlined.hpp:7:3',
+            '    #3 0x7f0000000003 in function_f00 ({module}+0xf00)'.format(**locals()),
+            '    #4 function_f00 <null> ({module}+0xf00)'.format(**locals()),
+            '    #5 0x7f0000000004  ({module}+0xbad)'.format(**locals()),
+            '    #6 <null> <null> (libtsan.so.0+0x2bcfe)',
+            '    #7 0x7f0000000005 in main /ros2/src/main.cpp:3 ({module}+0x5)'.format(**locals()),
+        )
+    finally:
+        symbolizer.close()
+
+    # Modules that are not here, like libtsan.so.0, are never sent to the symbolizer.
+    assert fake_symbolizer.get_requests() == [
+        'start',
+        *('"{}" {}'.format(module, offset) for offset in ('0x1', '0x2', '0xf00', '0xbad')),
+    ]
+
+
+def test_symbolize_module_with_space_in_path(tmpdir, fake_symbolizer: _FakeSymbolizer) -> None:
+    tmpdir.ensure('ros2 install', 'lib', dir=True)
+    module = str(tmpdir.join('ros2 install', 'lib', 'librclcpp.so'))
+    fake_symbolizer.module_path.copy(tmpdir.join('ros2 install', 'lib', 'librclcpp.so'))
+    symbolizer = SanitizerSymbolizer(fake_symbolizer.command)
+    try:
+        lines = ('    #0 <null> <null> ({module}+0x1)'.format(**locals()),)
+        assert symbolizer.symbolize(lines) == \
+            ('    #0 function_1 /ros2/src/rclcpp/node.cpp:1 ({module}+0x1)'.format(**locals()),)
+    finally:
+        symbolizer.close()
+
+    assert fake_symbolizer.get_requests() == ['start', '"{}" 0x1'.format(module)]
+
+
+def test_each_address_is_resolved_once(fake_symbolizer: _FakeSymbolizer) -> None:
+    module = fake_symbolizer.module
+    symbolizer = SanitizerSymbolizer(fake_symbolizer.command)
+    try:
+        addresses = [(module, '0x{:x}'.format(offset)) for offset in range(1, 5000)]
+        symbolizer.resolve(addresses + addresses)
+        symbolizer.resolve(addresses[:10])
+        lines = tuple('    #0 <null> <null> ({}+{})'.format(*address) for address in addresses)
+        assert symbolizer.symbolize(lines)[-1] == \
+            '    #0 function_4999 /ros2/src/rclcpp/node.cpp:4999 ({}+0x1387)'.format(module)
+    finally:
+        symbolizer.close()
+
+    # All addresses were resolved in a single batch, by a single process.
+    assert fake_symbolizer.get_requests() == \
+        ['start', *('"{}" {}'.format(*address) for address in addresses)]
+
+
+def test_cache_is_used_until_module_changes(tmpdir, fake_symbolizer: _FakeSymbolizer) -> None:
+    cache_path = str(tmpdir.join('symbolizer_cache.jsonl'))
+    lines = ('    #0 <null> <null> ({}+0x1)'.format(fake_symbolizer.module),)
+
+    symbolizer = SanitizerSymbolizer(fake_symbolizer.command, cache_path=cache_path)
+    symbolized_lines = symbolizer.symbolize(lines)
+    symbolizer.close()
+    assert symbolized_lines != lines
+
+    # The symbolizer of the next run fails, so its resolutions come from the cache.
+    symbolizer = SanitizerSymbolizer((sys.executable, '-c', 'pass'), cache_path=cache_path)
+    assert symbolizer.symbolize(lines) == symbolized_lines
+    symbolizer.close()
+
+    fake_symbolizer.module_path.write('rebuilt module')
+    symbolizer = SanitizerSymbolizer((sys.executable, '-c', 'pass'), cache_path=cache_path)
+    assert symbolizer.symbolize(lines) == lines
+    symbolizer.close()
+
+
+def test_missing_symbolizer_leaves_frames(tmpdir, fake_symbolizer: _FakeSymbolizer) -> None:
+    lines = ('    #0 <null> <null> ({}+0x1)'.format(fake_symbolizer.module),)
+    symbolizer = SanitizerSymbolizer((str(tmpdir.join('missing-symbolizer')),))
+    assert symbolizer.symbolize(lines) == lines
+    symbolizer.close()
+
+
+def _get_section_lines(module: str, offset: int) -> List[str]:
+    return [
+        '==1==ERROR: AddressSanitizer: heap-use-after-free on address 0x602000000010 at pc '
+        '0x7f0000000001 bp 0x7ffe00000000 sp 0x7ffe00000008',
+        'READ of size 4 at 0x602000000010 thread T0',
+        '    #0 0x7f0000000001  ({module}+0x{offset:x})'.format(**locals()),
+        '    #1 0x7f0000000002  ({module}+0x100)'.format(**locals()),
+        '',
+        'SUMMARY: AddressSanitizer: heap-use-after-free',
+    ]
+
+
+def _get_records(parser: SanitizerLogParser) -> List[Tuple[str, int]]:
+    return [
+        (record.output_primary_key.stack_trace_key, record.count)
+        for record in parser.get_records()
+    ]
+
+
+@pytest.mark.parametrize('jobs', (1, 3))
+def test_parser_tells_apart_errors_by_symbolized_frames(
+        tmpdir, fake_symbolizer: _FakeSymbolizer, jobs: int
+) -> None:
+    log_path = tmpdir.join('stdout_stderr.log')
+    with open(str(log_path), 'w') as f_out:
+        for offset in (0x10, 0x20, 0x10, 0xbad, 0x20, 0x10):
+            f_out.write('\n'.join(_get_section_lines(fake_symbolizer.module, offset)) + '\n')
+
+    parser = SanitizerLogParser()
+    parser.set_package('package')
+    parser.parse_log_file(str(log_path))
+    unsymbolized_key = '0xX  ({}+0xX)'.format(fake_symbolizer.module)
+    assert _get_records(parser) == [(unsymbolized_key, 6)]
+
+    symbolizer = SanitizerSymbolizer(fake_symbolizer.command)
+    parser = SanitizerLogParser(symbolizer=symbolizer)
+    parser.set_package('package')
+    parser.parse_log_file(str(log_path), jobs=jobs, min_chunk_size=1)
+    records = _get_records(parser)
+    symbolizer.close()
+
+    # The top frame at offset 0xbad could not be symbolized, so it still makes the key.
+    assert records == [
+        (unsymbolized_key, 1),
+        ('function_16 /ros2/src/rclcpp/node.cpp:16', 3),
+        ('function_32 /ros2/src/rclcpp/node.cpp:32', 2),
+    ]
+    assert len(fake_symbolizer.get_requests()) == 1 + 4
@@ -0,0 +1,165 @@
+# Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from csv import DictReader
+import errno
+import os
+import threading
+from typing import List, Tuple
+
+from colcon_sanitizer_reports.watch import _Inotify, main, SanitizerLogWatcher, watch
+import pytest
+
+from . import get_input_log_path, parse_resources
+
+_RESOURCE_NAMES = (
+    'data_race_and_lock_order_inversion_interleaved_output',
+    'detected_memory_leaks_multiple_subsections_direct_and_indirect_leaks',
+    'segv',
+)
+
+
+def _read_resource_log(resource_name: str) -> bytes:
+    with open(get_input_log_path(resource_name), 'rb') as f_in:
+        return f_in.read()
+
+
+def _get_expected_records() -> List[Tuple]:
+    parser = parse_resources(*_RESOURCE_NAMES)
+    return [
+        (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+        for record in parser.get_records()
+    ]
+
+
+def _get_records(watcher: SanitizerLogWatcher) -> List[Tuple]:
+    return [
+        (record.output_primary_key, record.count, record.sample_stack_trace.lines)
+        for record in watcher.get_records()
+    ]
+
+
+def _append(log_dir, package: str, data: bytes) -> None:
+    package_dir = log_dir.join(package)
+    package_dir.ensure(dir=True)
+    with open(str(package_dir.join('stdout_stderr.log')), 'ab') as f_out:
+        f_out.write(data)
+
+
+def test_watcher_parses_logs_incrementally(tmpdir) -> None:
+    watcher = SanitizerLogWatcher(str(tmpdir))
+    assert not watcher.read_all()
+
+    # Logs grow in blocks that end anywhere within a line, for all packages at once.
+    logs = {resource_name: _read_resource_log(resource_name) for resource_name in _RESOURCE_NAMES}
+    for offset in range(0, max(len(log) for log in logs.values()), 997):
+        for resource_name, log in logs.items():
+            _append(tmpdir, resource_name, log[offset:offset + 997])
+        watcher.read_all()
+
+    assert not watcher.read_all()
+    assert _get_records(watcher) == _get_expected_records()
+
+
+def test_watcher_restarts_truncated_log(tmpdir) -> None:
+    watcher = SanitizerLogWatcher(str(tmpdir))
+    for resource_name in _RESOURCE_NAMES:
+        _append(tmpdir, resource_name, _read_resource_log(resource_name))
+        _append(tmpdir, resource_name, _read_resource_log(resource_name))
+    assert watcher.read_all()
+
+    for resource_name in _RESOURCE_NAMES:
+        tmpdir.join(resource_name, 'stdout_stderr.log').write_binary(
+            _read_resource_log(resource_name)
+        )
+    assert watcher.read_all()
+
+    assert _get_records(watcher) == _get_expected_records()
+
+
+class _StopWatching(Exception):
+    pass
+
+
+@pytest.mark.parametrize('use_inotify', (True, False))
+def test_watch_reports_changes(tmpdir, use_inotify: bool, log_path: str = '') -> None:
+    watcher = SanitizerLogWatcher(log_path or str(tmpdir))
+    expected_records = _get_expected_records()
+
+    def _on_change() -> None:
+        if _get_records(watcher) == expected_records:
+            raise _StopWatching()
+
+    def _write_logs() -> None:
+        for resource_name in _RESOURCE_NAMES:
+            _append(tmpdir, resource_name, _read_resource_log(resource_name))
+
+    writer_thread = threading.Timer(0.1, _write_logs)
+    writer_thread.start()
+    try:
+        with pytest.raises(_StopWatching):
+            watch(watcher, _on_change, interval=0.05, use_inotify=use_inotify)
+    finally:
+        writer_thread.join()
+
+
+def test_watch_reports_packages_of_log_path_with_trailing_separator(tmpdir) -> None:
+    test_watch_reports_changes(tmpdir, use_inotify=True, log_path=str(tmpdir) + os.sep)
+
+
+def test_watch_polls_packages_that_can_not_be_watched(tmpdir, monkeypatch) -> None:
+    add_watch = _Inotify.add_watch
+
+    def _add_watch(self, path: str, mask: int) -> None:
+        if path != str(tmpdir):
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC), path)
+        add_watch(self, path, mask)
+    monkeypatch.setattr(_Inotify, 'add_watch', _add_watch)
+
+    # Package directories exist before watching starts, so that their logs are only seen by polling.
+    for resource_name in _RESOURCE_NAMES:
+        tmpdir.ensure(resource_name, dir=True)
+    test_watch_reports_changes(tmpdir, use_inotify=True)
+
+
+def test_inotify_reports_log_writes(tmpdir) -> None:
+    try:
+        inotify = _Inotify()
+    except (AttributeError, OSError):
+        pytest.skip('inotify is not available')
+
+    try:
+        inotify.add_watch(str(tmpdir), 0x00000002)
+        _append(tmpdir, '', b'line\n')
+        assert list(inotify.read_events(5.0)) == [str(tmpdir.join('stdout_stderr.log'))]
+        assert list(inotify.read_events(0.0)) == []
+    finally:
+        inotify.close()
+
+
+def test_main_once(tmpdir) -> None:
+    log_dir = tmpdir.join('log')
+    for resource_name in _RESOURCE_NAMES:
+        _append(log_dir, resource_name, _read_resource_log(resource_name))
+    csv_path = str(tmpdir.join('sanitizer_report.csv'))
+
+    assert main(['--once', '--csv', csv_path, str(log_dir)]) == 0
+
+    with open(csv_path, 'r') as f_in:
+        assert len(list(DictReader(f_in))) == len(_get_expected_records())
+    assert not os.path.exists(str(tmpdir.join('.tmp.sanitizer_report.csv')))
+
+
+def test_main_requires_output(tmpdir) -> None:
+    assert main([str(tmpdir)]) == 1
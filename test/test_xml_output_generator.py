@@ -12,13 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from io import StringIO
 from typing import Dict
+import xml.etree.cElementTree as eTree
 
 from colcon_sanitizer_reports._sanitizer_section_part_stack_trace import (
     SanitizerSectionPartStackTrace
 )
-from colcon_sanitizer_reports.sanitizer_log_parser import SanitizerLogParserOutputPrimaryKey
-from colcon_sanitizer_reports.xml_output_generator import XmlOutputGenerator
+from colcon_sanitizer_reports.sanitizer_log_parser import (
+    SanitizerLogParserOutputPrimaryKey, SanitizerReportRecord
+)
+from colcon_sanitizer_reports.xml_output_generator import write_xml_report, XmlOutputGenerator
 
 _ERROR_MAP = {
     SanitizerLogParserOutputPrimaryKey('package1', 'data-race', 'key1',): 1,
@@ -76,3 +80,26 @@ def test_xml_tree_structure():
 def test_xml_string_encoding():
     string = XmlOutputGenerator(_ERROR_MAP, _STACK_TRACE_MAP).xml_string
     assert isinstance(string, str)
+
+
+def test_write_xml_report():
+    records = [
+        SanitizerReportRecord(key, _ERROR_MAP[key], _STACK_TRACE_MAP[key])
+        for key in sorted(_ERROR_MAP.keys())
+    ]
+    xml_f_out = StringIO()
+    write_xml_report(records, xml_f_out)
+    tree = eTree.fromstring(xml_f_out.getvalue())
+
+    assert tree.get('tests') == '3'
+    errors_by_package = {
+        testcase.get('name'): testcase.findall('error') for testcase in tree.findall('testcase')
+    }
+    assert len(errors_by_package['package1']) == 2
+    assert errors_by_package['package1'][0].get('key') == 'key1'
+    assert errors_by_package['package1'][0].text == '  #1 0x7f in key1 /ros2'
+    assert [error.get('count') for error in errors_by_package['package3']] == ['4']
+
+    xml_f_out = StringIO()
+    write_xml_report([], xml_f_out)
+    assert eTree.fromstring(xml_f_out.getvalue()).get('tests') == '0'